@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Выборочное профилирование запросов (см. PROFILING_*); при выключенном профилировании не используется
+    'object_detection.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +86,32 @@ DATABASES = {
     }
 }
 
+# PRAGMA, применяемые к каждому соединению SQLite (см. object_detection/db.py).
+# WAL позволяет читать во время записи, busy_timeout заставляет ждать блокировку вместо ошибки
+# "database is locked", synchronous=NORMAL в режиме WAL не теряет целостность и сокращает число fsync.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 20000,  # миллисекунды
+    'synchronous': 'NORMAL',
+}
+
+# Пакетная запись результатов обнаружения (object_detection.db.detection_writer)
+DETECTION_WRITER_MAX_BATCH = 64  # Максимум заданий на запись в одной транзакции
+DETECTION_WRITER_MAX_DELAY = 0  # Сколько секунд ждать дополнительные задания перед фиксацией (0 - не ждать)
+
+
+# Кэш для сводок обнаруженных объектов и фрагментов панели управления (см. object_detection/caching.py).
+# При нескольких процессах веб-сервера можно использовать общий файловый кэш:
+# 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'object-detection',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+DASHBOARD_CACHE_TIMEOUT = 24 * 60 * 60  # Время жизни записей кэша панели управления в секундах
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -156,6 +184,62 @@ LOGOUT_URL = '/object_detection/logout/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Отдача медиафайлов (см. object_detection/media_serving.py)
+MEDIA_SERVE = True  # Отдавать MEDIA_URL через Django; False, если фронтенд-сервер сам отдаёт MEDIA_ROOT
+MEDIA_SENDFILE_BACKEND = None  # None, 'x-accel-redirect' (nginx) или 'x-sendfile' (Apache mod_xsendfile)
+MEDIA_X_ACCEL_PREFIX = '/protected-media/'  # internal-location nginx, указывающий на MEDIA_ROOT
+MEDIA_CACHE_CONTROL = 'no-cache'  # Файлы без хэша в имени: браузер проверяет их по ETag при каждом показе
+MEDIA_IMMUTABLE_MAX_AGE = 31536000  # Срок кэширования файлов с хэшем содержимого в имени (секунды)
+
+# Загрузка изображений (см. object_detection/uploads.py): файлы пишутся на диск блоками с ограничением размера
+FILE_UPLOAD_HANDLERS = ['object_detection.uploads.LimitedTemporaryFileUploadHandler']
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024  # Максимальный размер загружаемого файла
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000  # Максимальное количество пикселей (проверяется по заголовку до декодирования)
+IMAGE_WORKING_MAX_DIMENSION = 1333  # Большая сторона рабочей копии, по которой выполняется обработка
+IMAGE_WORKING_JPEG_QUALITY = 90  # Качество JPEG рабочей копии
+
+# Повторное использование результатов почти одинаковых изображений (см. object_detection/near_duplicates.py)
+NEAR_DUPLICATE_MAX_DISTANCE = 6  # Максимальное расстояние Хэмминга между 64-битными перцептивными хэшами (-1 - отключить)
+NEAR_DUPLICATE_INDEX_CHUNKS = 3  # Количество частей хэша в индексе (ширина части около log2 числа изображений)
+
+# Память при обработке изображений (см. object_detection/memory.py)
+INFERENCE_MEMORY_BUDGET = True  # Ограничивать размер входа моделей и возвращать память системе после обработки
+INFERENCE_MAX_INPUT_SIZE = {'detr_resnet50': 800}  # Большая сторона входа модели (вход MobileNet SSD всегда 300x300)
+INFERENCE_MEMORY_WARNING_MB = 1500  # Предупреждение в журнале, если пиковый RSS обработки выше
+MEMORY_TRACKING = True  # Записывать потребление памяти каждой обработки в InferenceMemoryRecord
+MEMORY_TRACEMALLOC = False  # Дополнительно отслеживать Python-аллокации (tracemalloc замедляет обработку)
+
+# Полный вывод моделей для выбора обнаружений по порогу без повторной обработки (см. object_detection/raw_detections.py)
+RAW_DETECTIONS_MIN_SCORE = 0.0  # Кандидаты с уверенностью не выше этой не сохраняются (0.0 - все 100 кандидатов)
+
+# Однократное выполнение одинаковых обработок (см. object_detection/singleflight.py)
+PROCESSING_LEASE_TIMEOUT = 600  # Аренда ключа обработки в кэше (секунды), верхняя граница длительности обработки
+PROCESSING_LEASE_POLL_INTERVAL = 0.2  # Интервал проверки обработки, выполняющейся в другом процессе (секунды)
+
+# Совместная обработка изображения обеими моделями (см. utils.process_image_multi_model)
+MULTI_MODEL_WORKERS = None  # Потоки инференса в процессе (None - по одному на модель)
+
+# Планировщик заданий обработки (см. object_detection/scheduling.py)
+SCHEDULER_RATE = 10 / 60  # Пополнение корзины токенов пользователя (заданий в секунду)
+SCHEDULER_BURST = 5  # Ёмкость корзины: сколько заданий пользователь может отправить подряд без ожидания
+SCHEDULER_MAX_DEFER = 60  # Задание, которое по лимиту скорости пришлось бы отложить дольше (секунды), отклоняется
+SCHEDULER_MAX_QUEUE_DEPTH = 200  # Количество заданий в очереди, при котором новые задания отклоняются
+SCHEDULER_MAX_USER_QUEUE_DEPTH = 20  # То же для заданий одного пользователя
+SCHEDULER_MAX_WAIT = 300  # Оценка ожидания начала обработки (секунды), при превышении которой задание отклоняется
+SCHEDULER_WORKERS = 2  # Количество воркеров Celery, выполняющих задания (для оценки ожидания)
+SCHEDULER_DISPATCH = 'celery'  # 'celery' - задания выполняют воркеры; 'inline' - сразу в процессе, отправившем задание
+SCHEDULER_USER_WEIGHTS = {}  # Веса пользователей в справедливой очереди по имени пользователя (по умолчанию 1)
+SCHEDULER_DEFAULT_COSTS = {'ssd': 0.5, 'detr': 3.0, 'multi': 3.0}  # Длительность заданий (секунды) до накопления истории
+SCHEDULER_COST_WINDOW = 20  # Количество последних выполненных заданий для оценки длительности
+SCHEDULER_METRICS_WINDOW = 3600  # Окно метрик ожидания (секунды)
+SCHEDULER_JOB_RETENTION = 7 * 24 * 3600  # Время хранения завершённых заданий (секунды)
+
+# Пространственный индекс обнаруженных объектов (см. object_detection/spatial.py)
+SPATIAL_GRID_SIZE = 8  # Ячеек сетки по каждой стороне кадра; после изменения - python manage.py rebuild_spatial_index
+
+# Выгрузка обнаруженных объектов (см. object_detection/exports.py)
+EXPORT_CHUNK_SIZE = 2000  # Количество строк, читаемых из базы данных и отдаваемых клиенту одним блоком
+
 # Настройки Celery
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -163,3 +247,63 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Воркер prefork, RSS которого после задачи превысил лимит (в КБ), заменяется новым процессом:
+# пик памяти на большом изображении не накапливается в долгоживущих воркерах
+CELERY_WORKER_MAX_MEMORY_PER_CHILD = 2_000_000
+# Воркер берёт из очереди по одной задаче: всплеск больших изображений распределяется между воркерами
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Периодические задачи Celery Beat
+CELERY_BEAT_SCHEDULE = {
+    # Удаление файлов изображений, на которые не ссылается ни одна запись ImageFeed
+    'sweep-orphaned-media': {
+        'task': 'object_detection.tasks.sweep_orphaned_media_task',
+        'schedule': 3600.0,
+    },
+    # Выдача заданий обработки, оставшихся в очереди после сбоев брокера
+    'dispatch-inference-jobs': {
+        'task': 'object_detection.tasks.dispatch_inference_task',
+        'schedule': 30.0,
+    },
+    # Удаление старых завершённых заданий обработки
+    'purge-inference-jobs': {
+        'task': 'object_detection.tasks.purge_inference_jobs_task',
+        'schedule': 3600.0,
+    },
+}
+
+# Удаление изображений
+IMAGE_FEED_DELETE_BATCH_SIZE = 500  # Количество записей ImageFeed, удаляемых в одной транзакции
+MEDIA_SWEEP_GRACE_SECONDS = 3600  # Файлы моложе этого возраста (в секундах) не считаются сиротами
+
+# Бюджет холодного запуска Django (management-команда check_startup_budget)
+STARTUP_TIME_BUDGET = 2.0  # Секунды на django.setup() и загрузку URLconf
+STARTUP_MEMORY_BUDGET_MB = 150  # Пиковая память процесса при запуске
+STARTUP_FORBIDDEN_MODULES = ['torch', 'transformers', 'cv2']  # Библиотеки, которые должны загружаться только при обработке
+
+# Локальное хранилище артефактов моделей (см. object_detection/model_store.py).
+# Модели загружаются только отсюда, без обращения к сети. Установка: python manage.py install_model_artifacts
+MODEL_STORE_ROOT = BASE_DIR / 'models'
+MODEL_ARTIFACTS = {
+    'mobilenet_ssd': {
+        # Порядок файлов: описание сети (prototxt), затем веса (caffemodel)
+        'files': ['mobilenet_ssd_deploy.prototxt', 'mobilenet_iter_73000.caffemodel'],
+        'source': BASE_DIR / 'object_detection',
+    },
+    'detr_resnet50': {
+        'repo_id': 'facebook/detr-resnet-50',
+        # Ветка разрешается в коммит при установке; для полной воспроизводимости укажите хэш коммита
+        'revision': 'no_timm',
+        'files': ['config.json', 'preprocessor_config.json', 'model.safetensors'],
+        # 'sha256': {'model.safetensors': '...'},  # Необязательные закреплённые контрольные суммы
+    },
+}
+MODEL_STORE_VERIFY_CHECKSUMS = True  # Проверять SHA-256 файлов моделей при первой загрузке в процессе
+MODEL_STORE_MMAP = True  # Отображать веса safetensors в память вместо копирования
+
+# Выборочное профилирование запросов и задач Celery (см. object_detection/profiling.py)
+PROFILING_SAMPLE_RATE = 0.0  # Доля профилируемых запросов и задач (0 - выборка выключена)
+PROFILING_SLOW_THRESHOLD = None  # Сохранять профиль любого запроса или задачи дольше стольких секунд (None - выключено)
+PROFILING_INTERVAL = 0.005  # Интервал снятия стеков в секундах
+PROFILING_DIR = BASE_DIR / 'profiles'  # Каталог хранилища профилей
+PROFILING_MAX_FILES = 200  # Количество хранимых профилей (самые старые удаляются)
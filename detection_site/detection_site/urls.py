@@ -18,7 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import RedirectView
 from django.conf import settings
-from django.conf.urls.static import static
+from object_detection.media_serving import serve_media
 # from detection_site.object_detection.views import password_reset, password_reset_done, password_reset_confirm, password_reset_complete
 
 
@@ -26,4 +26,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('object_detection/', include('object_detection.urls')),
     path('', RedirectView.as_view(url='/object_detection/', permanent=True)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# Медиафайлы с ETag, Last-Modified, Range и Cache-Control (см. object_detection/media_serving.py).
+# Если фронтенд-сервер сам отдаёт MEDIA_ROOT по MEDIA_URL, маршрут отключается настройкой MEDIA_SERVE
+if getattr(settings, 'MEDIA_SERVE', True):
+    urlpatterns.append(path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name='media'))
@@ -1,6 +1,60 @@
 from django.contrib import admin
-from .models import ImageFeed, DetectedObject
+from .models import ImageFeed, DetectedObject, InferenceJob, InferenceMemoryRecord, RawDetections
 
-# Регистрация моделей для отображения в административной панели Django
-admin.site.register(ImageFeed)
-admin.site.register(DetectedObject)
+
+@admin.register(ImageFeed)
+class ImageFeedAdmin(admin.ModelAdmin):
+    """
+    Административная панель для ImageFeed с массовым удалением записей.
+
+    Удаление выполняется через `ImageFeedQuerySet.delete()`: записи удаляются пакетами,
+    а файлы изображений передаются фоновой задаче.
+    """
+    list_display = ('id', 'user', 'image', 'processed_image')
+    list_filter = ('user',)
+    actions = ['bulk_delete_feeds']
+
+    @admin.action(description='Удалить выбранные изображения пакетами (файлы удаляются в фоне)')
+    def bulk_delete_feeds(self, request, queryset):
+        """Удаляет выбранные записи ImageFeed пакетами вместе с их файлами."""
+        _deleted, per_model = queryset.delete()
+        feeds = per_model.get(ImageFeed._meta.label, 0)
+        self.message_user(request, f'Удалено изображений: {feeds}.')
+
+
+@admin.register(DetectedObject)
+class DetectedObjectAdmin(admin.ModelAdmin):
+    """
+    Административная панель обнаруженных объектов.
+
+    Стандартные действия удаления вызывают `DetectedObject.delete()` и `DetectedObjectQuerySet.delete()`,
+    которые вычитают объекты из сводной статистики DetectionStat в той же транзакции.
+    """
+    list_display = ('id', 'image_feed', 'object_type', 'model_name', 'confidence', 'created_at')
+    list_filter = ('model_name', 'object_type')
+
+
+@admin.register(InferenceMemoryRecord)
+class InferenceMemoryRecordAdmin(admin.ModelAdmin):
+    """Административная панель замеров памяти обработки: самые затратные обработки - сверху."""
+    list_display = ('created_at', 'name', 'image_feed', 'seconds', 'rss_before_mb', 'rss_after_mb', 'peak_rss_mb',
+                    'tracemalloc_peak_mb')
+    list_filter = ('name',)
+    ordering = ('-peak_rss_mb',)
+
+
+@admin.register(RawDetections)
+class RawDetectionsAdmin(admin.ModelAdmin):
+    """Административная панель полного вывода моделей (без содержимого массива кандидатов)."""
+    list_display = ('created_at', 'image_feed', 'model_name', 'count', 'min_score')
+    list_filter = ('model_name',)
+    exclude = ('data',)
+
+
+@admin.register(InferenceJob)
+class InferenceJobAdmin(admin.ModelAdmin):
+    """Административная панель очереди заданий обработки: новые задания - сверху."""
+    list_display = ('created_at', 'user', 'image_feed', 'kind', 'status', 'cost', 'finish_tag', 'not_before',
+                    'started_at', 'finished_at', 'error')
+    list_filter = ('status', 'kind', 'user')
+    ordering = ('-created_at',)
@@ -15,3 +15,15 @@ class ObjectDetectionConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'object_detection'
+
+    def ready(self):
+        """
+        Подключает настройку PRAGMA для каждого нового соединения SQLite
+        и, если профилирование включено, профилирование задач Celery.
+        """
+        from django.db.backends.signals import connection_created
+        from .db import configure_sqlite_connection
+        from .profiling import connect_celery_signals
+
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='object_detection_sqlite_pragmas')
+        connect_celery_signals()
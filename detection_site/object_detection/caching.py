@@ -0,0 +1,141 @@
+"""
+Кэширование результатов обнаружения и фрагментов панели управления.
+
+Описание работы модуля:
+    1. Ключи кэша включают идентификатор ImageFeed и его версию (`ImageFeed.version`).
+    Функции обработки изображений увеличивают версию через bump_feed_version(), поэтому после повторной обработки
+    старые записи кэша просто перестают использоваться, а остальные изображения не пересчитываются.
+    2. get_detection_summaries(feeds):
+        - Возвращает сводки обнаруженных объектов для изображений. Отсутствующие в кэше сводки
+        загружаются из базы данных одним запросом.
+    3. render_feed_cards(feeds):
+        - Возвращает HTML-фрагменты карточек панели управления (изображения и список объектов).
+        Пересчитываются только карточки изображений, версия которых изменилась.
+    4. cache_stats():
+        - Счётчики попаданий и промахов кэша по видам записей.
+
+Используется кэш Django по умолчанию (см. CACHES в settings.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.template.loader import render_to_string
+
+from .models import ImageFeed, DetectedObject
+
+KEY_PREFIX = 'object_detection'
+# Виды кэшируемых записей, для которых ведутся счётчики попаданий
+CACHE_KINDS = ('detections', 'card')
+
+
+def _timeout():
+    """Время жизни записей кэша в секундах."""
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def _key(kind, feed):
+    """Ключ кэша записи вида `kind` для текущей версии изображения."""
+    return f'{KEY_PREFIX}:{kind}:{feed.pk}:v{feed.version}'
+
+
+def bump_feed_version(image_feed):
+    """
+    Увеличивает версию изображения после изменения его результатов обработки.
+
+    Вызывается функциями обработки после записи DetectedObject и обработанного изображения.
+
+    :param image_feed: Запись ImageFeed, результаты которой изменились.
+    :type image_feed: ImageFeed
+    """
+    ImageFeed.objects.filter(pk=image_feed.pk).update(version=F('version') + 1)
+    image_feed.refresh_from_db(fields=['version'])
+
+
+def _record(kind, hits, misses):
+    """Увеличивает счётчики попаданий и промахов кэша."""
+    for outcome, delta in (('hits', hits), ('misses', misses)):
+        if not delta:
+            continue
+        key = f'{KEY_PREFIX}:stats:{kind}:{outcome}'
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Счётчик был вытеснен из кэша между add() и incr()
+            cache.set(key, delta, timeout=None)
+
+
+def get_detection_summaries(feeds):
+    """
+    Возвращает сводки обнаруженных объектов для изображений.
+
+    :param feeds: Записи ImageFeed.
+    :type feeds: list
+    :return: Словарь {id изображения: [{'object_type': str, 'confidence': float}, ...]}.
+    :rtype: dict
+    """
+    keys = {_key('detections', feed): feed for feed in feeds}
+    cached = cache.get_many(keys)
+    summaries = {keys[key].pk: value for key, value in cached.items()}
+
+    missing = [feed for key, feed in keys.items() if key not in cached]
+    if missing:
+        loaded = {feed.pk: [] for feed in missing}
+        rows = (DetectedObject.objects.filter(image_feed_id__in=loaded)
+                .order_by('image_feed_id', 'id').values_list('image_feed_id', 'object_type', 'confidence'))
+        for feed_id, object_type, confidence in rows:
+            loaded[feed_id].append({'object_type': object_type, 'confidence': confidence})
+        cache.set_many({_key('detections', feed): loaded[feed.pk] for feed in missing}, _timeout())
+        summaries.update(loaded)
+
+    _record('detections', len(cached), len(missing))
+    return summaries
+
+
+def render_feed_cards(feeds):
+    """
+    Возвращает HTML-фрагменты тел карточек панели управления.
+
+    Фрагмент не содержит CSRF-токена и данных текущего пользователя, поэтому один и тот же фрагмент
+    используется для всех пользователей.
+
+    :param feeds: Записи ImageFeed.
+    :type feeds: list
+    :return: Словарь {id изображения: HTML-фрагмент}.
+    :rtype: dict
+    """
+    keys = {_key('card', feed): feed for feed in feeds}
+    cached = cache.get_many(keys)
+    cards = {keys[key].pk: value for key, value in cached.items()}
+
+    missing = [feed for key, feed in keys.items() if key not in cached]
+    if missing:
+        summaries = get_detection_summaries(missing)
+        rendered = {}
+        for feed in missing:
+            html = render_to_string('object_detection/feed_card_body.html',
+                                    {'feed': feed, 'detections': summaries[feed.pk]})
+            rendered[_key('card', feed)] = html
+            cards[feed.pk] = html
+        cache.set_many(rendered, _timeout())
+
+    _record('card', len(cached), len(missing))
+    return cards
+
+
+def cache_stats():
+    """
+    Возвращает счётчики попаданий и промахов кэша.
+
+    :return: Словарь {вид записи: {'hits': int, 'misses': int, 'hit_ratio': float}}.
+    :rtype: dict
+    """
+    keys = [f'{KEY_PREFIX}:stats:{kind}:{outcome}' for kind in CACHE_KINDS for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for kind in CACHE_KINDS:
+        hits = values.get(f'{KEY_PREFIX}:stats:{kind}:hits', 0)
+        misses = values.get(f'{KEY_PREFIX}:stats:{kind}:misses', 0)
+        total = hits + misses
+        stats[kind] = {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+    return stats
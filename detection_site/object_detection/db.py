@@ -0,0 +1,145 @@
+"""
+Настройка SQLite для конкурентной записи и пакетная запись результатов обнаружения.
+
+Описание работы модуля:
+    1. configure_sqlite_connection:
+        - Обработчик сигнала `connection_created`. Применяет к каждому новому соединению SQLite
+        PRAGMA из настройки SQLITE_PRAGMAS (журнал WAL, busy_timeout, уровень synchronous).
+    2. BatchedWriter:
+        - Единственный поток-писатель в процессе. Задания на запись от параллельных обработчиков ставятся в очередь,
+        а писатель объединяет их в одну транзакцию. Вместо десятков коротких транзакций, конкурирующих
+        за блокировку базы данных, выполняется одна транзакция на пакет заданий.
+    3. detection_writer:
+        - Общий экземпляр BatchedWriter, через который функции обработки записывают DetectedObject.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Применяет PRAGMA из SQLITE_PRAGMAS к новому соединению SQLite.
+
+    :param sender: Класс обёртки соединения.
+    :param connection: Созданное соединение с базой данных.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class _WriteJob:
+    """Задание на запись: функция, выполняемая писателем, и результат её выполнения."""
+
+    def __init__(self, func):
+        self.func = func
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchedWriter:
+    """
+    Поток-писатель, объединяющий задания на запись в пакетные транзакции.
+
+    Каждое задание выполняется в собственной точке сохранения (savepoint) внутри общей транзакции пакета,
+    поэтому ошибка в одном задании откатывает только его.
+
+    Attributes:
+        max_batch (int): Максимальное количество заданий в одной транзакции.
+        max_delay (float): Сколько секунд писатель ждёт дополнительные задания перед фиксацией пакета.
+    """
+
+    def __init__(self, max_batch=None, max_delay=None):
+        self.max_batch = max_batch or getattr(settings, 'DETECTION_WRITER_MAX_BATCH', 64)
+        self.max_delay = max_delay if max_delay is not None else getattr(settings, 'DETECTION_WRITER_MAX_DELAY', 0)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def run(self, func, timeout=None):
+        """
+        Выполняет функцию записи в потоке-писателе и возвращает её результат.
+
+        Если вызывающий код уже находится внутри транзакции или база данных не SQLite, функция
+        выполняется сразу в текущем потоке, чтобы запись осталась частью транзакции вызывающего кода.
+
+        :param func: Функция без аргументов, выполняющая запись через ORM.
+        :type func: callable
+        :param timeout: Максимальное время ожидания выполнения в секундах.
+        :type timeout: float
+        :return: Результат выполнения func.
+        :raises Exception: Исключение, возникшее при выполнении func.
+        """
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            return func()
+
+        job = _WriteJob(func)
+        self._ensure_started().put(job)
+        if not job.done.wait(timeout):
+            raise TimeoutError('Detection writer did not complete the write in time')
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _ensure_started(self):
+        """Запускает поток-писатель при первом обращении, в том числе заново после fork() воркера Celery."""
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._loop, args=(self._queue,),
+                                                name='detection-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            return self._queue
+
+    def _loop(self, jobs):
+        """Основной цикл писателя: собирает пакет заданий и выполняет его в одной транзакции."""
+        while True:
+            batch = [jobs.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                # Задания, накопившиеся во время предыдущей фиксации, забираются без ожидания
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(jobs.get(timeout=remaining) if remaining > 0 else jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch):
+        """Выполняет пакет заданий в одной транзакции, каждое задание - в своей точке сохранения."""
+        close_old_connections()
+        try:
+            with transaction.atomic():
+                for job in batch:
+                    try:
+                        with transaction.atomic():
+                            job.result = job.func()
+                    except Exception as e:
+                        job.error = e
+        except Exception as e:
+            # Ошибка фиксации транзакции: ни одно задание пакета не записано
+            logger.error(f"Detection writer failed to commit a batch of {len(batch)} jobs: {e}")
+            connection.close()
+            for job in batch:
+                job.error = job.error or e
+        finally:
+            for job in batch:
+                job.done.set()
+
+
+# Общий писатель для результатов обнаружения объектов
+detection_writer = BatchedWriter()
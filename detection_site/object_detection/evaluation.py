@@ -0,0 +1,348 @@
+"""
+Оценка моделей обнаружения объектов на размеченном наборе данных (management-команда evaluate_models).
+
+Описание работы модуля:
+    1. load_dataset(path, annotations=None):
+        - Загружает изображения и эталонную разметку в формате PASCAL VOC (XML-файлы в каталоге Annotations
+        или рядом с изображениями) или COCO (JSON-файл с разделами images, annotations и categories).
+        Объекты VOC с флагом difficult и объекты COCO с флагом iscrowd не учитываются ни как пропуски,
+        ни как ложные срабатывания.
+    2. canonical_label(label):
+        - Приводит метки VOC и COCO к общему виду: MobileNet SSD обучена на классах VOC ('aeroplane', 'sofa'),
+        DETR - на классах COCO ('airplane', 'couch'), и для сравнения одинаковые классы должны совпадать.
+    3. run_model(model_name, samples, workers, min_score):
+        - Запускает инференс модели (detect_mobilenet_ssd / detect_detr из utils.py) параллельно в нескольких
+        процессах и измеряет время обработки каждого изображения и общее время.
+    4. evaluate(samples, predictions, iou_threshold):
+        - Сопоставляет обнаружения с эталонной разметкой (IoU не ниже порога, по убыванию уверенности) и считает
+        AP каждого класса (интерполяция по всем точкам, как в PASCAL VOC 2010+), а также точность и полноту
+        при любом пороге уверенности: результаты инференса с низким порогом min_score позволяют сравнить
+        пороги без повторного запуска моделей.
+"""
+import json
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+
+from .models import DetectedObject
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Классы COCO, которые называются в VOC иначе
+COCO_TO_VOC = {
+    'airplane': 'aeroplane',
+    'motorcycle': 'motorbike',
+    'dining table': 'diningtable',
+    'potted plant': 'pottedplant',
+    'couch': 'sofa',
+    'tv': 'tvmonitor',
+}
+
+
+def canonical_label(label):
+    """
+    Приводит метку класса VOC или COCO к общему виду (названия VOC для общих классов).
+
+    :param label: Метка класса.
+    :type label: str
+    :rtype: str
+    """
+    label = label.strip().lower()
+    return COCO_TO_VOC.get(label, label)
+
+
+def model_labels(model_name):
+    """
+    Возвращает множество классов, которые распознаёт модель (в общем виде canonical_label).
+
+    :param model_name: Модель (DetectedObject.MODEL_*).
+    :type model_name: str
+    :rtype: set
+    """
+    if model_name == DetectedObject.MODEL_MOBILENET_SSD:
+        from .utils import VOC_LABELS
+        return {canonical_label(label) for label in VOC_LABELS[1:]}
+    from .model_store import artifact_dir
+    with open(artifact_dir('detr_resnet50') / 'config.json', encoding='utf-8') as f:
+        id2label = json.load(f).get('id2label', {})
+    return {canonical_label(label) for label in id2label.values() if label != 'N/A'}
+
+
+def _find_image(directories, file_name):
+    for directory in directories:
+        path = Path(directory) / file_name
+        if path.is_file():
+            return path
+    return None
+
+
+def _load_voc(xml_files, image_dirs):
+    samples = []
+    for xml_file in sorted(xml_files):
+        root = ElementTree.parse(xml_file).getroot()
+        file_name = root.findtext('filename') or ''
+        path = _find_image(image_dirs + [xml_file.parent], file_name)
+        if path is None:
+            # Имя файла в разметке может не совпадать с фактическим расширением
+            path = next((candidate for candidate in (
+                _find_image(image_dirs + [xml_file.parent], xml_file.stem + extension)
+                for extension in IMAGE_EXTENSIONS) if candidate), None)
+        if path is None:
+            continue
+        objects = []
+        for obj in root.iter('object'):
+            box = obj.find('bndbox')
+            objects.append({
+                'label': canonical_label(obj.findtext('name', '')),
+                'box': tuple(float(box.findtext(key)) for key in ('xmin', 'ymin', 'xmax', 'ymax')),
+                'ignore': obj.findtext('difficult', '0').strip() == '1',
+            })
+        samples.append({'id': xml_file.stem, 'path': str(path), 'objects': objects})
+    return samples
+
+
+def _load_coco(annotations_file, image_dirs):
+    with open(annotations_file, encoding='utf-8') as f:
+        data = json.load(f)
+    categories = {category['id']: canonical_label(category['name']) for category in data.get('categories', [])}
+    objects = {}
+    for annotation in data.get('annotations', []):
+        x, y, w, h = annotation['bbox']
+        objects.setdefault(annotation['image_id'], []).append({
+            'label': categories[annotation['category_id']],
+            'box': (x, y, x + w, y + h),
+            'ignore': bool(annotation.get('iscrowd', 0)),
+        })
+    samples = []
+    for image in data.get('images', []):
+        path = _find_image(image_dirs, image['file_name'])
+        if path is not None:
+            samples.append({'id': image['id'], 'path': str(path), 'objects': objects.get(image['id'], [])})
+    return samples
+
+
+def load_dataset(path, annotations=None):
+    """
+    Загружает набор данных с эталонной разметкой в формате VOC или COCO.
+
+    Формат определяется автоматически:
+        - annotations (или path) - JSON-файл: COCO, изображения ищутся в path, path/images и каталоге JSON-файла;
+        - в path есть каталог Annotations: VOC, изображения в path/JPEGImages;
+        - в path есть XML-файлы: VOC, изображения рядом с ними.
+
+    :param path: Каталог набора данных или JSON-файл COCO.
+    :type path: str
+    :param annotations: JSON-файл COCO, если он не в path.
+    :type annotations: str
+    :return: Список словарей {'id', 'path', 'objects': [{'label', 'box', 'ignore'}]}.
+    :rtype: list
+    :raises ValueError: Если формат набора данных не распознан.
+    """
+    path = Path(path)
+    if annotations is None and path.suffix.lower() == '.json':
+        annotations, path = path, path.parent
+    if annotations is not None:
+        annotations = Path(annotations)
+        return _load_coco(annotations, [path, path / 'images', annotations.parent])
+    if (path / 'Annotations').is_dir():
+        return _load_voc(list((path / 'Annotations').glob('*.xml')), [path / 'JPEGImages'])
+    xml_files = list(path.glob('*.xml'))
+    if xml_files:
+        return _load_voc(xml_files, [path])
+    coco_files = sorted(path.glob('*.json')) + sorted(path.glob('annotations/*.json'))
+    if coco_files:
+        return _load_coco(coco_files[0], [path, path / 'images'])
+    raise ValueError(f"No VOC or COCO annotations found in {path}")
+
+
+def _init_worker(model_name, threads):
+    """Инициализация процесса оценки: потоки библиотек и загрузка модели до первого замера времени."""
+    import cv2
+
+    cv2.setNumThreads(threads)
+    if model_name == DetectedObject.MODEL_DETR:
+        import torch
+
+        from .model_store import get_detr
+        torch.set_num_threads(threads)
+        get_detr()
+    else:
+        from .model_store import get_mobilenet_ssd
+        get_mobilenet_ssd()
+
+
+def _detect(model_name, path, min_score):
+    """Обнаруживает объекты на одном изображении. Возвращает (секунды, [(метка, уверенность, рамка)])."""
+    import cv2
+    from PIL import Image
+
+    from .utils import detect_detr, detect_mobilenet_ssd
+
+    start = time.perf_counter()
+    if model_name == DetectedObject.MODEL_DETR:
+        with Image.open(path) as image:
+            candidates = detect_detr(image.convert('RGB'), threshold=min_score)
+    else:
+        img = cv2.imread(path)
+        candidates = detect_mobilenet_ssd(img, threshold=min_score) if img is not None else []
+    seconds = time.perf_counter() - start
+    return seconds, [(label, float(score), tuple(float(v) for v in box)) for label, score, box in candidates]
+
+
+def _detect_task(args):
+    return _detect(*args)
+
+
+def run_model(model_name, samples, workers=None, min_score=0.05):
+    """
+    Выполняет инференс модели на всех изображениях набора данных в нескольких процессах.
+
+    Каждый процесс загружает модель до начала замеров и использует cpu_count // workers потоков библиотек
+    инференса, чтобы процессы не конкурировали за ядра.
+
+    :param model_name: Модель (DetectedObject.MODEL_*).
+    :type model_name: str
+    :param samples: Изображения набора данных (см. load_dataset).
+    :type samples: list
+    :param workers: Количество процессов; по умолчанию - количество ядер.
+    :type workers: int
+    :param min_score: Минимальная уверенность сохраняемых обнаружений.
+    :type min_score: float
+    :return: Кортеж (обнаружения по идентификаторам изображений, время обработки каждого изображения,
+        общее время в секундах).
+    :rtype: tuple
+    :raises ModelStoreError: Если артефакт модели отсутствует или повреждён.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from django.db import connections
+
+    from .model_store import verify_artifact
+
+    # Отсутствующий артефакт модели обнаруживается до запуска процессов (ModelStoreError)
+    verify_artifact('detr_resnet50' if model_name == DetectedObject.MODEL_DETR else 'mobilenet_ssd')
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(samples) or 1))
+    threads = max(1, cpus // workers)
+    # Соединения с базой данных не должны наследоваться процессами оценки
+    connections.close_all()
+    predictions, latencies = {}, []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, threads)) as executor:
+        start = time.perf_counter()
+        tasks = [(model_name, sample['path'], min_score) for sample in samples]
+        for sample, (seconds, candidates) in zip(samples, executor.map(_detect_task, tasks)):
+            latencies.append(seconds)
+            predictions[sample['id']] = [(canonical_label(label), score, box) for label, score, box in candidates]
+        elapsed = time.perf_counter() - start
+    return predictions, latencies, elapsed
+
+
+def _iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def _average_precision(recall, precision):
+    """AP с интерполяцией по всем точкам (PASCAL VOC 2010+)."""
+    import numpy as np
+
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([0.0], precision, [0.0]))
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    changes = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[changes + 1] - recall[changes]) * precision[changes + 1]))
+
+
+def evaluate(samples, predictions, iou_threshold=0.5):
+    """
+    Сопоставляет обнаружения с эталонной разметкой.
+
+    :param samples: Изображения набора данных (см. load_dataset).
+    :type samples: list
+    :param predictions: Обнаружения по идентификаторам изображений (см. run_model).
+    :type predictions: dict
+    :param iou_threshold: Минимальный IoU для совпадения обнаружения с эталонным объектом.
+    :type iou_threshold: float
+    :return: Словарь {класс: {'positives': число эталонных объектов, 'ap': AP,
+        'scores': уверенности по убыванию, 'tp': признаки верных обнаружений}}.
+    :rtype: dict
+    """
+    import numpy as np
+
+    ground_truth, positives = {}, {}
+    for sample in samples:
+        for obj in sample['objects']:
+            ground_truth.setdefault((sample['id'], obj['label']), []).append(obj)
+            if not obj['ignore']:
+                positives[obj['label']] = positives.get(obj['label'], 0) + 1
+
+    detections = {}
+    for image_id, candidates in predictions.items():
+        for label, score, box in candidates:
+            detections.setdefault(label, []).append((score, image_id, box))
+
+    results = {}
+    for label in sorted(set(positives) | set(detections)):
+        matched = set()
+        scores, flags = [], []
+        for score, image_id, box in sorted(detections.get(label, []), key=lambda d: -d[0]):
+            objects = ground_truth.get((image_id, label), [])
+            best, best_iou = None, iou_threshold
+            for index, obj in enumerate(objects):
+                iou = _iou(box, obj['box'])
+                if iou >= best_iou and (image_id, label, index) not in matched:
+                    best, best_iou = index, iou
+            if best is not None and objects[best]['ignore']:
+                # Совпадение с объектом difficult/iscrowd не учитывается
+                continue
+            if best is not None:
+                matched.add((image_id, label, best))
+            scores.append(score)
+            flags.append(best is not None)
+        scores, flags = np.array(scores, dtype=float), np.array(flags, dtype=bool)
+        count = positives.get(label, 0)
+        ap = None
+        if count:
+            tp = np.cumsum(flags)
+            precision = tp / np.arange(1, len(flags) + 1) if len(flags) else np.array([])
+            ap = _average_precision(tp / count, precision)
+        results[label] = {'positives': count, 'ap': ap, 'scores': scores, 'tp': flags}
+    return results
+
+
+def precision_recall_at(result, threshold):
+    """
+    Точность и полнота обнаружений с уверенностью не ниже порога.
+
+    Сопоставление выполняется по убыванию уверенности, поэтому признаки верных обнаружений выше порога
+    не зависят от обнаружений ниже порога.
+
+    :param result: Результат для класса или объединённый результат (ключи 'positives', 'scores', 'tp').
+    :type result: dict
+    :param threshold: Порог уверенности.
+    :type threshold: float
+    :return: Кортеж (точность, полнота, количество обнаружений); точность или полнота None, если не определена.
+    :rtype: tuple
+    """
+    selected = result['scores'] >= threshold
+    detected = int(selected.sum())
+    true_positives = int(result['tp'][selected].sum())
+    precision = true_positives / detected if detected else None
+    recall = true_positives / result['positives'] if result['positives'] else None
+    return precision, recall, detected
+
+
+def combined(results):
+    """Объединяет результаты всех классов для расчёта общей точности и полноты при разных порогах."""
+    import numpy as np
+
+    scores = np.concatenate([result['scores'] for result in results.values()] or [np.array([])])
+    flags = np.concatenate([result['tp'] for result in results.values()] or [np.array([], dtype=bool)])
+    return {'positives': sum(result['positives'] for result in results.values()), 'scores': scores, 'tp': flags}
@@ -0,0 +1,276 @@
+"""
+Потоковая выгрузка обнаруженных объектов в форматах CSV, JSONL и COCO.
+
+Описание работы модуля:
+    1. detections_for_export(...):
+        - QuerySet обнаруженных объектов с фильтрами по пользователю, типу объекта, модели и диапазону дат.
+    2. iter_export(fmt, detections):
+        - Генератор фрагментов текста выгрузки. Строки читаются из базы данных через `.iterator()` блоками
+        по EXPORT_CHUNK_SIZE и сразу отдаются блоками того же размера, поэтому потребление памяти не зависит
+        от количества строк. Используется представлением export_detections (StreamingHttpResponse)
+        и management-командой export_detections.
+    3. RawSelection(raw_detections, threshold, labels):
+        - Выгрузка при произвольном пороге уверенности и наборе классов из полного вывода моделей (RawDetections)
+        без повторного запуска моделей. У кандидатов RawDetections нет идентификатора DetectedObject, поэтому id
+        во всех форматах такой выгрузки - порядковый номер строки (с 1), а не идентификатор объекта.
+        Для изображений и моделей без записи RawDetections (обработанных до её появления) строки выбираются
+        из сохранённых объектов DetectedObject (см. fallback_detections_for_export) с тем же порогом и набором
+        классов; сохранены только объекты выше рабочего порога модели, поэтому при меньшем пороге для таких
+        изображений выгружаются лишь они.
+    4. COCO:
+        - Выгрузка в формате COCO (categories, images, annotations) пишется тремя последовательными запросами;
+        bbox записывается как [x, y, ширина, высота] в координатах рабочей копии изображения, по которой
+        выполнялась обработка, а размеры изображения читаются из заголовка файла рабочей копии.
+"""
+import csv
+import io
+import itertools
+import json
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+
+from .models import DetectedObject, ImageFeed, RawDetections
+from .raw_detections import select, unpack
+from .uploads import stored_image_size
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'coco': 'application/json',
+}
+
+FIELDS = ['id', 'image_feed_id', 'user_id', 'image', 'object_type', 'model_name', 'confidence',
+          'x1', 'y1', 'x2', 'y2', 'created_at']
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def detections_for_export(user=None, object_type=None, model_name=None, date_from=None, date_to=None):
+    """
+    Возвращает обнаруженные объекты для выгрузки, отсортированные по идентификатору.
+
+    :param user: Пользователь; None - все пользователи.
+    :param object_type: Фильтр по типу объекта.
+    :type object_type: str
+    :param model_name: Фильтр по модели.
+    :type model_name: str
+    :param date_from: Начальная дата обнаружения (включительно).
+    :type date_from: date
+    :param date_to: Конечная дата обнаружения (включительно).
+    :type date_to: date
+    :rtype: QuerySet
+    """
+    detections = DetectedObject.objects.all()
+    if user is not None:
+        detections = detections.filter(image_feed__user=user)
+    if object_type:
+        detections = detections.filter(object_type=object_type)
+    if model_name is not None:
+        detections = detections.filter(model_name=model_name)
+    if date_from:
+        detections = detections.filter(created_at__date__gte=date_from)
+    if date_to:
+        detections = detections.filter(created_at__date__lte=date_to)
+    return detections.order_by('pk')
+
+
+class RawSelection:
+    """
+    Обнаружения из полного вывода моделей (RawDetections), выбранные по порогу уверенности и набору классов.
+
+    Attributes:
+        raw_detections (QuerySet): Записи RawDetections (см. raw_detections_for_export).
+        threshold (float): Порог уверенности (строго больше); None - все сохранённые кандидаты.
+        labels (set): Набор классов; пустой - все классы.
+        fallback (QuerySet): Объекты DetectedObject изображений без RawDetections
+            (см. fallback_detections_for_export); None - без них.
+    """
+
+    def __init__(self, raw_detections, threshold=None, labels=None, fallback=None):
+        self.raw_detections = raw_detections
+        self.threshold = threshold
+        self.labels = set(labels or ())
+        self.fallback = fallback
+
+    def fallback_detections(self):
+        """Сохранённые объекты изображений без RawDetections, выбранные по порогу и набору классов."""
+        if self.fallback is None:
+            return DetectedObject.objects.none()
+        detections = self.fallback
+        if self.threshold is not None:
+            detections = detections.filter(confidence__gt=self.threshold)
+        if self.labels:
+            detections = detections.filter(object_type__in=self.labels)
+        return detections
+
+    def feed_ids(self):
+        """Подзапросы идентификаторов изображений выгрузки (для раздела images в COCO)."""
+        return (self.raw_detections.order_by().values('image_feed_id'),
+                self.fallback_detections().order_by().values('image_feed_id'))
+
+    def rows(self):
+        """
+        Строки выгрузки; записи RawDetections, а затем объекты fallback читаются из базы данных блоками.
+
+        id строки - её порядковый номер в выгрузке (одинаковый в CSV, JSONL и COCO).
+        """
+        rows = itertools.chain(self._raw_rows(), _detected_object_rows(self.fallback_detections()))
+        for index, row in enumerate(rows, start=1):
+            row['id'] = index
+            yield row
+
+    def _raw_rows(self):
+        values = self.raw_detections.values_list('image_feed_id', 'image_feed__user_id', 'image_feed__image',
+                                                 'model_name', 'labels', 'data', 'created_at')
+        for feed_id, user_id, image, model_name, labels, data, created_at in (
+                values.iterator(chunk_size=_chunk_size())):
+            for object_type, confidence, (x1, y1, x2, y2) in select(unpack(labels, data), self.threshold, self.labels):
+                yield {
+                    'id': None, 'image_feed_id': feed_id, 'user_id': user_id, 'image': image,
+                    'object_type': object_type, 'model_name': model_name, 'confidence': confidence,
+                    'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'created_at': created_at.isoformat(),
+                }
+
+
+def raw_detections_for_export(user=None, model_name=None, date_from=None, date_to=None):
+    """
+    Возвращает записи полного вывода моделей для выгрузки с порогом (см. RawSelection).
+
+    :param user: Пользователь; None - все пользователи.
+    :param model_name: Фильтр по модели.
+    :type model_name: str
+    :param date_from: Начальная дата обработки (включительно).
+    :type date_from: date
+    :param date_to: Конечная дата обработки (включительно).
+    :type date_to: date
+    :rtype: QuerySet
+    """
+    raw_detections = RawDetections.objects.all()
+    if user is not None:
+        raw_detections = raw_detections.filter(image_feed__user=user)
+    if model_name:
+        raw_detections = raw_detections.filter(model_name=model_name)
+    if date_from:
+        raw_detections = raw_detections.filter(created_at__date__gte=date_from)
+    if date_to:
+        raw_detections = raw_detections.filter(created_at__date__lte=date_to)
+    return raw_detections.order_by('pk')
+
+
+def fallback_detections_for_export(user=None, model_name=None, date_from=None, date_to=None):
+    """
+    Возвращает обнаруженные объекты изображений, для которых нет записи RawDetections той же модели.
+
+    Такие изображения обработаны до сохранения полного вывода моделей, поэтому выгрузка с порогом берёт
+    для них сохранённые объекты (см. RawSelection). Параметры те же, что у raw_detections_for_export.
+
+    :rtype: QuerySet
+    """
+    raw = RawDetections.objects.filter(image_feed_id=OuterRef('image_feed_id'), model_name=OuterRef('model_name'))
+    return (detections_for_export(user, model_name=model_name or None, date_from=date_from, date_to=date_to)
+            .exclude(Exists(raw)))
+
+
+def _rows(detections):
+    """Строки выгрузки в виде словарей, читаемые из базы данных блоками."""
+    if isinstance(detections, RawSelection):
+        return detections.rows()
+    return _detected_object_rows(detections)
+
+
+def _detected_object_rows(detections):
+    values = detections.values_list('id', 'image_feed_id', 'image_feed__user_id', 'image_feed__image',
+                                    'object_type', 'model_name', 'confidence', 'location', 'created_at')
+    for pk, feed_id, user_id, image, object_type, model_name, confidence, location, created_at in (
+            values.iterator(chunk_size=_chunk_size())):
+        x1, y1, x2, y2 = (int(value) for value in location.split(','))
+        yield {
+            'id': pk, 'image_feed_id': feed_id, 'user_id': user_id, 'image': image,
+            'object_type': object_type, 'model_name': model_name, 'confidence': confidence,
+            'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'created_at': created_at.isoformat(),
+        }
+
+
+def _buffered(lines):
+    """Объединяет строки в блоки по EXPORT_CHUNK_SIZE, чтобы не отдавать ответ по одной строке."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= _chunk_size():
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _csv_lines(detections):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    for row in _rows(detections):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Заголовок без строк данных
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _jsonl_lines(detections):
+    for row in _rows(detections):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _coco_lines(detections):
+    if isinstance(detections, RawSelection):
+        # Классы выше порога известны только после распаковки: отдельный проход по записям
+        categories = sorted({row['object_type'] for row in detections.rows()})
+        raw_feed_ids, fallback_feed_ids = detections.feed_ids()
+        feeds = ImageFeed.objects.filter(Q(pk__in=raw_feed_ids) | Q(pk__in=fallback_feed_ids))
+    else:
+        categories = sorted(set(detections.order_by().values_list('object_type', flat=True).distinct()))
+        feeds = ImageFeed.objects.filter(pk__in=detections.order_by().values('image_feed_id'))
+    category_ids = {name: index for index, name in enumerate(categories, start=1)}
+    yield '{"info": {"description": "Object detection export"}, "categories": '
+    yield json.dumps([{'id': category_ids[name], 'name': name} for name in categories], ensure_ascii=False)
+
+    yield ', "images": ['
+    feeds = feeds.order_by('pk').values_list('pk', 'image', 'working_image')
+    separator = ''
+    for pk, image, working_image in feeds.iterator(chunk_size=_chunk_size()):
+        width, height = stored_image_size(working_image, image)
+        yield separator + json.dumps({'id': pk, 'file_name': image, 'width': width, 'height': height},
+                                     ensure_ascii=False)
+        separator = ', '
+
+    yield '], "annotations": ['
+    separator = ''
+    for row in _rows(detections):
+        width, height = row['x2'] - row['x1'], row['y2'] - row['y1']
+        yield separator + json.dumps({
+            'id': row['id'], 'image_id': row['image_feed_id'], 'category_id': category_ids[row['object_type']],
+            'bbox': [row['x1'], row['y1'], width, height], 'area': width * height, 'iscrowd': 0,
+            'score': row['confidence'], 'model_name': row['model_name'],
+        }, ensure_ascii=False)
+        separator = ', '
+    yield ']}\n'
+
+
+def iter_export(fmt, detections):
+    """
+    Генерирует выгрузку обнаруженных объектов блоками текста.
+
+    :param fmt: Формат: 'csv', 'jsonl' или 'coco'.
+    :type fmt: str
+    :param detections: QuerySet обнаруженных объектов (см. detections_for_export) или RawSelection.
+    :return: Генератор строк.
+    :raises ValueError: Если формат не поддерживается.
+    """
+    lines = {'csv': _csv_lines, 'jsonl': _jsonl_lines, 'coco': _coco_lines}.get(fmt)
+    if lines is None:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return _buffered(lines(detections))
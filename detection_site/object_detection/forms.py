@@ -4,6 +4,7 @@
 
 from django import forms
 from .models import ImageFeed
+from .uploads import validate_image_limits
 from django.contrib.auth.forms import SetPasswordForm, PasswordResetForm
 
 
@@ -48,6 +49,12 @@ class ImageFeedForm(forms.ModelForm):
         # `help_texts = {...}` Здесь задаются тексты с подсказками для каждого поля формы. В нашем случае,
         # для поля `image` задан текст "Upload an image file.", который будет отображаться рядом с полем в интерфейсе.
 
+    def clean_image(self):
+        """Проверяет размер файла и количество пикселей до декодирования изображения."""
+        image = self.cleaned_data['image']
+        validate_image_limits(image)
+        return image
+
 
 class UserSetNewPasswordForm(SetPasswordForm):
     """Изменение пароля пользователя после подтверждения"""
@@ -0,0 +1,108 @@
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from object_detection.db import BatchedWriter
+from object_detection.models import ImageFeed, DetectedObject
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочная проверка конкурентной записи DetectedObject в настроенную базу данных.
+
+    N воркеров (потоков или, с флагом --processes, отдельных процессов, как у Celery prefork)
+    одновременно записывают результаты обнаружения для нескольких изображений.
+    Сравниваются два режима:
+        - direct: `DetectedObject.objects.create` на каждый объект, как раньше делали функции обработки;
+        - batched: одно задание `bulk_create` на изображение через общий поток-писатель BatchedWriter.
+    Для каждого режима выводится пропускная способность (строк в секунду) и количество ошибок "database is locked".
+    Созданные тестовые записи удаляются после проверки.
+
+    Использование:
+        python manage.py benchmark_detection_writes --workers 1 4 8 --feeds 20 --boxes 10 [--processes]
+    """
+    help = 'Измеряет пропускную способность записи DetectedObject при N параллельных воркерах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Количество параллельных воркеров (можно указать несколько значений).')
+        parser.add_argument('--feeds', type=int, default=20, help='Количество изображений на одного воркера.')
+        parser.add_argument('--boxes', type=int, default=10, help='Количество объектов на одно изображение.')
+        parser.add_argument('--modes', nargs='+', choices=['direct', 'batched'], default=['direct', 'batched'],
+                            help='Проверяемые режимы записи.')
+        parser.add_argument('--processes', action='store_true',
+                            help='Запускать воркеры отдельными процессами (fork) вместо потоков.')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.create(username=f'benchmark-{uuid.uuid4().hex[:12]}')
+        try:
+            self.stdout.write(f"{'mode':<8} {'workers':>7} {'rows':>7} {'seconds':>8} {'rows/s':>9} {'locked':>7}")
+            for workers in options['workers']:
+                feeds = [ImageFeed.objects.create(user=user, image=f'images/benchmark_{i}.jpg')
+                         for i in range(workers * options['feeds'])]
+                for mode in options['modes']:
+                    rows, seconds, locked = self._run(mode, feeds, workers, options['boxes'], options['processes'])
+                    self.stdout.write(f"{mode:<8} {workers:>7} {rows:>7} {seconds:>8.3f} "
+                                      f"{rows / seconds if seconds else 0:>9.0f} {locked:>7}")
+                    DetectedObject.objects.filter(image_feed__user=user).delete()
+        finally:
+            # Каскадное удаление пользователя удаляет тестовые ImageFeed и DetectedObject без очистки файлов:
+            # файлы для них не создавались
+            user.delete()
+
+    def _run(self, mode, feeds, workers, boxes, processes):
+        """Запускает воркеры в режиме `mode` и возвращает (записано строк, время в секундах, ошибок блокировки)."""
+        chunk = len(feeds) // workers
+        chunks = [feeds[i * chunk:(i + 1) * chunk] for i in range(workers)]
+        if processes:
+            # Дочерние процессы не должны наследовать открытое соединение родителя
+            connection.close()
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            barrier = context.Barrier(workers)
+            runners = [context.Process(target=_worker, args=(mode, part, boxes, barrier, results)) for part in chunks]
+        else:
+            results = queue.Queue()
+            barrier = threading.Barrier(workers)
+            runners = [threading.Thread(target=_worker, args=(mode, part, boxes, barrier, results)) for part in chunks]
+
+        start = time.perf_counter()
+        for runner in runners:
+            runner.start()
+        totals = [results.get() for _ in runners]
+        seconds = time.perf_counter() - start
+        for runner in runners:
+            runner.join()
+        return sum(rows for rows, _ in totals), seconds, sum(locked for _, locked in totals)
+
+
+# Писатель уровня процесса: в режиме --processes у каждого процесса свой поток-писатель, как у воркеров Celery
+_writer = BatchedWriter()
+
+
+def _worker(mode, feeds, boxes, barrier, results):
+    """Записывает результаты обнаружения для `feeds` и отправляет в `results` пару (строк, ошибок блокировки)."""
+    barrier.wait()
+    rows = locked = 0
+    try:
+        for feed in feeds:
+            objects = [DetectedObject(image_feed=feed, object_type='person', confidence=0.9,
+                                      location=f'{i},{i},{i + 10},{i + 10}') for i in range(boxes)]
+            try:
+                if mode == 'direct':
+                    for obj in objects:
+                        obj.save()
+                else:
+                    _writer.run(lambda: DetectedObject.objects.bulk_create(objects))
+                rows += len(objects)
+            except OperationalError:
+                locked += 1
+    finally:
+        connection.close()
+    results.put((rows, locked))
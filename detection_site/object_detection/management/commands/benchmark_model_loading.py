@@ -0,0 +1,108 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from object_detection import model_store
+
+
+def _memory_stats():
+    """Возвращает RSS, PSS и общую (shared) память процесса в МБ по /proc/self/smaps_rollup (Linux)."""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {
+        'rss': values.get('Rss', 0.0),
+        'pss': values.get('Pss', 0.0),
+        'shared': values.get('Shared_Clean', 0.0) + values.get('Shared_Dirty', 0.0),
+    }
+
+
+def _load(mode):
+    """Загружает DETR указанным способом."""
+    if mode == 'hub':
+        # Прежний способ: загрузка по имени репозитория через кэш Hugging Face
+        from transformers import DetrForObjectDetection, DetrImageProcessor
+        DetrImageProcessor.from_pretrained('facebook/detr-resnet-50', revision='no_timm')
+        return DetrForObjectDetection.from_pretrained('facebook/detr-resnet-50', revision='no_timm')
+    return model_store._load_detr(mmap_weights=(mode == 'mmap'))[1]
+
+
+def _worker(mode, barrier, results):
+    """Загружает модель, дожидается остальных процессов и отправляет замеры."""
+    # Импорт библиотек не входит в замер: сравнивается только загрузка весов
+    import torch
+    from transformers import DetrConfig, DetrForObjectDetection, DetrImageProcessor  # noqa: F401
+
+    before = _memory_stats()
+    try:
+        start = time.perf_counter()
+        model = _load(mode)
+        seconds = time.perf_counter() - start
+        # Чтение всех весов, как при инференсе: страницы весов попадают в память процесса
+        with torch.no_grad():
+            for parameter in model.parameters():
+                parameter.sum()
+        error = None
+    except Exception as e:
+        seconds, error = 0.0, str(e)
+    # Память измеряется, когда все процессы держат модель загруженной
+    barrier.wait()
+    after = _memory_stats()
+    results.put({'seconds': seconds, 'error': error,
+                 'rss': after['rss'] - before['rss'], 'pss': after['pss'] - before['pss'],
+                 'shared': after['shared']})
+    barrier.wait()
+
+
+class Command(BaseCommand):
+    """
+    Измеряет время загрузки и память DETR в нескольких одновременно работающих процессах.
+
+    Режимы:
+        - hub: прежний способ `from_pretrained("facebook/detr-resnet-50")` (нужен кэш Hugging Face или сеть);
+        - from_pretrained: стандартная загрузка из локального хранилища (веса копируются в память процесса);
+        - mmap: загрузка из локального хранилища с отображением весов в память (страницы общие для процессов).
+    Для каждого режима выводится среднее время загрузки, средний прирост RSS после загрузки и чтения всех весов,
+    суммарный прирост PSS всех процессов (учитывает разделение общих страниц) и средний объём общей памяти.
+
+    Использование:
+        python manage.py benchmark_model_loading --processes 4 --modes from_pretrained mmap
+    """
+    help = 'Сравнивает время загрузки и память DETR при разных способах загрузки весов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Количество одновременно работающих процессов.')
+        parser.add_argument('--modes', nargs='+', choices=['hub', 'from_pretrained', 'mmap'],
+                            default=['from_pretrained', 'mmap'], help='Сравниваемые способы загрузки.')
+
+    def handle(self, *args, **options):
+        try:
+            model_store.verify_artifact('detr_resnet50')
+        except model_store.ModelStoreError as e:
+            raise CommandError(str(e))
+
+        processes = options['processes']
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(f"{'mode':<16} {'procs':>5} {'load s':>7} {'+RSS MB':>8} {'+PSS total MB':>14} {'shared MB':>10}")
+        for mode in options['modes']:
+            barrier = context.Barrier(processes)
+            results = context.Queue()
+            workers = [context.Process(target=_worker, args=(mode, barrier, results)) for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            stats = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+
+            errors = [item['error'] for item in stats if item['error']]
+            if errors:
+                self.stdout.write(self.style.ERROR(f"{mode:<16} failed: {errors[0]}"))
+                continue
+            self.stdout.write(
+                f"{mode:<16} {processes:>5} {sum(s['seconds'] for s in stats) / processes:>7.2f} "
+                f"{sum(s['rss'] for s in stats) / processes:>8.1f} {sum(s['pss'] for s in stats):>14.1f} "
+                f"{sum(s['shared'] for s in stats) / processes:>10.1f}")
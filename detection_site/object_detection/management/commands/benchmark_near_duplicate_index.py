@@ -0,0 +1,72 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from object_detection.near_duplicates import MultiIndexHashTable
+
+
+class Command(BaseCommand):
+    """
+    Измеряет время поиска почти одинаковых хэшей в индексе MultiIndexHashTable.
+
+    Индекс заполняется случайными 64-битными хэшами (база данных не используется): основная часть - начальной
+    загрузкой, как при первом поиске в процессе, и --recent хэшей - по одному, как новые изображения. Половина запросов -
+    искажённые копии хэшей из индекса (до --distance изменённых бит), половина - случайные хэши.
+    Выводится время построения индекса, среднее время поиска, 99-й перцентиль и доля найденных копий.
+
+    Использование:
+        python manage.py benchmark_near_duplicate_index --size 2000000 --recent 1000 --queries 10000 --distance 6
+    """
+    help = 'Измеряет время поиска в индексе перцептивных хэшей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1_000_000, help='Количество хэшей в индексе.')
+        parser.add_argument('--recent', type=int, default=1000,
+                            help='Количество хэшей, добавленных после начальной загрузки индекса.')
+        parser.add_argument('--queries', type=int, default=10_000, help='Количество запросов.')
+        parser.add_argument('--distance', type=int, default=getattr(settings, 'NEAR_DUPLICATE_MAX_DISTANCE', 6),
+                            help='Максимальное расстояние Хэмминга.')
+        parser.add_argument('--chunks', type=int, default=getattr(settings, 'NEAR_DUPLICATE_INDEX_CHUNKS', 3),
+                            help='Количество частей хэша в индексе.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        size, distance = options['size'], options['distance']
+
+        table = MultiIndexHashTable(chunks=options['chunks'])
+        start = time.perf_counter()
+        hashes = [rng.getrandbits(64) for _ in range(size)]
+        table.add_many(enumerate(hashes))
+        # Изображения, загруженные после начальной загрузки индекса, попадают в словари новых хэшей
+        for _ in range(options['recent']):
+            hashes.append(rng.getrandbits(64))
+            table.add(len(hashes) - 1, hashes[-1])
+        self.stdout.write(f"Built index of {len(table)} hashes in {time.perf_counter() - start:.1f}s")
+
+        queries = []
+        for i in range(options['queries']):
+            if i % 2:
+                queries.append((None, rng.getrandbits(64)))
+            else:
+                key = rng.randrange(size)
+                value = hashes[key]
+                for bit in rng.sample(range(64), rng.randint(0, distance)):
+                    value ^= 1 << bit
+                queries.append((key, value))
+
+        timings = []
+        found = 0
+        for key, value in queries:
+            start = time.perf_counter()
+            matches = table.search(value, distance)
+            timings.append(time.perf_counter() - start)
+            if key is not None and any(match == key for match, _ in matches):
+                found += 1
+
+        timings.sort()
+        self.stdout.write(f"Queries: {len(timings)}, mean {sum(timings) / len(timings) * 1000:.3f} ms, "
+                          f"p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+        self.stdout.write(f"Near-duplicates found: {found}/{(len(queries) + 1) // 2}")
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Код, выполняемый в отдельном «холодном» процессе: django.setup() и загрузка URLconf с разрешением маршрута
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver, resolve, reverse
+get_resolver().url_patterns
+resolve(reverse('object_detection:dashboard'))
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': sorted(name for name in sys.modules if '.' not in name),
+}))
+"""
+
+
+class Command(BaseCommand):
+    """
+    Проверяет время и память холодного запуска Django в отдельном процессе.
+
+    Измеряется `django.setup()` вместе с загрузкой URLconf и разрешением маршрута панели управления.
+    Команда завершается ошибкой, если превышен бюджет времени или памяти (STARTUP_TIME_BUDGET,
+    STARTUP_MEMORY_BUDGET_MB) или если при запуске загружена тяжёлая библиотека из STARTUP_FORBIDDEN_MODULES.
+    Подходит для запуска в CI.
+
+    Использование:
+        python manage.py check_startup_budget [--max-seconds 2.5] [--max-memory-mb 150] [--repeat 3]
+    """
+    help = 'Проверяет время и память холодного запуска Django и загрузки URLconf.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-seconds', type=float, default=None,
+                            help='Бюджет времени запуска в секундах (по умолчанию STARTUP_TIME_BUDGET).')
+        parser.add_argument('--max-memory-mb', type=float, default=None,
+                            help='Бюджет пиковой памяти в МБ (по умолчанию STARTUP_MEMORY_BUDGET_MB).')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Количество запусков; учитывается лучший результат по времени.')
+
+    def handle(self, *args, **options):
+        max_seconds = options['max_seconds'] or getattr(settings, 'STARTUP_TIME_BUDGET', 2.0)
+        max_memory_mb = options['max_memory_mb'] or getattr(settings, 'STARTUP_MEMORY_BUDGET_MB', 150)
+        forbidden = getattr(settings, 'STARTUP_FORBIDDEN_MODULES', ['torch', 'transformers', 'cv2'])
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        results = []
+        for _ in range(max(options['repeat'], 1)):
+            completed = subprocess.run([sys.executable, '-c', _PROBE], env=env, cwd=settings.BASE_DIR,
+                                       capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise CommandError(f'Startup probe failed:\n{completed.stderr}')
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        best = min(results, key=lambda result: result['seconds'])
+        loaded = [name for name in forbidden if name in best['modules']]
+        self.stdout.write(f"Startup time: {best['seconds']:.3f}s (budget {max_seconds}s)")
+        self.stdout.write(f"Peak RSS: {best['max_rss_mb']:.1f} MB (budget {max_memory_mb} MB)")
+
+        errors = []
+        if best['seconds'] > max_seconds:
+            errors.append(f"startup time {best['seconds']:.3f}s exceeds {max_seconds}s")
+        if best['max_rss_mb'] > max_memory_mb:
+            errors.append(f"peak RSS {best['max_rss_mb']:.1f} MB exceeds {max_memory_mb} MB")
+        if loaded:
+            errors.append(f"heavy modules imported at startup: {', '.join(loaded)}")
+        if errors:
+            raise CommandError('Startup budget exceeded: ' + '; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('Startup budget OK.'))
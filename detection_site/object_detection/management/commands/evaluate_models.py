@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from object_detection.evaluation import (combined, evaluate, load_dataset, model_labels, precision_recall_at,
+                                         run_model)
+from object_detection.model_store import ModelStoreError
+from object_detection.models import DetectedObject
+from object_detection.utils import DETR_CONFIDENCE_THRESHOLD, SSD_CONFIDENCE_THRESHOLD
+
+MODELS = {
+    'ssd': (DetectedObject.MODEL_MOBILENET_SSD, SSD_CONFIDENCE_THRESHOLD),
+    'detr': (DetectedObject.MODEL_DETR, DETR_CONFIDENCE_THRESHOLD),
+}
+
+
+def _format(value, pattern='{:.3f}'):
+    return '-' if value is None else pattern.format(value)
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает MobileNet SSD и DETR по скорости и точности на локальном наборе данных с разметкой VOC или COCO.
+
+    Каждая модель по очереди обрабатывает все изображения в нескольких процессах (--workers) с низким порогом
+    уверенности (--min-score). Для каждой модели выводятся:
+        - время обработки изображения (среднее, p50, p95) и пропускная способность;
+        - mAP при IoU --iou по всем классам разметки и по классам, которые модель умеет распознавать;
+        - точность, полнота и F1 при порогах --thresholds и рабочем пороге модели (SSD_CONFIDENCE_THRESHOLD,
+        DETR_CONFIDENCE_THRESHOLD в utils.py), а также порог с наибольшим F1;
+        - AP, полнота и точность по классам при рабочем пороге.
+
+    Использование:
+        python manage.py evaluate_models /data/VOC2007 --models ssd detr --workers 4 --limit 500
+        python manage.py evaluate_models /data/coco/val2017 --annotations /data/coco/instances_val2017.json
+    """
+    help = 'Сравнивает скорость и точность моделей обнаружения на размеченном наборе данных (VOC/COCO).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', help='Каталог набора данных VOC/COCO или JSON-файл COCO.')
+        parser.add_argument('--annotations', help='JSON-файл разметки COCO, если он не в каталоге набора данных.')
+        parser.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS))
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов инференса; по умолчанию - количество ядер.')
+        parser.add_argument('--limit', type=int, default=None, help='Количество изображений (первые по порядку).')
+        parser.add_argument('--iou', type=float, default=0.5, help='Порог IoU для совпадения с разметкой.')
+        parser.add_argument('--min-score', type=float, default=0.05,
+                            help='Минимальная уверенность обнаружений, учитываемых при расчёте mAP.')
+        parser.add_argument('--thresholds', type=float, nargs='+', default=[0.3, 0.5, 0.6, 0.7, 0.8, 0.9],
+                            help='Пороги уверенности для сравнения точности и полноты.')
+
+    def handle(self, *args, **options):
+        try:
+            samples = load_dataset(options['dataset'], options['annotations'])
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Failed to load dataset: {e}')
+        if options['limit']:
+            samples = samples[:options['limit']]
+        if not samples:
+            raise CommandError('The dataset has no images')
+        objects = sum(len(sample['objects']) for sample in samples)
+        self.stdout.write(f'Dataset: {len(samples)} images, {objects} objects')
+
+        for key in options['models']:
+            model_name, threshold = MODELS[key]
+            try:
+                predictions, latencies, elapsed = run_model(model_name, samples, options['workers'],
+                                                            options['min_score'])
+            except ModelStoreError as e:
+                raise CommandError(f'{model_name}: {e}')
+            results = evaluate(samples, predictions, options['iou'])
+            self._report(model_name, threshold, options, latencies, elapsed, results)
+
+    def _report(self, model_name, threshold, options, latencies, elapsed, results):
+        """Выводит результаты одной модели."""
+        latencies = sorted(latencies)
+
+        def percentile(p):
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{model_name}'))
+        self.stdout.write(f'Latency per image: mean {sum(latencies) / len(latencies) * 1000:.1f} ms, '
+                          f'p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms; '
+                          f'throughput {len(latencies) / elapsed:.2f} images/s')
+
+        known = model_labels(model_name)
+        evaluated = {label: result for label, result in results.items() if result['positives']}
+        aps = [result['ap'] for result in evaluated.values()]
+        known_aps = [result['ap'] for label, result in evaluated.items() if label in known]
+        self.stdout.write(f"mAP@{options['iou']}: {_format(sum(aps) / len(aps) if aps else None)} "
+                          f"({len(aps)} classes), classes known to the model: "
+                          f"{_format(sum(known_aps) / len(known_aps) if known_aps else None)} ({len(known_aps)} classes)")
+
+        overall = combined(results)
+        self.stdout.write(f"{'threshold':>9} {'precision':>9} {'recall':>7} {'f1':>6} {'detections':>10}")
+        best = None
+        for value in sorted(set(options['thresholds']) | {threshold}):
+            precision, recall, detected = precision_recall_at(overall, value)
+            f1 = (2 * precision * recall / (precision + recall)) if precision and recall else None
+            if f1 is not None and (best is None or f1 > best[1]):
+                best = (value, f1)
+            marker = ' *' if value == threshold else ''
+            self.stdout.write(f'{value:>9.2f} {_format(precision):>9} {_format(recall):>7} {_format(f1):>6} '
+                              f'{detected:>10}{marker}')
+        self.stdout.write(f'* current threshold; best F1 at {best[0]:.2f}' if best else '* current threshold')
+
+        self.stdout.write(f"{'class':<16} {'objects':>7} {'AP':>6} {'recall':>7} {'precision':>9}")
+        for label, result in sorted(evaluated.items(), key=lambda item: -item[1]['positives']):
+            precision, recall, _ = precision_recall_at(result, threshold)
+            suffix = '' if label in known else '  (unknown to the model)'
+            self.stdout.write(f"{label:<16} {result['positives']:>7} {_format(result['ap']):>6} "
+                              f"{_format(recall):>7} {_format(precision):>9}{suffix}")
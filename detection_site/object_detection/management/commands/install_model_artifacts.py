@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from object_detection.model_store import ModelStoreError, install_artifact
+
+
+class Command(BaseCommand):
+    """
+    Устанавливает артефакты моделей в локальное хранилище MODEL_STORE_ROOT.
+
+    Это единственный шаг, которому нужен доступ к сети: артефакты с `repo_id` скачиваются с Hugging Face Hub
+    в закреплённой ревизии. Файлы также можно скопировать из локального каталога (--source).
+    После установки модели загружаются только из хранилища с проверкой контрольных сумм.
+
+    Использование:
+        python manage.py install_model_artifacts [имя ...] [--source каталог]
+    """
+    help = 'Устанавливает артефакты моделей в локальное хранилище и записывает manifest.json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Имена артефактов из MODEL_ARTIFACTS (по умолчанию все).')
+        parser.add_argument('--source', default=None, help='Локальный каталог с файлами артефакта.')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(settings.MODEL_ARTIFACTS)
+        for name in names:
+            try:
+                manifest = install_artifact(name, source=options['source'])
+            except ModelStoreError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Installed {name} (revision {manifest['revision'] or '-'})"))
+            for filename, info in manifest['files'].items():
+                self.stdout.write(f"  {filename}: {info['size']} bytes, sha256 {info['sha256']}")
@@ -0,0 +1,310 @@
+import http.cookiejar
+import io
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+
+PASSWORD = 'load-test-password'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Обработчик запросов тестового сервера без журнала каждого запроса."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Не следует перенаправлениям: время каждого запроса измеряется отдельно."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def _synthetic_images(count, width, height, seed):
+    """Генерирует JPEG-изображения с несколькими цветными прямоугольниками на шумном фоне."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = Image.fromarray(rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8))
+        image = image.resize((width, height), Image.BILINEAR)
+        draw = ImageDraw.Draw(image)
+        for _ in range(int(rng.integers(1, 6))):
+            x1, y1 = int(rng.integers(0, width - 50)), int(rng.integers(0, height - 50))
+            x2, y2 = int(rng.integers(x1 + 40, width)), int(rng.integers(y1 + 40, height))
+            draw.rectangle((x1, y1, x2, y2), fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def _multipart(fields, files):
+    """Кодирует поля и файлы формы в multipart/form-data. Возвращает (тело, Content-Type)."""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: image/jpeg\r\n\r\n'.encode())
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+def _job_succeeded(feed_id):
+    """
+    Выполнено ли последнее задание обработки изображения.
+
+    Представления обработки всегда перенаправляют на панель управления, поэтому задание, отклонённое
+    планировщиком или завершившееся ошибкой, видно только по записи InferenceJob.
+    """
+    from object_detection.models import InferenceJob
+
+    status = (InferenceJob.objects.filter(image_feed_id=feed_id).order_by('-pk')
+              .values_list('status', flat=True).first())
+    return status == InferenceJob.STATUS_DONE
+
+
+class VirtualUser:
+    """Пользователь нагрузочного теста: своя сессия (cookies) и замеры каждого запроса."""
+
+    def __init__(self, base_url, username, record):
+        self.base_url = base_url
+        self.username = username
+        self.record = record
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies),
+                                                  NoRedirectHandler())
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ''
+
+    def request(self, endpoint, path, data=None, content_type=None, expected=(200,), check=None):
+        """
+        Выполняет запрос и записывает его время и результат под именем endpoint.
+
+        :param check: Дополнительная проверка успеха запроса после ответа с ожидаемым статусом
+            (функция без аргументов, возвращающая bool); её время в замер не входит.
+
+        :return: Тело ответа (пустое при ошибке).
+        :rtype: bytes
+        """
+        request = urllib.request.Request(self.base_url + path, data=data)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=300) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except OSError:
+            status, body = 0, b''
+        seconds = time.perf_counter() - start
+        self.record(endpoint, seconds, status in expected and (check is None or check()))
+        return body
+
+    def login(self):
+        """Входит в систему через форму входа."""
+        login_path = reverse('object_detection:login')
+        self.request('login_form', login_path)
+        data = urllib.parse.urlencode({'username': self.username, 'password': PASSWORD,
+                                       'csrfmiddlewaretoken': self._csrf_token()}).encode()
+        self.request('login', login_path, data, 'application/x-www-form-urlencoded', expected=(302,))
+
+    def run_flow(self, image, process_path_name):
+        """Загрузка изображения -> панель управления -> обработка -> панель управления."""
+        upload_path = reverse('object_detection:add_image_feed')
+        self.request('upload_form', upload_path)
+        data, content_type = _multipart({'csrfmiddlewaretoken': self._csrf_token()},
+                                        {'image': (f'load_{uuid.uuid4().hex[:8]}.jpg', image)})
+        self.request('upload', upload_path, data, content_type, expected=(302,))
+
+        body = self.request('dashboard', reverse('object_detection:dashboard'))
+        if process_path_name is None:
+            return
+        # Панель управления показывает изображения всех пользователей, флажки выбора - только у своих.
+        # Последнее загруженное изображение - с наибольшим идентификатором
+        feed_ids = [int(feed_id) for feed_id in re.findall(rb'name="image_ids" value="(\d+)"', body)]
+        if not feed_ids:
+            self.record('process', 0.0, False)
+            return
+        feed_id = max(feed_ids)
+        self.request('process', reverse(process_path_name, args=[feed_id]), expected=(302,),
+                     check=lambda: _job_succeeded(feed_id))
+        self.request('dashboard', reverse('object_detection:dashboard'))
+
+
+class Command(BaseCommand):
+    """
+    Сквозной нагрузочный тест по HTTP: загрузка изображения -> обработка -> панель управления.
+
+    Команда создаёт отдельную тестовую базу данных и временный каталог MEDIA_ROOT, запускает приложение
+    на локальном многопоточном WSGI-сервере и для каждого уровня конкуренции запускает столько же
+    виртуальных пользователей. Каждый пользователь входит через форму входа и в течение --duration секунд
+    повторяет сценарий: форма загрузки, загрузка синтетического изображения, панель управления,
+    обработка последнего изображения выбранной моделью (--model), панель управления.
+
+    Для каждого уровня конкуренции и каждой конечной точки выводятся количество запросов, пропускная
+    способность, перцентили задержки (p50/p95/p99, max) и доля ошибок. Задания обработки выполняются
+    в запросе (SCHEDULER_DISPATCH = 'inline') без лимитов планировщика; обработка, задание которой отклонено
+    или завершилось ошибкой, считается ошибкой. Небольшой пул изображений (--distinct-images) приводит
+    к повторным загрузкам одинаковых изображений и проверяет повторное
+    использование результатов (см. near_duplicates.py).
+
+    Использование:
+        python manage.py load_test_http --concurrency 1 2 4 8 --duration 30 --model ssd
+    """
+    help = 'Нагрузочный тест сценария загрузка -> обработка -> панель управления на локальном сервере.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Уровни конкуренции (количество одновременных пользователей).')
+        parser.add_argument('--duration', type=float, default=20.0, help='Длительность каждого уровня в секундах.')
+        parser.add_argument('--model', choices=['ssd', 'detr', 'none'], default='ssd',
+                            help='Модель для обработки; none - только загрузка и панель управления.')
+        parser.add_argument('--image-size', default='1280x960', help='Размер синтетических изображений (ШxВ).')
+        parser.add_argument('--distinct-images', type=int, default=50, help='Количество различных изображений.')
+        parser.add_argument('--port', type=int, default=0, help='Порт сервера (0 - любой свободный).')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            width, height = (int(value) for value in options['image_size'].lower().split('x'))
+        except ValueError:
+            raise CommandError('--image-size must look like 1280x960')
+        process_path_name = {'ssd': 'object_detection:process_feed',
+                             'detr': 'object_detection:process_alternative', 'none': None}[options['model']]
+        images = _synthetic_images(options['distinct_images'], width, height, options['seed'])
+
+        media_root = tempfile.mkdtemp(prefix='load_test_media_')
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        database_dir = None
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # Файловая база вместо базы в памяти: потоки сервера открывают собственные соединения
+            database_dir = tempfile.mkdtemp(prefix='load_test_db_')
+            test_settings['NAME'] = f'{database_dir}/load_test.sqlite3'
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Задания обработки выполняются в запросе (воркеры Celery работают с рабочей базой данных, а не
+            # с тестовой), а лимиты планировщика не ограничивают виртуальных пользователей: измеряется инференс
+            with override_settings(MEDIA_ROOT=media_root, DEBUG=False,
+                                   ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['127.0.0.1'],
+                                   SCHEDULER_DISPATCH='inline', SCHEDULER_RATE=1e6, SCHEDULER_BURST=10 ** 6,
+                                   SCHEDULER_MAX_QUEUE_DEPTH=10 ** 6, SCHEDULER_MAX_USER_QUEUE_DEPTH=10 ** 6,
+                                   SCHEDULER_MAX_WAIT=float('inf')):
+                self._run(options, images, process_path_name)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if database_dir:
+                test_settings.pop('NAME', None)
+                shutil.rmtree(database_dir, ignore_errors=True)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def _run(self, options, images, process_path_name):
+        """Запускает сервер и все уровни конкуренции."""
+        usernames = [f'load-{i}' for i in range(max(options['concurrency']))]
+        for username in usernames:
+            get_user_model().objects.create_user(username=username, password=PASSWORD)
+
+        server = ThreadedWSGIServer(('127.0.0.1', options['port']), QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(get_wsgi_application())
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        self.stdout.write(f'Server: {base_url}, images: {len(images)}, model: {options["model"]}')
+        try:
+            for concurrency in options['concurrency']:
+                self._stage(base_url, usernames[:concurrency], images, process_path_name,
+                            options['duration'], random.Random(options['seed']))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _stage(self, base_url, usernames, images, process_path_name, duration, rng):
+        """Один уровень конкуренции: пользователи повторяют сценарий до истечения duration."""
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        flows = [0]
+        lock = threading.Lock()
+
+        def record(endpoint, seconds, ok):
+            with lock:
+                samples[endpoint].append(seconds)
+                if not ok:
+                    errors[endpoint] += 1
+
+        barrier = threading.Barrier(len(usernames) + 1)
+
+        def worker(username, seed):
+            user = VirtualUser(base_url, username, record)
+            user.login()
+            # Первый барьер: все вошли; второй: замеры входа сброшены
+            barrier.wait()
+            barrier.wait()
+            pick = random.Random(seed)
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                user.run_flow(pick.choice(images), process_path_name)
+                with lock:
+                    flows[0] += 1
+
+        threads = [threading.Thread(target=worker, args=(username, rng.random()), daemon=True)
+                   for username in usernames]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        # Вход пользователей не учитывается в результатах уровня
+        login_errors = errors['login']
+        samples.clear()
+        errors.clear()
+        start = time.perf_counter()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(f'\nConcurrency {len(usernames)}: {flows[0]} flows in {elapsed:.1f}s '
+                          f'({flows[0] / elapsed:.2f} flows/s)')
+        if login_errors:
+            self.stdout.write(self.style.WARNING(f'{login_errors} users failed to log in'))
+        self.stdout.write(f"{'endpoint':<12} {'requests':>8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+        for endpoint in ('upload_form', 'upload', 'dashboard', 'process'):
+            timings = sorted(samples.get(endpoint, []))
+            if not timings:
+                continue
+
+            def percentile(p):
+                return timings[min(int(len(timings) * p), len(timings) - 1)] * 1000
+
+            self.stdout.write(
+                f"{endpoint:<12} {len(timings):>8} {len(timings) / elapsed:>7.2f} {percentile(0.5):>8.1f} "
+                f"{percentile(0.95):>8.1f} {percentile(0.99):>8.1f} {timings[-1] * 1000:>8.1f} "
+                f"{errors[endpoint] / len(timings):>7.1%}")
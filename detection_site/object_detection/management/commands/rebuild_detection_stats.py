@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from object_detection.stats import rebuild_detection_stats
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает сводную статистику DetectionStat с нуля по таблице DetectedObject.
+
+    Использование:
+        python manage.py rebuild_detection_stats
+    """
+    help = 'Пересчитывает сводную статистику обнаружений по таблице DetectedObject.'
+
+    def handle(self, *args, **options):
+        rows = rebuild_detection_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} detection statistics rows.'))
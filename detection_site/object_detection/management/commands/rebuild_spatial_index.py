@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from object_detection.spatial import rebuild_spatial_index
+
+
+class Command(BaseCommand):
+    """
+    Заполняет нормализованные рамки DetectedObject и пересоздаёт пространственный индекс DetectionCell.
+
+    Нужна для объектов, записанных до появления индекса, и после изменения SPATIAL_GRID_SIZE.
+
+    Использование:
+        python manage.py rebuild_spatial_index
+    """
+    help = 'Пересоздаёт пространственный индекс обнаруженных объектов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество объектов, обрабатываемых за один проход.')
+
+    def handle(self, *args, **options):
+        indexed, cells = rebuild_spatial_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} detected objects in {cells} grid cells.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from object_detection.media_cleanup import sweep_orphaned_media
+
+
+class Command(BaseCommand):
+    """
+    Удаляет из MEDIA_ROOT файлы изображений, на которые не ссылается ни одна запись ImageFeed.
+
+    Использование:
+        python manage.py sweep_orphaned_media [--grace-seconds N] [--dry-run]
+    """
+    help = 'Удаляет файлы изображений, не связанные ни с одной записью ImageFeed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=int, default=None,
+                            help='Не трогать файлы моложе указанного возраста (по умолчанию MEDIA_SWEEP_GRACE_SECONDS).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать файлы-сироты, не удаляя их.')
+
+    def handle(self, *args, **options):
+        orphans = sweep_orphaned_media(grace_seconds=options['grace_seconds'], dry_run=options['dry_run'])
+        for name in orphans:
+            self.stdout.write(name)
+        action = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(orphans)} orphaned media files.'))
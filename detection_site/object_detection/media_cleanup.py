@@ -0,0 +1,129 @@
+"""
+Фоновая очистка медиафайлов, связанных с ImageFeed.
+
+Описание работы модуля:
+    1. schedule_media_deletion(names):
+        - Откладывает удаление файлов до фиксации транзакции и передаёт их Celery-задаче,
+        чтобы запрос на удаление записей не ждал файловую систему.
+    2. delete_media_files(names):
+        - Удаляет перечисленные файлы из хранилища (выполняется воркером).
+    3. sweep_orphaned_media(grace_seconds, dry_run):
+        - Сверяет файлы в каталогах `images/` и `processed_images/` внутри MEDIA_ROOT с записями в базе данных
+        и удаляет файлы, на которые не ссылается ни одна запись ImageFeed.
+        Сюда попадают файлы, оставшиеся после queryset.delete(), сбоев брокера и повторной обработки изображений.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Каталоги внутри MEDIA_ROOT, в которые сохраняются файлы полей ImageFeed
+MEDIA_SUBDIRS = ('images', 'processed_images')
+
+
+def delete_media_files(names):
+    """
+    Удаляет файлы из хранилища по их именам.
+
+    :param names: Имена файлов относительно MEDIA_ROOT (значения полей `image` и `processed_image`).
+    :type names: list
+    :return: Количество удалённых файлов.
+    :rtype: int
+    """
+    removed = 0
+    for name in names:
+        if not name:
+            continue
+        try:
+            if default_storage.exists(name):
+                default_storage.delete(name)
+                removed += 1
+        except OSError as e:
+            # Файл останется на диске и будет удалён следующим проходом sweep_orphaned_media
+            logger.warning(f"Failed to delete media file {name}: {e}")
+    return removed
+
+
+def schedule_media_deletion(names):
+    """
+    Планирует фоновое удаление файлов после фиксации текущей транзакции.
+
+    Если транзакция будет откачена, файлы не удаляются.
+
+    :param names: Имена файлов относительно MEDIA_ROOT.
+    :type names: list
+    """
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: _enqueue_media_deletion(names))
+
+
+def _enqueue_media_deletion(names):
+    """Передаёт удаление файлов Celery-воркеру, а при недоступности брокера удаляет файлы сразу."""
+    from .tasks import delete_media_files_task
+
+    try:
+        delete_media_files_task.delay(names)
+    except Exception as e:
+        logger.warning(f"Celery is unavailable, deleting {len(names)} media files synchronously: {e}")
+        delete_media_files(names)
+
+
+def referenced_media_names():
+    """
+    Возвращает множество имён файлов, на которые ссылаются записи ImageFeed.
+
+    :rtype: set
+    """
+    from .models import ImageFeed
+
+    names = set()
+    rows = ImageFeed.objects.values_list('image', 'working_image', 'processed_image').iterator(chunk_size=2000)
+    for row in rows:
+        names.update(name for name in row if name)
+    return names
+
+
+def sweep_orphaned_media(grace_seconds=None, dry_run=False):
+    """
+    Удаляет из MEDIA_ROOT файлы, на которые не ссылается ни одна запись ImageFeed.
+
+    Файлы моложе `grace_seconds` не трогаются: загрузка сохраняет файл до фиксации записи в базе данных.
+
+    :param grace_seconds: Минимальный возраст файла в секундах. По умолчанию MEDIA_SWEEP_GRACE_SECONDS.
+    :type grace_seconds: int
+    :param dry_run: Только найти файлы-сироты, не удаляя их.
+    :type dry_run: bool
+    :return: Список имён найденных (или удалённых) файлов-сирот.
+    :rtype: list
+    """
+    if grace_seconds is None:
+        grace_seconds = getattr(settings, 'MEDIA_SWEEP_GRACE_SECONDS', 3600)
+    media_root = str(settings.MEDIA_ROOT)
+    cutoff = time.time() - grace_seconds
+    referenced = referenced_media_names()
+
+    orphans = []
+    for subdir in MEDIA_SUBDIRS:
+        for dirpath, _dirnames, filenames in os.walk(os.path.join(media_root, subdir)):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, media_root).replace(os.sep, '/')
+                if name in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                except OSError:
+                    continue
+                orphans.append(name)
+
+    if not dry_run:
+        delete_media_files(orphans)
+    logger.info(f"Media sweep found {len(orphans)} orphaned files (dry_run={dry_run})")
+    return orphans
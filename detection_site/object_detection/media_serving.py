@@ -0,0 +1,178 @@
+"""
+Отдача медиафайлов (загруженных и обработанных изображений) с кэшированием на стороне клиента.
+
+Описание работы модуля:
+    1. serve_media(request, path):
+        - Представление для MEDIA_URL вместо `django.conf.urls.static.static`, которое отдаёт файлы только
+        при DEBUG и без заголовков кэширования. Ответ содержит строгий ETag и Last-Modified; условные запросы
+        (If-None-Match, If-Modified-Since) получают 304 без чтения файла, запросы Range - 206 с запрошенной частью.
+    2. Передача отдачи файла фронтенд-серверу (MEDIA_SENDFILE_BACKEND):
+        - 'x-accel-redirect' (nginx) или 'x-sendfile' (Apache mod_xsendfile): Django только проверяет файл
+        и условные заголовки, а содержимое (включая Range) отдаёт фронтенд-сервер.
+    3. content_hashed_name(name, content, extension):
+        - Имя файла с хэшем содержимого. Обработанные изображения сохраняются под такими именами: файл с этим
+        именем никогда не меняется, поэтому отдаётся с Cache-Control immutable и долгим max-age, а новая
+        обработка получает новое имя (и новый URL).
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Имя с хэшем содержимого: <имя>.<16 шестнадцатеричных символов>[_<суффикс хранилища>].<расширение>
+HASHED_NAME_RE = re.compile(r'\.(?P<hash>[0-9a-f]{16})(?:_[A-Za-z0-9]{7})?\.\w+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def content_hashed_name(name, content, extension=None):
+    """
+    Возвращает имя файла с хэшем содержимого перед расширением.
+
+    :param name: Исходное имя файла (каталог отбрасывается).
+    :type name: str
+    :param content: Содержимое файла.
+    :type content: bytes
+    :param extension: Расширение нового имени (с точкой); по умолчанию - расширение исходного имени.
+    :type extension: str
+    :return: Имя вида `photo.0123456789abcdef.jpg`.
+    :rtype: str
+    """
+    stem, original_extension = os.path.splitext(os.path.basename(name))
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    return f'{stem}.{digest}{extension or original_extension}'
+
+
+def _parse_range(header, size):
+    """
+    Разбирает заголовок Range с одним диапазоном байтов.
+
+    :return: Кортеж (начало, конец) включительно или None, если заголовок не поддерживается
+        (тогда отдаётся весь файл).
+    :raises ValueError: Если диапазон не пересекается с файлом (ответ 416).
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            raise ValueError('Range not satisfiable')
+        if end < start:
+            return None
+        return start, end
+    # Последние N байтов файла
+    suffix = int(last)
+    if suffix == 0 or size == 0:
+        raise ValueError('Range not satisfiable')
+    return max(0, size - suffix), size - 1
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _cache_control(path):
+    """Заголовок Cache-Control: файлы с хэшем содержимого в имени неизменны."""
+    if HASHED_NAME_RE.search(path):
+        return f"public, max-age={getattr(settings, 'MEDIA_IMMUTABLE_MAX_AGE', 31536000)}, immutable"
+    return getattr(settings, 'MEDIA_CACHE_CONTROL', 'no-cache')
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдаёт файл из MEDIA_ROOT с заголовками ETag, Last-Modified, Cache-Control и поддержкой Range.
+
+    :param request: HTTP запрос (GET или HEAD).
+    :type request: HttpRequest
+    :param path: Путь к файлу относительно MEDIA_ROOT.
+    :type path: str
+    :return: HTTP ответ с файлом (200 или 206), 304 для неизменённого файла или 416 для неверного диапазона.
+    :rtype: HttpResponse
+    :raises Http404: Если файл не найден или путь выходит за пределы MEDIA_ROOT.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    hashed = HASHED_NAME_RE.search(path)
+    # Строгий ETag: хэш содержимого из имени файла или размер и время изменения (как у nginx)
+    etag = f'"{hashed.group("hash")}"' if hashed else f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = int(stat.st_mtime)
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    def finish(response):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Cache-Control'] = _cache_control(path)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+    if backend == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = (getattr(settings, 'MEDIA_X_ACCEL_PREFIX', '/protected-media/')
+                                                + quote(path))
+        return finish(response)
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Sendfile'] = full_path
+        return finish(response)
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # If-Range: часть файла отдаётся, только если файл не изменился с момента получения клиентом его начала
+    if range_header and (not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return finish(response)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response.headers['Content-Length'] = str(size)
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(full_path, start, end - start + 1), status=206,
+                                         content_type=content_type)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.headers['Content-Length'] = str(end - start + 1)
+    return finish(response)
@@ -0,0 +1,150 @@
+"""
+Ограничение и учёт памяти при обработке изображений.
+
+Описание работы модуля:
+    1. Режим ограниченной памяти (INFERENCE_MEMORY_BUDGET):
+        - max_input_size(model_name) возвращает предельный размер входа модели из INFERENCE_MAX_INPUT_SIZE;
+        функции обработки уменьшают изображение до этого размера перед подачей в модель;
+        - release_memory() после обработки собирает мусор и возвращает освобождённую память аллокатора
+        операционной системе (malloc_trim в glibc), чтобы RSS воркера не оставался на уровне пика.
+    2. track_memory:
+        - Декоратор функций обработки: записывает длительность, RSS до и после обработки, пиковый RSS
+        (счётчик VmHWM сбрасывается перед обработкой через /proc/self/clear_refs) и, при MEMORY_TRACEMALLOC,
+        пик Python-аллокаций по tracemalloc. Результат сохраняется в InferenceMemoryRecord.
+    3. Перезапуск воркеров Celery, превысивших лимит памяти, выполняет сам Celery
+    (CELERY_WORKER_MAX_MEMORY_PER_CHILD в settings.py).
+"""
+import ctypes
+import functools
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .db import detection_writer
+from .models import InferenceMemoryRecord
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def memory_budget_enabled():
+    """Включён ли режим ограниченной памяти."""
+    return getattr(settings, 'INFERENCE_MEMORY_BUDGET', True)
+
+
+def max_input_size(model_name):
+    """
+    Предельный размер большей стороны входа модели в режиме ограниченной памяти.
+
+    :param model_name: Модель (DetectedObject.MODEL_*).
+    :type model_name: str
+    :return: Размер в пикселях или None, если ограничения нет.
+    :rtype: int
+    """
+    if not memory_budget_enabled():
+        return None
+    return getattr(settings, 'INFERENCE_MAX_INPUT_SIZE', {}).get(model_name)
+
+
+def _read_status():
+    """Текущий и пиковый RSS процесса в МБ по /proc/self/status (Linux); (None, None), если недоступно."""
+    values = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    values[key] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+def _reset_peak_rss():
+    """Сбрасывает счётчик пикового RSS процесса (Linux 4.0+). Возвращает True, если удалось."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+_libc = None
+
+
+def release_memory():
+    """Собирает мусор и возвращает свободную память аллокатора glibc операционной системе."""
+    global _libc
+    gc.collect()
+    if not sys.platform.startswith('linux'):
+        return
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL('libc.so.6')
+        _libc.malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def track_memory(func):
+    """
+    Декоратор функции обработки `func(image_feed_id)`: записывает потребление памяти в InferenceMemoryRecord,
+    а в режиме ограниченной памяти после обработки вызывает release_memory().
+
+    Пиковый RSS относится ко всему процессу: при нескольких одновременных обработках в одном процессе
+    (потоки веб-сервера) он включает и чужие обработки.
+    """
+    @functools.wraps(func)
+    def wrapper(image_feed_id, *args, **kwargs):
+        tracking = getattr(settings, 'MEMORY_TRACKING', True)
+        traced_before = peak_reset = rss_before = None
+        if tracking:
+            if getattr(settings, 'MEMORY_TRACEMALLOC', False) and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if tracemalloc.is_tracing():
+                traced_before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            peak_reset = _reset_peak_rss()
+            rss_before, _ = _read_status()
+        start = time.perf_counter()
+        try:
+            return func(image_feed_id, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            # Локальные массивы и тензоры функции уже освобождены: память аллокатора возвращается системе
+            if memory_budget_enabled():
+                release_memory()
+            if rss_before is not None:
+                rss_after, peak = _read_status()
+                if not peak_reset:
+                    # Без сброса VmHWM - пик за всё время процесса, он не относится к этой обработке
+                    peak = max(rss_before, rss_after)
+                traced_peak = None
+                if traced_before is not None and tracemalloc.is_tracing():
+                    traced_peak = (tracemalloc.get_traced_memory()[1] - traced_before) / MB
+                _record(func.__name__, image_feed_id, seconds, rss_before, rss_after, peak, traced_peak)
+
+    return wrapper
+
+
+def _record(name, image_feed_id, seconds, rss_before, rss_after, peak, traced_peak):
+    """Сохраняет замер памяти и предупреждает о превышении INFERENCE_MEMORY_WARNING_MB."""
+    logger.info(f"{name}({image_feed_id}): {seconds:.2f}s, RSS {rss_before:.0f} -> {rss_after:.0f} MB, "
+                f"peak {peak:.0f} MB" + (f", tracemalloc peak +{traced_peak:.1f} MB" if traced_peak is not None else ''))
+    warning_mb = getattr(settings, 'INFERENCE_MEMORY_WARNING_MB', None)
+    if warning_mb and peak > warning_mb:
+        logger.warning(f"{name}({image_feed_id}) peaked at {peak:.0f} MB, over {warning_mb} MB")
+    try:
+        detection_writer.run(lambda: InferenceMemoryRecord.objects.create(
+            name=name, image_feed_id=image_feed_id, seconds=seconds, rss_before_mb=rss_before,
+            rss_after_mb=rss_after, peak_rss_mb=peak, tracemalloc_peak_mb=traced_peak))
+    except DatabaseError as e:
+        # Например, изображение удалено во время обработки
+        logger.warning(f"Failed to record memory usage of {name}({image_feed_id}): {e}")
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0002_imagefeed_processed_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefeed',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
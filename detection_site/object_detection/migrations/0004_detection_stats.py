@@ -0,0 +1,63 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_detection_stats(apps, schema_editor):
+    """Заполняет DetectionStat по уже существующим объектам DetectedObject."""
+    DetectedObject = apps.get_model('object_detection', 'DetectedObject')
+    DetectionStat = apps.get_model('object_detection', 'DetectionStat')
+    rows = (DetectedObject.objects
+            .annotate(day=TruncDate('created_at'))
+            .values('image_feed__user_id', 'object_type', 'model_name', 'day')
+            .annotate(count=Count('id'), confidence_sum=Sum('confidence'))
+            .order_by())
+    DetectionStat.objects.bulk_create([
+        DetectionStat(user_id=row['image_feed__user_id'], object_type=row['object_type'],
+                      model_name=row['model_name'], day=row['day'],
+                      count=row['count'], confidence_sum=row['confidence_sum'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0003_imagefeed_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectedobject',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='detectedobject',
+            name='model_name',
+            field=models.CharField(blank=True, choices=[('mobilenet_ssd', 'MobileNet SSD'), ('detr_resnet50', 'DETR ResNet-50')], default='', max_length=50),
+        ),
+        migrations.CreateModel(
+            name='DetectionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=100)),
+                ('model_name', models.CharField(blank=True, choices=[('mobilenet_ssd', 'MobileNet SSD'), ('detr_resnet50', 'DETR ResNet-50')], default='', max_length=50)),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detection_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='detectionstat',
+            constraint=models.UniqueConstraint(fields=('user', 'object_type', 'model_name', 'day'), name='unique_detection_stat'),
+        ),
+        migrations.RunPython(build_detection_stats, migrations.RunPython.noop),
+    ]
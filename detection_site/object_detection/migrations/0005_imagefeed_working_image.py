@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0004_detection_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefeed',
+            name='working_image',
+            field=models.ImageField(blank=True, null=True, upload_to='images/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0005_imagefeed_working_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefeed',
+            name='phash',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
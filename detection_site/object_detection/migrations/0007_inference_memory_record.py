@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0006_imagefeed_phash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InferenceMemoryRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('seconds', models.FloatField()),
+                ('rss_before_mb', models.FloatField()),
+                ('rss_after_mb', models.FloatField()),
+                ('peak_rss_mb', models.FloatField()),
+                ('tracemalloc_peak_mb', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('image_feed', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='memory_records', to='object_detection.imagefeed')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0007_inference_memory_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawDetections',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(choices=[('mobilenet_ssd', 'MobileNet SSD'), ('detr_resnet50', 'DETR ResNet-50')], max_length=50)),
+                ('labels', models.JSONField(default=list)),
+                ('data', models.BinaryField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('min_score', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('image_feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='raw_detections', to='object_detection.imagefeed')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rawdetections',
+            constraint=models.UniqueConstraint(fields=('image_feed', 'model_name'), name='unique_raw_detections'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.4 on 2026-10-19 11:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0008_raw_detections'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InferenceJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ssd', 'MobileNet SSD'), ('detr', 'DETR ResNet-50'), ('multi', 'MobileNet SSD + DETR')], max_length=10)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка'), ('rejected', 'Отклонено')], default='queued', max_length=10)),
+                ('cost', models.FloatField(default=0.0)),
+                ('finish_tag', models.FloatField(db_index=True, default=0.0)),
+                ('tat', models.FloatField(default=0.0)),
+                ('not_before', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('image_feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inference_jobs', to='object_detection.imagefeed')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inference_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'finish_tag'], name='inference_job_queue'), models.Index(fields=['user', 'status'], name='inference_job_user_status')],
+            },
+        ),
+    ]
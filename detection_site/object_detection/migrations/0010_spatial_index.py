@@ -0,0 +1,46 @@
+# Generated by Django 5.0.4 on 2026-10-19 11:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0009_inference_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectedobject',
+            name='x_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detectedobject',
+            name='x_min',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detectedobject',
+            name='y_max',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='detectedobject',
+            name='y_min',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='DetectionCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=100)),
+                ('cell', models.PositiveSmallIntegerField()),
+                ('detected_object', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='object_detection.detectedobject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['object_type', 'cell'], name='detection_cell_lookup')],
+            },
+        ),
+    ]
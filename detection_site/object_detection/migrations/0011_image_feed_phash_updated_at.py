@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('object_detection', '0010_spatial_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagefeed',
+            name='phash_updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
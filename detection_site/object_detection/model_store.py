@@ -0,0 +1,320 @@
+"""
+Локальное хранилище артефактов моделей с закреплёнными версиями и проверкой контрольных сумм.
+
+Описание работы модуля:
+    1. Артефакты описываются в настройке MODEL_ARTIFACTS и хранятся в MODEL_STORE_ROOT/<имя артефакта>/
+    вместе с файлом manifest.json (версия снимка и SHA-256 каждого файла).
+    2. install_artifact(name, source):
+        - Единственная операция, которой нужен доступ к сети: скачивает закреплённую ревизию с Hugging Face Hub
+        (или копирует файлы из локального каталога), при необходимости конвертирует веса в safetensors
+        и записывает manifest.json. Вызывается management-командой install_model_artifacts.
+    3. verify_artifact(name):
+        - Проверяет размеры и контрольные суммы файлов по manifest.json (один раз на процесс).
+    4. load_safetensors_mmap(path):
+        - Отображает файл safetensors в память без копирования весов: несколько процессов используют
+        одни и те же страницы файлового кэша.
+    5. get_mobilenet_ssd(), get_detr():
+        - Загружают модели строго из локального хранилища (без обращения к сети) и кэшируют их в процессе.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class ModelStoreError(Exception):
+    """Артефакт модели отсутствует в хранилище или не прошёл проверку."""
+
+
+def _spec(name):
+    """Описание артефакта из настройки MODEL_ARTIFACTS."""
+    try:
+        return settings.MODEL_ARTIFACTS[name]
+    except KeyError:
+        raise ModelStoreError(f"Unknown model artifact: {name}")
+
+
+def artifact_dir(name):
+    """Каталог артефакта в хранилище."""
+    return Path(settings.MODEL_STORE_ROOT) / name
+
+
+def file_sha256(path):
+    """
+    Вычисляет SHA-256 файла, читая его блоками.
+
+    :param path: Путь к файлу.
+    :return: Шестнадцатеричная строка контрольной суммы.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(name):
+    """
+    Читает manifest.json артефакта.
+
+    :raises ModelStoreError: Если артефакт не установлен.
+    :rtype: dict
+    """
+    manifest_path = artifact_dir(name) / MANIFEST_NAME
+    if not manifest_path.exists():
+        raise ModelStoreError(
+            f"Model artifact '{name}' is not installed in {artifact_dir(name)}. "
+            f"Run: python manage.py install_model_artifacts {name}")
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def install_artifact(name, source=None):
+    """
+    Устанавливает артефакт в хранилище и записывает manifest.json.
+
+    :param name: Имя артефакта из MODEL_ARTIFACTS.
+    :type name: str
+    :param source: Локальный каталог с файлами артефакта. Если не указан, используется `source` из описания
+        артефакта, а для артефактов с `repo_id` - скачивание закреплённой ревизии с Hugging Face Hub.
+    :return: Содержимое manifest.json.
+    :rtype: dict
+    :raises ModelStoreError: Если файлы не найдены или контрольная сумма не совпадает с закреплённой.
+    """
+    spec = _spec(name)
+    target = artifact_dir(name)
+    target.mkdir(parents=True, exist_ok=True)
+    source = source or spec.get('source')
+    revision = spec.get('revision')
+
+    with tempfile.TemporaryDirectory(dir=target.parent) as tmp:
+        if source:
+            source_dir = Path(source)
+        elif spec.get('repo_id'):
+            from huggingface_hub import HfApi, snapshot_download
+
+            # Ревизия-ветка разрешается в конкретный коммит, который и записывается в manifest.json
+            revision = HfApi().model_info(spec['repo_id'], revision=revision).sha
+            snapshot_download(spec['repo_id'], revision=revision, local_dir=tmp,
+                              allow_patterns=list(spec['files']) + ['pytorch_model.bin'])
+            source_dir = Path(tmp)
+        else:
+            raise ModelStoreError(f"No source for model artifact '{name}'")
+
+        sources = {filename: source_dir / filename for filename in spec['files']}
+        if 'model.safetensors' in sources and not sources['model.safetensors'].exists():
+            converted = Path(tmp) / 'converted.safetensors'
+            _convert_to_safetensors(source_dir / 'pytorch_model.bin', converted)
+            sources['model.safetensors'] = converted
+
+        files = {}
+        for filename, src in sources.items():
+            if not src.exists():
+                raise ModelStoreError(f"File {src} for model artifact '{name}' not found")
+            digest = file_sha256(src)
+            expected = spec.get('sha256', {}).get(filename)
+            if expected and expected != digest:
+                raise ModelStoreError(f"Checksum mismatch for {filename}: expected {expected}, got {digest}")
+            # Копия во временный файл и атомарная замена, чтобы работающие процессы не увидели частичный файл
+            tmp_file = target / f'.{filename}.tmp'
+            shutil.copyfile(src, tmp_file)
+            os.replace(tmp_file, target / filename)
+            files[filename] = {'sha256': digest, 'size': (target / filename).stat().st_size}
+
+    manifest = {'name': name, 'repo_id': spec.get('repo_id'), 'revision': revision, 'files': files}
+    with open(target / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    _verified.pop(name, None)
+    return manifest
+
+
+def _convert_to_safetensors(bin_path, safetensors_path):
+    """Конвертирует веса PyTorch (pickle) в формат safetensors."""
+    import torch
+    from safetensors.torch import save_file
+
+    if not bin_path.exists():
+        raise ModelStoreError(f"Neither model.safetensors nor {bin_path.name} found")
+    state_dict = torch.load(bin_path, map_location='cpu', weights_only=True)
+    save_file({key: tensor.contiguous() for key, tensor in state_dict.items()}, str(safetensors_path),
+              metadata={'format': 'pt'})
+
+
+# Проверенные в этом процессе артефакты: {имя: {имя файла: (размер, mtime_ns)}}
+_verified = {}
+_verify_lock = threading.Lock()
+
+
+def verify_artifact(name):
+    """
+    Проверяет файлы артефакта по manifest.json и возвращает каталог артефакта.
+
+    Контрольные суммы вычисляются один раз на процесс; повторная проверка выполняется,
+    только если размер или время изменения файла изменились.
+
+    :param name: Имя артефакта.
+    :type name: str
+    :return: Каталог артефакта.
+    :rtype: Path
+    :raises ModelStoreError: Если файл отсутствует или контрольная сумма не совпадает.
+    """
+    directory = artifact_dir(name)
+    manifest = read_manifest(name)
+    check_sums = getattr(settings, 'MODEL_STORE_VERIFY_CHECKSUMS', True)
+    expected_pins = _spec(name).get('sha256', {})
+
+    with _verify_lock:
+        known = _verified.setdefault(name, {})
+        for filename, info in manifest['files'].items():
+            path = directory / filename
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                raise ModelStoreError(f"Model file {path} is missing")
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if known.get(filename) == signature:
+                continue
+            if stat.st_size != info['size']:
+                raise ModelStoreError(f"Model file {path} has size {stat.st_size}, expected {info['size']}")
+            pinned = expected_pins.get(filename)
+            if pinned and pinned != info['sha256']:
+                raise ModelStoreError(f"Manifest checksum for {filename} does not match the pinned checksum")
+            if check_sums and file_sha256(path) != info['sha256']:
+                raise ModelStoreError(f"Checksum mismatch for model file {path}")
+            known[filename] = signature
+    return directory
+
+
+# Типы данных safetensors -> имена типов torch
+_SAFETENSORS_DTYPES = {
+    'F64': 'float64', 'F32': 'float32', 'F16': 'float16', 'BF16': 'bfloat16',
+    'I64': 'int64', 'I32': 'int32', 'I16': 'int16', 'I8': 'int8', 'U8': 'uint8', 'BOOL': 'bool',
+}
+
+
+def load_safetensors_mmap(path):
+    """
+    Загружает тензоры из файла safetensors без копирования весов в память процесса.
+
+    Файл отображается в память в режиме copy-on-write: пока веса не изменяются (инференс),
+    страницы файлового кэша общие для всех процессов, загрузивших тот же файл.
+
+    :param path: Путь к файлу safetensors.
+    :return: Словарь {имя тензора: тензор}.
+    :rtype: dict
+    """
+    import torch
+
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for key, info in header.items():
+        if key == '__metadata__':
+            continue
+        dtype = getattr(torch, _SAFETENSORS_DTYPES[info['dtype']])
+        begin, end = info['data_offsets']
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        count = (end - begin) // itemsize
+        offset = data_start + begin
+        if count == 0:
+            tensor = torch.empty(info['shape'], dtype=dtype)
+        elif offset % itemsize:
+            # Невыровненные данные копируются
+            tensor = torch.frombuffer(bytearray(buffer[offset:offset + end - begin]), dtype=dtype)
+        else:
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        tensors[key] = tensor.reshape(info['shape'])
+    return tensors
+
+
+def _enable_offline_mode():
+    """Запрещает библиотекам Hugging Face обращаться к сети."""
+    os.environ['HF_HUB_OFFLINE'] = '1'
+    os.environ['TRANSFORMERS_OFFLINE'] = '1'
+
+
+_thread_local = threading.local()
+
+
+def get_mobilenet_ssd():
+    """
+    Возвращает сеть MobileNet SSD, загруженную из хранилища.
+
+    Сеть OpenCV не потокобезопасна, поэтому у каждого потока своя копия.
+
+    :return: Сеть OpenCV DNN.
+    """
+    net = getattr(_thread_local, 'mobilenet_ssd', None)
+    if net is None:
+        import cv2
+
+        directory = verify_artifact('mobilenet_ssd')
+        files = _spec('mobilenet_ssd')['files']
+        net = cv2.dnn.readNetFromCaffe(str(directory / files[0]), str(directory / files[1]))
+        _thread_local.mobilenet_ssd = net
+    return net
+
+
+_detr = None
+_detr_lock = threading.Lock()
+
+
+def get_detr():
+    """
+    Возвращает процессор изображений и модель DETR, загруженные из хранилища.
+
+    Веса отображаются в память (см. load_safetensors_mmap). Если структура весов не совпадает с моделью
+    текущей версии transformers, используется стандартная загрузка `from_pretrained` из того же каталога.
+
+    :return: Кортеж (DetrImageProcessor, DetrForObjectDetection).
+    :rtype: tuple
+    """
+    global _detr
+    with _detr_lock:
+        if _detr is None:
+            _detr = _load_detr(mmap_weights=getattr(settings, 'MODEL_STORE_MMAP', True))
+        return _detr
+
+
+def _load_detr(mmap_weights=True):
+    """Загружает DETR из хранилища строго без обращения к сети."""
+    _enable_offline_mode()
+    import torch
+    from transformers import DetrConfig, DetrForObjectDetection, DetrImageProcessor
+
+    directory = verify_artifact('detr_resnet50')
+    processor = DetrImageProcessor.from_pretrained(directory, local_files_only=True)
+    model = None
+    if mmap_weights:
+        config = DetrConfig.from_pretrained(directory, local_files_only=True)
+        with torch.device('meta'):
+            model = DetrForObjectDetection(config)
+        state_dict = load_safetensors_mmap(directory / 'model.safetensors')
+        result = model.load_state_dict(state_dict, strict=False, assign=True)
+        on_meta = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+                   if tensor.is_meta]
+        if result.missing_keys or result.unexpected_keys or on_meta:
+            logger.warning(f"DETR weights do not match the model layout (missing: {len(result.missing_keys)}, "
+                           f"unexpected: {len(result.unexpected_keys)}), falling back to from_pretrained")
+            model = None
+    if model is None:
+        model = DetrForObjectDetection.from_pretrained(directory, local_files_only=True)
+    model.eval()
+    return processor, model
@@ -1,5 +1,48 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
+
+from .media_cleanup import schedule_media_deletion
+
+
+class ImageFeedQuerySet(models.QuerySet):
+    """
+    QuerySet для ImageFeed, который при массовом удалении не оставляет файлы-сироты.
+
+    Стандартный `QuerySet.delete()` не вызывает `ImageFeed.delete()`, поэтому файлы изображений оставались на диске.
+    """
+
+    def delete(self):
+        """
+        Удаляет записи пакетами по IMAGE_FEED_DELETE_BATCH_SIZE и передаёт их файлы фоновому удалению.
+
+        :return: Общее количество удалённых объектов и количество по каждой модели, как у `QuerySet.delete()`.
+        :rtype: tuple
+        """
+        batch_size = getattr(settings, 'IMAGE_FEED_DELETE_BATCH_SIZE', 500)
+        pks = list(self.values_list('pk', flat=True))
+        total = 0
+        per_model = {}
+        for start in range(0, len(pks), batch_size):
+            batch = self.model._base_manager.filter(pk__in=pks[start:start + batch_size])
+            with transaction.atomic():
+                names = []
+                for image, working_image, processed_image in batch.values_list(
+                        'image', 'working_image', 'processed_image'):
+                    names.extend([image, working_image, processed_image])
+                # Удаляемые объекты вычитаются из статистики в той же транзакции
+                from .stats import subtract_detection_stats
+                subtract_detection_stats(DetectedObject.objects.filter(image_feed__in=batch))
+                deleted, counts = models.QuerySet.delete(batch)
+                schedule_media_deletion(names)
+            total += deleted
+            for label, count in counts.items():
+                per_model[label] = per_model.get(label, 0) + count
+        return total, per_model
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class ImageFeed(models.Model):
     """
@@ -8,7 +51,11 @@ class ImageFeed(models.Model):
     Attributes:
         user (ForeignKey): Пользователь, загрузивший изображение. Связан с моделью пользователя (AUTH_USER_MODEL).
         image (ImageField): Загруженное изображение.
+        working_image (ImageField, optional): Нормализованная рабочая копия изображения для обработки.
         processed_image (ImageField, optional): Обработанное изображение. Может быть пустым или отсутствовать.
+        version (PositiveIntegerField): Версия результатов обработки, увеличивается при каждой обработке.
+        phash (BigIntegerField, optional): Перцептивный хэш рабочей копии для поиска почти одинаковых изображений.
+        phash_updated_at (DateTimeField, optional): Время записи перцептивного хэша.
     """
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -20,10 +67,30 @@ class ImageFeed(models.Model):
     # image: Поле `ImageField` для хранения загруженного изображения. Атрибут `upload_to='images/'` указывает,
     # что файлы будут сохраняться в папке images/.
 
+    working_image = models.ImageField(upload_to='images/', null=True, blank=True)
+    # working_image: Рабочая копия изображения рядом с оригиналом (папка `images/`): ориентация из EXIF применена,
+    # размер ограничен IMAGE_WORKING_MAX_DIMENSION. Функции обработки читают её вместо оригинала (см. uploads.py).
+
     processed_image = models.ImageField(upload_to='processed_images/', null=True, blank=True)
     # processed_image: Поле `ImageField` для хранения обработанной версии загруженного изображения.
     # Может быть пустым (null=True, blank=True). Файлы сохраняются в папке `processed_images/`.
 
+    version = models.PositiveIntegerField(default=0)
+    # version: Версия результатов обработки изображения. Функции обработки увеличивают её после записи результатов
+    # (см. caching.bump_feed_version), а кэш панели управления использует её в ключах.
+
+    phash = models.BigIntegerField(null=True, blank=True, db_index=True)
+    # phash: 64-битный перцептивный хэш рабочей копии (хранится как знаковое число). По нему функции обработки
+    # находят почти одинаковые изображения и повторно используют их результаты (см. near_duplicates.py).
+
+    phash_updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # phash_updated_at: Время записи `phash`. По нему индексы процессов догружают хэши, вычисленные другими
+    # процессами для ранее загруженных изображений (см. NearDuplicateIndex).
+
+    objects = ImageFeedQuerySet.as_manager()
+    # objects: Менеджер на основе `ImageFeedQuerySet`, чтобы `ImageFeed.objects.filter(...).delete()`
+    # удалял записи пакетами и не оставлял файлы на диске.
+
     def __str__(self):
         """Возвращает строковое представление объекта"""
         # Метод `__str__`: Возвращает строку, содержащую имя пользователя и имя файла изображения.
@@ -32,18 +99,49 @@ class ImageFeed(models.Model):
 
     def delete(self, *args, **kwargs):
         """
-        Удаляет изображение и его обработанную версию перед удалением записи из базы данных.
+        Удаляет запись из базы данных и передаёт изображение и его обработанную версию фоновому удалению.
 
         Args:
             *args: Дополнительные позиционные аргументы.
             **kwargs: Дополнительные именованные аргументы.
         """
-        # Метод `delete`: Переопределяет метод удаления, чтобы удалить файлы изображений с диска перед удалением записи из базы данных
+        # Метод `delete`: Переопределяет метод удаления, чтобы файлы изображений были удалены с диска
+        # фоновой задачей после фиксации транзакции, а не во время запроса.
+
+        names = [self.image.name,
+                 self.working_image.name if self.working_image else None,
+                 self.processed_image.name if self.processed_image else None]
+        from .stats import subtract_detection_stats
+
+        with transaction.atomic():
+            subtract_detection_stats(self.detected_objects.all())
+            result = super().delete(*args, **kwargs)
+            schedule_media_deletion(names)
+        return result
+
+class DetectedObjectQuerySet(models.QuerySet):
+    """
+    QuerySet для DetectedObject, который при массовом удалении вычитает объекты из сводной статистики.
+
+    Стандартный `QuerySet.delete()` не вызывает `DetectedObject.delete()`, поэтому DetectionStat расходилась
+    с таблицей объектов (удаление из административной панели, `DetectedObject.objects.filter(...).delete()`).
+    """
+
+    def delete(self):
+        """
+        Вычитает объекты из DetectionStat и удаляет их в одной транзакции.
+
+        :return: Общее количество удалённых объектов и количество по каждой модели, как у `QuerySet.delete()`.
+        :rtype: tuple
+        """
+        from .stats import subtract_detection_stats
+        with transaction.atomic():
+            subtract_detection_stats(self)
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
-        self.image.delete(save=False)
-        if self.processed_image:
-            self.processed_image.delete(save=False)
-        super().delete(*args, **kwargs)
 
 class DetectedObject(models.Model):
     """
@@ -54,7 +152,18 @@ class DetectedObject(models.Model):
         object_type (CharField): Тип обнаруженного объекта.
         confidence (FloatField): Уверенность в обнаружении объекта (в диапазоне от 0 до 1).
         location (CharField): Местоположение обнаруженного объекта на изображении.
+        model_name (CharField): Модель, обнаружившая объект.
+        created_at (DateTimeField): Время обнаружения объекта.
+        x_min, y_min, x_max, y_max (FloatField, optional): Рамка объекта в долях ширины и высоты рабочей копии
+            (от 0 до 1); по ним строится пространственный индекс DetectionCell (см. spatial.py).
     """
+    MODEL_MOBILENET_SSD = 'mobilenet_ssd'
+    MODEL_DETR = 'detr_resnet50'
+    MODEL_CHOICES = [
+        (MODEL_MOBILENET_SSD, 'MobileNet SSD'),
+        (MODEL_DETR, 'DETR ResNet-50'),
+    ]
+
     image_feed = models.ForeignKey(ImageFeed, related_name='detected_objects', on_delete=models.CASCADE)
     # image_feed: Поле `ForeignKey` связывает `DetectedObject` с `ImageFeed`.
     # `related_name='detected_objects'` позволяет получить все обнаруженные объекты для конкретного ImageFeed
@@ -69,8 +178,230 @@ class DetectedObject(models.Model):
     location = models.CharField(max_length=255)
     # location: Поле `CharField` для хранения местоположения объекта на изображении в виде строки.
 
+    model_name = models.CharField(max_length=50, choices=MODEL_CHOICES, blank=True, default='')
+    # model_name: Модель, обнаружившая объект. Пусто для объектов, записанных до появления этого поля.
+
+    created_at = models.DateTimeField(default=timezone.now)
+    # created_at: Время обнаружения объекта. По нему объекты группируются по дням в DetectionStat.
+
+    x_min = models.FloatField(null=True, blank=True)
+    y_min = models.FloatField(null=True, blank=True)
+    x_max = models.FloatField(null=True, blank=True)
+    y_max = models.FloatField(null=True, blank=True)
+    # x_min, y_min, x_max, y_max: Нормализованная рамка объекта, заполняется при записи (см. spatial.normalize_boxes).
+    # Пусто, если размер изображения неизвестен; для старых записей заполняется командой rebuild_spatial_index.
+
+    objects = DetectedObjectQuerySet.as_manager()
+    # objects: Менеджер на основе `DetectedObjectQuerySet`, чтобы `DetectedObject.objects.filter(...).delete()`
+    # обновлял сводную статистику.
+
+    def delete(self, *args, **kwargs):
+        """Удаляет объект, вычитая его из сводной статистики в той же транзакции."""
+        from .stats import subtract_detection_stats
+        with transaction.atomic():
+            subtract_detection_stats(DetectedObject.objects.filter(pk=self.pk))
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         """Возвращает строковое представление объекта."""
         # __str__: Возвращает строку, содержащую тип объекта, уровень уверенности и имя файла изображения,
         # на котором обнаружен объект.
         return f"{self.object_type} ({self.confidence * 100}%) on {self.image_feed.image.name}"
+
+
+class DetectionCell(models.Model):
+    """
+    Пространственный индекс обнаруженных объектов: ячейки сетки SPATIAL_GRID_SIZE x SPATIAL_GRID_SIZE,
+    которые пересекает рамка объекта (см. spatial.py).
+
+    Запрос по области кадра читает только строки ячеек, пересекающих область, для нужной метки
+    и проверяет точное перекрытие лишь у найденных объектов, а не разбирает `location` всех объектов.
+
+    Attributes:
+        detected_object (ForeignKey): Обнаруженный объект.
+        object_type (CharField): Тип объекта (копия DetectedObject.object_type для индекса по метке и ячейке).
+        cell (PositiveSmallIntegerField): Номер ячейки: строка * SPATIAL_GRID_SIZE + столбец.
+    """
+    detected_object = models.ForeignKey(DetectedObject, related_name='cells', on_delete=models.CASCADE)
+    object_type = models.CharField(max_length=100)
+    cell = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['object_type', 'cell'], name='detection_cell_lookup'),
+        ]
+
+    def __str__(self):
+        """Возвращает строковое представление объекта."""
+        return f"{self.object_type} #{self.detected_object_id}: cell {self.cell}"
+
+
+class RawDetections(models.Model):
+    """
+    Полный вывод модели для изображения: все кандидаты с уверенностью выше RAW_DETECTIONS_MIN_SCORE,
+    а не только прошедшие рабочий порог (см. raw_detections.py).
+
+    По этой записи представления и выгрузка фильтруют обнаружения по любому порогу и набору классов
+    без повторного запуска модели. Одна запись на изображение и модель, повторная обработка её заменяет.
+
+    Attributes:
+        image_feed (ForeignKey): Обработанное изображение.
+        model_name (CharField): Модель, выдавшая кандидатов.
+        labels (JSONField): Метки классов; записи кандидатов ссылаются на них по индексу.
+        data (BinaryField): Кандидаты в виде массива numpy с типом raw_detections.raw_dtype()
+            (уверенность, индекс метки, рамка x1, y1, x2, y2 в пикселях рабочей копии), по убыванию уверенности.
+        count (PositiveIntegerField): Количество кандидатов.
+        min_score (FloatField): Уверенность, ниже которой кандидаты не сохранены.
+        created_at (DateTimeField): Время обработки.
+    """
+    image_feed = models.ForeignKey(ImageFeed, related_name='raw_detections', on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=50, choices=DetectedObject.MODEL_CHOICES)
+    labels = models.JSONField(default=list)
+    data = models.BinaryField()
+    count = models.PositiveIntegerField(default=0)
+    min_score = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image_feed', 'model_name'], name='unique_raw_detections'),
+        ]
+
+    def __str__(self):
+        """Возвращает строковое представление объекта."""
+        return f"{self.model_name} #{self.image_feed_id}: {self.count} candidates"
+
+
+class DetectionStat(models.Model):
+    """
+    Сводная статистика обнаружений по пользователю, типу объекта, модели и дню.
+
+    Обновляется инкрементально в той же транзакции, что и запись или удаление DetectedObject (см. stats.py),
+    поэтому запросы вида "сколько машин пользователь обнаружил за день" не сканируют DetectedObject.
+
+    Attributes:
+        user (ForeignKey): Пользователь, загрузивший изображения.
+        object_type (CharField): Тип обнаруженного объекта.
+        model_name (CharField): Модель, обнаружившая объекты.
+        day (DateField): День обнаружения.
+        count (IntegerField): Количество обнаруженных объектов.
+        confidence_sum (FloatField): Сумма уверенностей обнаружения (для вычисления средней уверенности).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='detection_stats', on_delete=models.CASCADE)
+    object_type = models.CharField(max_length=100)
+    model_name = models.CharField(max_length=50, choices=DetectedObject.MODEL_CHOICES, blank=True, default='')
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'object_type', 'model_name', 'day'],
+                                    name='unique_detection_stat'),
+        ]
+
+    @property
+    def average_confidence(self):
+        """Средняя уверенность обнаружения."""
+        return self.confidence_sum / self.count if self.count else 0.0
+
+    def __str__(self):
+        """Возвращает строковое представление объекта."""
+        return f"{self.user_id}: {self.object_type} x{self.count} ({self.model_name or '-'}, {self.day})"
+
+
+class InferenceMemoryRecord(models.Model):
+    """
+    Потребление памяти одним запуском обработки изображения (см. memory.py).
+
+    Attributes:
+        name (CharField): Имя функции обработки.
+        image_feed (ForeignKey, optional): Обработанное изображение; при удалении изображения запись сохраняется.
+        seconds (FloatField): Длительность обработки.
+        rss_before_mb (FloatField): RSS процесса перед обработкой, МБ.
+        rss_after_mb (FloatField): RSS процесса после обработки, МБ.
+        peak_rss_mb (FloatField): Пиковый RSS процесса во время обработки, МБ.
+        tracemalloc_peak_mb (FloatField, optional): Пик памяти Python-аллокаций во время обработки
+            относительно начала обработки, МБ (только при MEMORY_TRACEMALLOC = True).
+        created_at (DateTimeField): Время записи.
+    """
+    name = models.CharField(max_length=100)
+    image_feed = models.ForeignKey(ImageFeed, related_name='memory_records', null=True, blank=True,
+                                   on_delete=models.SET_NULL)
+    seconds = models.FloatField()
+    rss_before_mb = models.FloatField()
+    rss_after_mb = models.FloatField()
+    peak_rss_mb = models.FloatField()
+    tracemalloc_peak_mb = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        """Возвращает строковое представление объекта."""
+        return f"{self.name} #{self.image_feed_id}: peak {self.peak_rss_mb:.0f} MB"
+
+
+class InferenceJob(models.Model):
+    """
+    Задание обработки изображения в очереди планировщика (см. scheduling.py).
+
+    Задания выдаются воркерам в порядке виртуального времени завершения взвешенной справедливой очереди (WFQ),
+    поэтому пользователь с большой пачкой заданий не задерживает задания остальных пользователей.
+
+    Attributes:
+        user (ForeignKey): Пользователь, отправивший задание.
+        image_feed (ForeignKey): Обрабатываемое изображение.
+        kind (CharField): Вид обработки: модель MobileNet SSD, DETR или обе модели.
+        status (CharField): Состояние задания.
+        cost (FloatField): Оценка длительности обработки в секундах на момент постановки в очередь.
+        finish_tag (FloatField): Виртуальное время завершения в справедливой очереди (меньше - раньше).
+        tat (FloatField): Теоретическое время прихода следующего задания пользователя (алгоритм GCRA,
+            эквивалентный корзине токенов), Unix-время.
+        not_before (DateTimeField, optional): Задание, отложенное по лимиту скорости, не выдаётся раньше этого времени.
+        error (TextField): Причина отклонения или ошибка обработки.
+        created_at (DateTimeField): Время постановки в очередь.
+        started_at (DateTimeField, optional): Время начала обработки.
+        finished_at (DateTimeField, optional): Время завершения обработки.
+    """
+    KIND_SSD = 'ssd'
+    KIND_DETR = 'detr'
+    KIND_MULTI = 'multi'
+    KIND_CHOICES = [
+        (KIND_SSD, 'MobileNet SSD'),
+        (KIND_DETR, 'DETR ResNet-50'),
+        (KIND_MULTI, 'MobileNet SSD + DETR'),
+    ]
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Ошибка'),
+        (STATUS_REJECTED, 'Отклонено'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='inference_jobs', on_delete=models.CASCADE)
+    image_feed = models.ForeignKey(ImageFeed, related_name='inference_jobs', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    cost = models.FloatField(default=0.0)
+    finish_tag = models.FloatField(default=0.0, db_index=True)
+    tat = models.FloatField(default=0.0)
+    not_before = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'finish_tag'], name='inference_job_queue'),
+            models.Index(fields=['user', 'status'], name='inference_job_user_status'),
+        ]
+
+    def __str__(self):
+        """Возвращает строковое представление объекта."""
+        return f"{self.kind} #{self.image_feed_id} ({self.user_id}): {self.status}"
@@ -0,0 +1,385 @@
+"""
+Поиск почти одинаковых изображений по перцептивному хэшу и повторное использование их результатов обнаружения.
+
+Описание работы модуля:
+    1. compute_phash(image):
+        - 64-битный перцептивный хэш (pHash): изображение уменьшается до 32x32 в оттенках серого, берётся DCT,
+        и каждый из 64 низкочастотных коэффициентов сравнивается с медианой. Хэш почти не меняется при повторном
+        сжатии, изменении размера и небольшой обрезке, поэтому такие изображения различаются на несколько бит.
+    2. MultiIndexHashTable:
+        - Индекс в памяти для поиска хэшей на расстоянии Хэмминга не больше r. 64 бита делятся на m частей,
+        и для каждой части есть своя хэш-таблица. Если расстояние между хэшами не больше r, то хотя бы одна часть
+        отличается не больше чем на r // m бит. Поэтому достаточно проверить соседей каждой части в пределах
+        r // m бит. При ширине части около log2(количества хэшей) в каждой ячейке таблицы почти нет лишних
+        кандидатов, и поиск занимает доли миллисекунды даже для миллионов изображений.
+    3. near_duplicate_index:
+        - Индекс процесса, который при каждом поиске догружает из базы данных новые ImageFeed и хэши, записанные
+        другими процессами после предыдущей синхронизации (по phash_updated_at).
+    4. find_reusable_detections(image_feed, model_name, size):
+        - Находит почти одинаковое изображение, уже обработанное той же моделью, и возвращает его результаты
+        с ограничивающими прямоугольниками, пересчитанными к размеру текущего изображения.
+"""
+import itertools
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ImageFeed
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# Запас при догрузке изменённых хэшей: транзакция, записавшая хэш, могла зафиксироваться позже его времени
+SYNC_OVERLAP = timedelta(seconds=30)
+_dct_matrix = None
+
+
+def to_signed(value):
+    """Переводит беззнаковый 64-битный хэш в знаковое число для BigIntegerField."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    """Переводит хэш из BigIntegerField обратно в беззнаковое число."""
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def compute_phash(image):
+    """
+    Вычисляет 64-битный перцептивный хэш изображения.
+
+    :param image: Изображение Pillow.
+    :return: Хэш в виде беззнакового целого числа.
+    :rtype: int
+    """
+    global _dct_matrix
+    import numpy as np
+    from PIL import Image
+
+    if _dct_matrix is None:
+        n = np.arange(32)
+        matrix = np.sqrt(2 / 32) * np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / 64)
+        matrix[0] /= np.sqrt(2)
+        _dct_matrix = matrix
+
+    pixels = np.asarray(image.convert('L').resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_dct_matrix @ pixels @ _dct_matrix.T)[:8, :8].flatten()
+    # Постоянная составляющая (low[0]) не учитывается при вычислении медианы
+    bits = low > np.median(low[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _popcount(values):
+    """Количество единичных бит в каждом элементе массива uint64."""
+    import numpy as np
+
+    global _popcount_table
+    if _popcount_table is None:
+        _popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return _popcount_table[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+_popcount_table = None
+
+
+class MultiIndexHashTable:
+    """
+    Индекс 64-битных хэшей для поиска по расстоянию Хэмминга (multi-index hashing).
+
+    Основная часть индекса хранится в массивах numpy: для каждой части хэша элементы отсортированы по значению
+    части, а массив начал ячеек (по элементу на каждое возможное значение части) позволяет найти ячейки всех
+    соседних значений одним векторным обращением. Новые хэши сначала попадают в небольшие словари
+    и переносятся в массивы, когда их становится больше merge_threshold.
+
+    Attributes:
+        chunks (int): Количество частей, на которые делится хэш.
+        merge_threshold (int): Минимальное количество новых хэшей, после которого массивы перестраиваются
+            (не меньше четверти уже перенесённых в массивы).
+    """
+
+    def __init__(self, chunks=3, merge_threshold=16384):
+        import numpy as np
+
+        self.chunks = chunks
+        self.merge_threshold = merge_threshold
+        # Части по возможности одинаковой ширины: 64 бита на 3 части - 22, 21 и 21 бит
+        self._widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._shifts = [sum(self._widths[:i]) for i in range(chunks)]
+        # Все актуальные хэши: {ключ: хэш}
+        self._hashes = {}
+        # Новые хэши, ещё не перенесённые в массивы: по словарю {часть: [ключи]} на каждую часть хэша
+        self._pending = [{} for _ in range(chunks)]
+        self._pending_keys = set()
+        # Массивы: ключи и хэши, а для каждой части - порядок элементов по значению части и начала ячеек
+        self._keys = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0, dtype=np.uint64)
+        self._orders = [np.empty(0, dtype=np.int64) for _ in range(chunks)]
+        self._starts = [None] * chunks
+        self._flip_masks = {}
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def get(self, key):
+        """Хэш с ключом key или None."""
+        return self._hashes.get(key)
+
+    def _parts(self, value):
+        """Делит хэш на части."""
+        return [(value >> shift) & ((1 << width) - 1) for shift, width in zip(self._shifts, self._widths)]
+
+    def _masks(self, width, radius):
+        """Маски для перебора всех значений части шириной width бит на расстоянии не больше radius."""
+        import numpy as np
+
+        if (width, radius) not in self._flip_masks:
+            masks = []
+            for distance in range(radius + 1):
+                for positions in itertools.combinations(range(width), distance):
+                    mask = 0
+                    for position in positions:
+                        mask |= 1 << position
+                    masks.append(mask)
+            self._flip_masks[width, radius] = np.array(masks, dtype=np.int64)
+        return self._flip_masks[width, radius]
+
+    def add(self, key, value):
+        """Добавляет (или обновляет) хэш с ключом key."""
+        self.remove(key)
+        self._hashes[key] = value
+        self._pending_keys.add(key)
+        for table, part in zip(self._pending, self._parts(value)):
+            table.setdefault(part, []).append(key)
+        # Порог растёт вместе с индексом, чтобы суммарное время перестроений оставалось O(n log n)
+        if len(self._pending_keys) >= max(self.merge_threshold, len(self._keys) // 4):
+            self._merge()
+
+    def add_many(self, items):
+        """
+        Добавляет хэши из пар (ключ, хэш) и сразу переносит все хэши в массивы.
+
+        Используется для начальной загрузки индекса: новые хэши не проходят через словари.
+        """
+        for key, value in items:
+            self.remove(key)
+            self._hashes[key] = value
+        self._merge()
+
+    def remove(self, key):
+        """
+        Удаляет хэш с ключом key, если он есть в индексе.
+
+        Запись в массивах остаётся до следующего перестроения и отбрасывается при поиске.
+        """
+        value = self._hashes.pop(key, None)
+        if value is None or key not in self._pending_keys:
+            return
+        self._pending_keys.discard(key)
+        for table, part in zip(self._pending, self._parts(value)):
+            bucket = table.get(part)
+            if bucket and key in bucket:
+                bucket.remove(key)
+                if not bucket:
+                    del table[part]
+
+    def _merge(self):
+        """Перестраивает массивы из всех актуальных хэшей."""
+        import numpy as np
+
+        self._keys = np.fromiter(self._hashes.keys(), dtype=np.int64, count=len(self._hashes))
+        self._values = np.fromiter(self._hashes.values(), dtype=np.uint64, count=len(self._hashes))
+        for i, (shift, width) in enumerate(zip(self._shifts, self._widths)):
+            parts = ((self._values >> np.uint64(shift)) & np.uint64((1 << width) - 1)).astype(np.int64)
+            self._orders[i] = np.argsort(parts, kind='stable')
+            # Элементы со значением части v занимают позиции starts[v]:starts[v + 1] в порядке orders[i]
+            starts = np.zeros((1 << width) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(parts, minlength=1 << width), out=starts[1:])
+            self._starts[i] = starts
+        self._pending = [{} for _ in range(self.chunks)]
+        self._pending_keys = set()
+
+    def _search_arrays(self, value, radius):
+        """Поиск в массивах: возвращает пары (ключ, хэш) кандидатов на расстоянии не больше radius."""
+        import numpy as np
+
+        if not len(self._keys):
+            return []
+        positions = []
+        for starts, order, part, width in zip(self._starts, self._orders, self._parts(value), self._widths):
+            probes = part ^ self._masks(width, radius // self.chunks)
+            lo = starts[probes]
+            lengths = starts[probes + 1] - lo
+            total = int(lengths.sum())
+            if total:
+                # Индексы всех элементов диапазонов [lo, hi) без цикла по диапазонам
+                starts = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+                positions.append(order[starts + np.arange(total)])
+        if not positions:
+            return []
+        candidates = np.unique(np.concatenate(positions))
+        distances = _popcount(self._values[candidates] ^ np.uint64(value))
+        found = candidates[distances <= radius]
+        return list(zip(self._keys[found].tolist(), self._values[found].tolist()))
+
+    def search(self, value, radius):
+        """
+        Находит хэши на расстоянии Хэмминга не больше radius.
+
+        :return: Список пар (ключ, расстояние), отсортированный по расстоянию.
+        :rtype: list
+        """
+        candidates = set()
+        if self._pending_keys:
+            for table, part, width in zip(self._pending, self._parts(value), self._widths):
+                for mask in self._masks(width, radius // self.chunks).tolist():
+                    bucket = table.get(part ^ mask)
+                    if bucket:
+                        candidates.update(bucket)
+        matches = {}
+        for key in candidates:
+            distance = (self._hashes[key] ^ value).bit_count()
+            if distance <= radius:
+                matches[key] = distance
+        for key, stored in self._search_arrays(value, radius):
+            # Удалённые и обновлённые после перестроения записи отбрасываются
+            if key not in matches and self._hashes.get(key) == stored:
+                matches[key] = (stored ^ value).bit_count()
+        return sorted(matches.items(), key=lambda match: match[1])
+
+
+class NearDuplicateIndex:
+    """Индекс перцептивных хэшей ImageFeed в памяти процесса, синхронизируемый с базой данных."""
+
+    def __init__(self):
+        self._table = MultiIndexHashTable(chunks=getattr(settings, 'NEAR_DUPLICATE_INDEX_CHUNKS', 3))
+        self._max_id = 0
+        self._updated_at = None
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """
+        Догружает хэши изображений, добавленных после последней синхронизации, и хэши, записанные с тех пор
+        для ранее загруженных изображений (ensure_phash в других процессах).
+        """
+        changed = Q(pk__gt=self._max_id)
+        if self._updated_at is not None:
+            changed |= Q(phash_updated_at__gte=self._updated_at - SYNC_OVERLAP)
+        else:
+            changed |= Q(phash_updated_at__isnull=False)
+        rows = list(ImageFeed.objects.filter(changed, phash__isnull=False)
+                    .order_by('pk').values_list('pk', 'phash', 'phash_updated_at').iterator(chunk_size=10000))
+        if not rows:
+            return
+        self._max_id = max(self._max_id, rows[-1][0])
+        for _pk, _phash, updated_at in rows:
+            if updated_at is not None and (self._updated_at is None or updated_at > self._updated_at):
+                self._updated_at = updated_at
+        # Хэши из запаса SYNC_OVERLAP, уже загруженные в индекс, не добавляются повторно
+        items = [(pk, to_unsigned(phash)) for pk, phash, _updated_at in rows
+                 if self._table.get(pk) != to_unsigned(phash)]
+        if len(items) >= self._table.merge_threshold:
+            # Начальная загрузка (или много новых изображений): сразу в массивы
+            self._table.add_many(items)
+        else:
+            for pk, phash in items:
+                self._table.add(pk, phash)
+
+    def add(self, feed_id, phash):
+        """Добавляет хэш изображения в индекс."""
+        with self._lock:
+            self._table.add(feed_id, phash)
+
+    def remove(self, feed_id):
+        """Удаляет изображение из индекса."""
+        with self._lock:
+            self._table.remove(feed_id)
+
+    def search(self, phash, radius):
+        """Возвращает пары (id изображения, расстояние) для хэшей на расстоянии не больше radius."""
+        with self._lock:
+            self._sync()
+            return self._table.search(phash, radius)
+
+
+near_duplicate_index = NearDuplicateIndex()
+
+
+def ensure_phash(image_feed):
+    """
+    Возвращает перцептивный хэш изображения, вычисляя и сохраняя его при необходимости
+    (например, для изображений, загруженных до появления хэшей).
+
+    :param image_feed: Запись ImageFeed.
+    :return: Хэш в виде беззнакового целого числа.
+    :rtype: int
+    """
+    from PIL import Image
+    from .uploads import ensure_working_image
+
+    if image_feed.phash is None:
+        # Создание рабочей копии заодно вычисляет хэш
+        working_path = ensure_working_image(image_feed)
+        if image_feed.phash is None:
+            with Image.open(working_path) as working:
+                phash = compute_phash(working)
+            image_feed.phash, image_feed.phash_updated_at = to_signed(phash), timezone.now()
+            ImageFeed.objects.filter(pk=image_feed.pk).update(phash=image_feed.phash,
+                                                              phash_updated_at=image_feed.phash_updated_at)
+            near_duplicate_index.add(image_feed.pk, phash)
+    return to_unsigned(image_feed.phash)
+
+
+def find_reusable_detections(image_feed, model_name, size):
+    """
+    Возвращает результаты обнаружения почти одинакового изображения, уже обработанного той же моделью.
+
+    :param image_feed: Обрабатываемая запись ImageFeed.
+    :param model_name: Модель (DetectedObject.MODEL_*), результаты которой можно использовать.
+    :type model_name: str
+    :param size: Ширина и высота рабочей копии обрабатываемого изображения.
+    :type size: tuple
+    :return: Кортеж (список (метка, уверенность, (startX, startY, endX, endY)), минимальная уверенность кандидатов)
+        или None, если подходящего изображения нет. Если у изображения сохранён полный вывод модели (RawDetections),
+        возвращаются все его кандидаты, иначе - только объекты выше рабочего порога.
+    :rtype: tuple
+    """
+    from .raw_detections import load_candidates
+
+    from PIL import Image
+
+    max_distance = getattr(settings, 'NEAR_DUPLICATE_MAX_DISTANCE', 6)
+    if max_distance < 0:
+        return None
+    width, height = size
+    for feed_id, distance in near_duplicate_index.search(ensure_phash(image_feed), max_distance):
+        if feed_id == image_feed.pk:
+            continue
+        source = ImageFeed.objects.filter(pk=feed_id).first()
+        if source is None:
+            near_duplicate_index.remove(feed_id)
+            continue
+        rows, min_score = load_candidates(source, model_name)
+        if min_score is None or not source.working_image:
+            continue
+        try:
+            with Image.open(source.working_image.path) as source_image:
+                source_width, source_height = source_image.size
+        except OSError:
+            continue
+
+        scale_x, scale_y = width / source_width, height / source_height
+        detections = []
+        for object_type, confidence, (x1, y1, x2, y2) in rows:
+            detections.append((object_type, confidence,
+                               (round(x1 * scale_x), round(y1 * scale_y), round(x2 * scale_x), round(y2 * scale_y))))
+        logger.info(f"Reusing {len(detections)} detections of feed {feed_id} for feed {image_feed.pk} "
+                    f"(Hamming distance {distance})")
+        return detections, min_score
+    return None
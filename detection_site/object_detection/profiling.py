@@ -0,0 +1,376 @@
+"""
+Выборочное профилирование запросов и задач Celery.
+
+Описание работы модуля:
+    1. Профилирование включается настройками PROFILING_SAMPLE_RATE (доля профилируемых запросов и задач)
+    и PROFILING_SLOW_THRESHOLD (порог длительности в секундах: профиль сохраняется для любого запроса дольше порога).
+    Если оба выключены, ProfilingMiddleware исключается из цепочки (MiddlewareNotUsed), а обработчики
+    сигналов Celery не подключаются, поэтому накладных расходов нет.
+    2. Стековый профилировщик с выборкой:
+        - Один фоновый поток раз в PROFILING_INTERVAL секунд снимает стеки всех отслеживаемых потоков
+        (sys._current_frames) и считает одинаковые стеки. Профилируемый код не замедляется трассировкой,
+        поэтому отслеживать можно все запросы, а сохранять - только выбранные и медленные.
+    3. Количество и время SQL-запросов считаются через connection.execute_wrapper.
+    4. Профили пишутся в PROFILING_DIR файлами JSON; хранится не больше PROFILING_MAX_FILES последних файлов.
+    Их просматривает персонал на странице profiles/ (см. views.py).
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.json$')
+
+
+def _sample_rate():
+    return getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+
+
+def _slow_threshold():
+    return getattr(settings, 'PROFILING_SLOW_THRESHOLD', None)
+
+
+def profiling_enabled():
+    """Включено ли профилирование (выборка или порог медленных запросов)."""
+    return _sample_rate() > 0 or _slow_threshold() is not None
+
+
+def profile_dir():
+    """Каталог хранилища профилей."""
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+class Profile:
+    """
+    Профиль одного запроса или задачи.
+
+    Attributes:
+        kind (str): Вид профиля: 'request' или 'task'.
+        name (str): Путь запроса или имя задачи.
+        sampled (bool): Попал ли запрос в выборку (иначе профиль сохраняется, только если запрос медленный).
+        stacks (Counter): Количество снимков для каждого стека (кортежа объектов кода, от внешнего к внутреннему).
+    """
+
+    def __init__(self, kind, name, sampled):
+        self.kind = kind
+        self.name = name
+        self.sampled = sampled
+        self.stacks = Counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.meta = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+
+    def add_stack(self, frame):
+        """Добавляет снимок стека потока."""
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        self.stacks[tuple(reversed(codes))] += 1
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        """Обёртка выполнения SQL для connection.execute_wrapper: считает запросы и их время."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+    def finish(self):
+        """Фиксирует длительность и возвращает True, если профиль нужно сохранить."""
+        self.seconds = time.perf_counter() - self._start
+        threshold = _slow_threshold()
+        return self.sampled or (threshold is not None and self.seconds >= threshold)
+
+    def to_dict(self):
+        """Данные профиля для хранилища: стеки сворачиваются в строки 'файл:функция;...'."""
+        max_stacks = getattr(settings, 'PROFILING_MAX_STACKS', 200)
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'reason': 'sampled' if self.sampled else 'slow',
+            'started': self.started,
+            'seconds': round(self.seconds, 6),
+            'queries': self.queries,
+            'query_seconds': round(self.query_seconds, 6),
+            'samples': sum(self.stacks.values()),
+            'interval': _interval(),
+            'meta': self.meta,
+            'stacks': [[';'.join(_frame_label(code) for code in stack), count]
+                       for stack, count in self.stacks.most_common(max_stacks)],
+        }
+
+
+def _interval():
+    return getattr(settings, 'PROFILING_INTERVAL', 0.005)
+
+
+_STDLIB_DIR = os.path.dirname(os.__file__)
+
+
+def _frame_label(code):
+    """Подпись кадра стека: путь к файлу относительно проекта, site-packages или стандартной библиотеки и имя функции."""
+    filename = code.co_filename
+    if 'site-packages' in filename:
+        filename = filename.split('site-packages', 1)[1].lstrip(os.sep)
+    else:
+        for base in (str(settings.BASE_DIR), _STDLIB_DIR):
+            if filename.startswith(base):
+                filename = filename[len(base):].lstrip(os.sep)
+                break
+    return f'{filename}:{code.co_name}'
+
+
+class StackSampler:
+    """Фоновый поток, снимающий стеки отслеживаемых потоков раз в PROFILING_INTERVAL секунд."""
+
+    def __init__(self):
+        self._active = {}
+        self._lock = threading.Lock()
+        self._has_work = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # После fork (воркеры Celery prefork) поток родителя в дочернем процессе не существует
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='profiling-sampler', daemon=True)
+            self._thread.start()
+
+    def track(self, profile):
+        """Начинает снимать стеки текущего потока в профиль."""
+        with self._lock:
+            self._ensure_thread()
+            # У потока может быть несколько вложенных профилей (задача Celery, выполняемая внутри запроса)
+            self._active.setdefault(threading.get_ident(), []).append(profile)
+            self._has_work.set()
+
+    def untrack(self, profile):
+        """Прекращает снимать стеки текущего потока в профиль."""
+        ident = threading.get_ident()
+        with self._lock:
+            profiles = self._active.get(ident, [])
+            if profile in profiles:
+                profiles.remove(profile)
+            if not profiles:
+                self._active.pop(ident, None)
+            if not self._active:
+                self._has_work.clear()
+
+    def _loop(self):
+        while True:
+            self._has_work.wait()
+            time.sleep(_interval())
+            with self._lock:
+                active = [(ident, list(profiles)) for ident, profiles in self._active.items()]
+            frames = sys._current_frames()
+            for ident, profiles in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    for profile in profiles:
+                        profile.add_stack(frame)
+            del frames
+
+
+sampler = StackSampler()
+
+
+def start_profile(kind, name):
+    """
+    Начинает профиль запроса или задачи, если профилирование включено.
+
+    :param kind: Вид профиля ('request' или 'task').
+    :param name: Путь запроса или имя задачи.
+    :return: Профиль или None, если этот запрос не отслеживается.
+    :rtype: Profile
+    """
+    sampled = random.random() < _sample_rate()
+    if not sampled and _slow_threshold() is None:
+        return None
+    profile = Profile(kind, name, sampled)
+    sampler.track(profile)
+    return profile
+
+
+def finish_profile(profile):
+    """Завершает профиль и сохраняет его, если запрос попал в выборку или оказался медленным."""
+    sampler.untrack(profile)
+    if profile.finish():
+        try:
+            write_profile(profile.to_dict())
+        except OSError as e:
+            logger.warning(f"Failed to write profile for {profile.name}: {e}")
+
+
+@contextmanager
+def profiled(kind, name):
+    """
+    Профилирует блок кода (см. start_profile), вместе с количеством SQL-запросов.
+
+    :return: Профиль или None; в profile.meta можно добавить сведения о результате.
+    """
+    profile = start_profile(kind, name)
+    if profile is None:
+        yield None
+        return
+    try:
+        with connection.execute_wrapper(profile.sql_wrapper):
+            yield profile
+    finally:
+        finish_profile(profile)
+
+
+def write_profile(data):
+    """
+    Записывает профиль в хранилище и удаляет самые старые файлы сверх PROFILING_MAX_FILES.
+
+    :return: Имя файла профиля.
+    :rtype: str
+    """
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    timestamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(data['started']))
+    name = f"{timestamp}-{data['kind']}-{uuid.uuid4().hex[:8]}.json"
+    tmp_path = directory / f'.{name}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, directory / name)
+
+    # Имена начинаются с времени, поэтому сортировка по имени - это сортировка по времени
+    files = sorted(path for path in directory.iterdir() if PROFILE_NAME_RE.match(path.name))
+    for path in files[:max(len(files) - getattr(settings, 'PROFILING_MAX_FILES', 200), 0)]:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    return name
+
+
+def list_profiles(kind=None, order_by='seconds', limit=50):
+    """
+    Возвращает сводки сохранённых профилей, отсортированные по убыванию order_by.
+
+    :param kind: Вид профилей ('request' или 'task'); None - все.
+    :param order_by: Поле сортировки: 'seconds', 'queries' или 'started'.
+    :return: Список словарей без стеков, с полем 'file' (имя файла профиля).
+    :rtype: list
+    """
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    summaries = []
+    for path in directory.iterdir():
+        if not PROFILE_NAME_RE.match(path.name):
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if kind and data.get('kind') != kind:
+            continue
+        data.pop('stacks', None)
+        data['file'] = path.name
+        summaries.append(data)
+    summaries.sort(key=lambda data: data.get(order_by, 0), reverse=True)
+    return summaries[:limit]
+
+
+def read_profile(name):
+    """
+    Читает профиль и вычисляет время функций по снимкам стеков.
+
+    :param name: Имя файла профиля.
+    :return: Данные профиля с полем 'functions': [(функция, собственные снимки, включительные снимки)],
+        отсортированным по включительным снимкам. None, если профиль не найден.
+    :rtype: dict
+    """
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    try:
+        with open(profile_dir() / name, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    own, inclusive = Counter(), Counter()
+    for stack, count in data['stacks']:
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+    data['functions'] = sorted(((function, own[function], count) for function, count in inclusive.items()),
+                               key=lambda item: item[2], reverse=True)
+    return data
+
+
+class ProfilingMiddleware:
+    """
+    Middleware, профилирующее выборку запросов и все запросы дольше PROFILING_SLOW_THRESHOLD.
+
+    Если профилирование выключено, middleware не используется (MiddlewareNotUsed).
+    """
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profiled('request', request.path) as profile:
+            response = self.get_response(request)
+            if profile is not None:
+                profile.meta.update(method=request.method, status=response.status_code)
+        return response
+
+
+# Профили выполняющихся задач Celery: {идентификатор задачи: профиль}
+_task_profiles = {}
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    """Начинает профиль задачи Celery (сигнал task_prerun)."""
+    profile = start_profile('task', task.name)
+    if profile is not None:
+        wrapper = connection.execute_wrapper(profile.sql_wrapper)
+        wrapper.__enter__()
+        _task_profiles[task_id] = (profile, wrapper)
+
+
+def _task_postrun(task_id=None, state=None, **kwargs):
+    """Завершает профиль задачи Celery (сигнал task_postrun)."""
+    item = _task_profiles.pop(task_id, None)
+    if item is not None:
+        profile, wrapper = item
+        wrapper.__exit__(None, None, None)
+        profile.meta['state'] = state
+        finish_profile(profile)
+
+
+def connect_celery_signals():
+    """Подключает профилирование задач Celery, если профилирование включено."""
+    if not profiling_enabled():
+        return
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(_task_prerun, dispatch_uid='object_detection_profiling_prerun', weak=False)
+    task_postrun.connect(_task_postrun, dispatch_uid='object_detection_profiling_postrun', weak=False)
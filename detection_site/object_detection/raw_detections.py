@@ -0,0 +1,110 @@
+"""
+Хранение полного вывода моделей и выбор обнаружений по порогу во время запроса.
+
+Описание работы модуля:
+    1. pack(candidates) / unpack(labels, data):
+        - Кандидаты модели (метка, уверенность, рамка) хранятся в RawDetections компактным массивом numpy
+        (тип raw_dtype(), 26 байт на кандидата): 100 кандидатов MobileNet SSD или DETR занимают около 2,5 КБ.
+    2. select(candidates, threshold, labels):
+        - Фильтрует кандидатов по порогу уверенности (строго больше, как в функциях обработки) и набору классов.
+    3. load_candidates(image_feed, model_name, threshold, labels):
+        - Обнаружения изображения при произвольном пороге без повторного запуска модели. Для изображений,
+        обработанных до появления RawDetections, используются сохранённые DetectedObject (только выше рабочего порога).
+    4. raw_min_score():
+        - Уверенность, ниже которой кандидаты не сохраняются (RAW_DETECTIONS_MIN_SCORE).
+"""
+from django.conf import settings
+
+from .models import RawDetections
+
+
+def raw_dtype():
+    """Тип записи кандидата: уверенность, индекс метки в RawDetections.labels, рамка x1, y1, x2, y2."""
+    import numpy as np
+
+    return np.dtype([('score', '<f8'), ('label', '<u2'), ('box', '<f4', (4,))])
+
+
+def raw_min_score():
+    """Минимальная уверенность кандидатов, сохраняемых в RawDetections."""
+    return getattr(settings, 'RAW_DETECTIONS_MIN_SCORE', 0.0)
+
+
+def pack(candidates):
+    """
+    Упаковывает кандидатов в компактный массив.
+
+    :param candidates: Список (метка, уверенность, (x1, y1, x2, y2)).
+    :type candidates: list
+    :return: Кортеж (список меток, байты массива по убыванию уверенности).
+    :rtype: tuple
+    """
+    import numpy as np
+
+    labels = sorted({label for label, _score, _box in candidates})
+    index = {label: i for i, label in enumerate(labels)}
+    array = np.zeros(len(candidates), dtype=raw_dtype())
+    for i, (label, score, box) in enumerate(candidates):
+        array[i] = (score, index[label], tuple(box))
+    array = array[np.argsort(-array['score'], kind='stable')]
+    return labels, array.tobytes()
+
+
+def unpack(labels, data):
+    """
+    Распаковывает кандидатов из массива RawDetections.data.
+
+    :return: Список (метка, уверенность, (x1, y1, x2, y2)) по убыванию уверенности.
+    :rtype: list
+    """
+    import numpy as np
+
+    array = np.frombuffer(bytes(data), dtype=raw_dtype())
+    return [(labels[label], float(score), tuple(int(round(float(v))) for v in box))
+            for score, label, box in array.tolist()]
+
+
+def select(candidates, threshold=None, labels=None):
+    """
+    Выбирает кандидатов с уверенностью выше порога и метками из набора.
+
+    :param candidates: Список (метка, уверенность, рамка).
+    :type candidates: list
+    :param threshold: Порог уверенности (строго больше); None - без порога.
+    :type threshold: float
+    :param labels: Набор меток; пустой или None - все метки.
+    :type labels: set
+    :rtype: list
+    """
+    return [(label, score, box) for label, score, box in candidates
+            if (threshold is None or score > threshold) and (not labels or label in labels)]
+
+
+def load_candidates(image_feed, model_name, threshold=None, labels=None):
+    """
+    Возвращает обнаружения изображения при заданном пороге и наборе классов без повторного запуска модели.
+
+    :param image_feed: Запись ImageFeed.
+    :param model_name: Модель (DetectedObject.MODEL_*).
+    :type model_name: str
+    :param threshold: Порог уверенности; None - все сохранённые кандидаты.
+    :type threshold: float
+    :param labels: Набор меток; пустой или None - все метки.
+    :type labels: set
+    :return: Кортеж (список (метка, уверенность, рамка), минимальная уверенность сохранённых кандидатов).
+        Минимальная уверенность None, если изображение не обрабатывалось этой моделью.
+    :rtype: tuple
+    """
+    raw = RawDetections.objects.filter(image_feed=image_feed, model_name=model_name).first()
+    if raw is not None:
+        return select(unpack(raw.labels, raw.data), threshold, labels), raw.min_score
+    # Изображение обработано до появления RawDetections: есть только объекты выше рабочего порога
+    from .utils import model_threshold
+
+    rows = list(image_feed.detected_objects.filter(model_name=model_name)
+                .values_list('object_type', 'confidence', 'location'))
+    if not rows:
+        return [], None
+    candidates = [(object_type, confidence, tuple(int(v) for v in location.split(',')))
+                  for object_type, confidence, location in sorted(rows, key=lambda row: -row[1])]
+    return select(candidates, threshold, labels), model_threshold(model_name)
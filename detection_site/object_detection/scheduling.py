@@ -0,0 +1,340 @@
+"""
+Планировщик заданий обработки изображений: лимит скорости, справедливая очередь и контроль допуска.
+
+Описание работы модуля:
+    1. submit(user, image_feed, kind):
+        - Ставит задание обработки в очередь (запись InferenceJob). Представления обработки не запускают модель
+        сами, а отправляют задание планировщику.
+    2. Лимит скорости пользователя (корзина токенов):
+        - Ёмкость корзины SCHEDULER_BURST заданий, пополнение SCHEDULER_RATE заданий в секунду. Состояние корзины -
+        одно число на пользователя (теоретическое время прихода задания, алгоритм GCRA), оно хранится в последнем
+        задании пользователя. Задание сверх лимита откладывается до появления токена (not_before), а если ждать
+        пришлось бы дольше SCHEDULER_MAX_DEFER секунд - отклоняется.
+    3. Взвешенная справедливая очередь (WFQ):
+        - Задание получает виртуальное время завершения: max(виртуальное время системы, время завершения
+        предыдущего задания пользователя в очереди) + оценка длительности / вес пользователя. Воркеры берут
+        задания по возрастанию этого времени, поэтому пачка заданий одного пользователя чередуется с заданиями
+        остальных, а не задерживает их. Вес - SCHEDULER_USER_WEIGHTS, длительность - среднее по последним
+        выполненным заданиям того же вида (до их появления - SCHEDULER_DEFAULT_COSTS).
+    4. Контроль допуска:
+        - Задание отклоняется (AdmissionRejected), если очередь длиннее SCHEDULER_MAX_QUEUE_DEPTH, очередь
+        пользователя длиннее SCHEDULER_MAX_USER_QUEUE_DEPTH или оценка ожидания больше SCHEDULER_MAX_WAIT секунд.
+    5. dispatch_next():
+        - Выполняет следующее задание очереди (Celery-задача dispatch_inference_task, по одной на задание).
+        При SCHEDULER_DISPATCH = 'inline' (нагрузочный тест) или недоступности брокера задание выполняется
+        сразу в вызывающем процессе.
+    6. scheduler_metrics():
+        - Длина очереди, ожидание и число отклонённых заданий по пользователям.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+
+from .db import detection_writer
+from .models import ImageFeed, InferenceJob
+from .utils import process_alternative_image, process_image, process_image_multi_model
+
+logger = logging.getLogger(__name__)
+
+# Функции обработки по виду задания
+PROCESSORS = {
+    InferenceJob.KIND_SSD: process_image,
+    InferenceJob.KIND_DETR: process_alternative_image,
+    InferenceJob.KIND_MULTI: process_image_multi_model,
+}
+# Задания, которые уже выдавались воркерам: по ним определяется виртуальное время системы
+STARTED_STATUSES = (InferenceJob.STATUS_RUNNING, InferenceJob.STATUS_DONE, InferenceJob.STATUS_FAILED)
+FINISHED_STATUSES = (InferenceJob.STATUS_DONE, InferenceJob.STATUS_FAILED, InferenceJob.STATUS_REJECTED)
+
+
+class AdmissionRejected(Exception):
+    """
+    Задание не принято в очередь.
+
+    Attributes:
+        reason (str): Причина: 'queue_full', 'user_queue_full', 'rate_limited' или 'overloaded'.
+        retry_after (float): Через сколько секунд имеет смысл повторить отправку.
+    """
+
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def user_weight(user):
+    """Вес пользователя в справедливой очереди (SCHEDULER_USER_WEIGHTS по имени пользователя, по умолчанию 1)."""
+    return float(getattr(settings, 'SCHEDULER_USER_WEIGHTS', {}).get(user.get_username(), 1.0))
+
+
+def estimate_cost(kind):
+    """
+    Оценка длительности задания: средняя длительность последних выполненных заданий того же вида.
+
+    :param kind: Вид задания (InferenceJob.KIND_*).
+    :type kind: str
+    :return: Длительность в секундах.
+    :rtype: float
+    """
+    rows = (InferenceJob.objects.filter(kind=kind, status=InferenceJob.STATUS_DONE)
+            .order_by('-finished_at').values_list('started_at', 'finished_at')
+            [:getattr(settings, 'SCHEDULER_COST_WINDOW', 20)])
+    durations = [(finished - started).total_seconds() for started, finished in rows if started and finished]
+    if durations:
+        return sum(durations) / len(durations)
+    return getattr(settings, 'SCHEDULER_DEFAULT_COSTS', {}).get(kind, 1.0)
+
+
+def _virtual_time():
+    """Виртуальное время системы: время завершения последнего выданного воркеру задания."""
+    return (InferenceJob.objects.filter(status__in=STARTED_STATUSES)
+            .aggregate(value=Max('finish_tag'))['value'] or 0.0)
+
+
+def _admit(user, image_feed, kind, cost, weight):
+    """
+    Принимает решение о допуске задания и сохраняет его (выполняется писателем detection_writer).
+
+    :return: Кортеж (задание, оценка ожидания или время до повторной отправки для отклонённого задания).
+    :rtype: tuple
+    """
+    now = time.time()
+    workers = max(1, getattr(settings, 'SCHEDULER_WORKERS', 1))
+    queued = InferenceJob.objects.filter(status=InferenceJob.STATUS_QUEUED)
+    user_jobs = InferenceJob.objects.filter(user=user)
+
+    # Корзина токенов (GCRA): задание без ожидания, если теоретическое время прихода не дальше ёмкости корзины
+    interval = 1.0 / getattr(settings, 'SCHEDULER_RATE', 1.0)
+    last_tat = (user_jobs.exclude(status=InferenceJob.STATUS_REJECTED)
+                .aggregate(value=Max('tat'))['value'] or 0.0)
+    tat = max(last_tat, now) + interval
+    defer = max(0.0, tat - now - getattr(settings, 'SCHEDULER_BURST', 1) * interval)
+
+    # Справедливая очередь: задание встаёт после предыдущих заданий пользователя, но не раньше текущего момента
+    backlog = (user_jobs.filter(status__in=(InferenceJob.STATUS_QUEUED, InferenceJob.STATUS_RUNNING))
+               .aggregate(value=Max('finish_tag'))['value'] or 0.0)
+    finish_tag = max(_virtual_time(), backlog) + cost / weight
+    # Ожидание: задания, выдаваемые раньше этого, распределяются между воркерами
+    ahead = queued.filter(finish_tag__lte=finish_tag).aggregate(value=Sum('cost'))['value'] or 0.0
+    wait = defer + ahead / workers
+
+    job = InferenceJob(user=user, image_feed=image_feed, kind=kind, cost=cost)
+    reason, retry_after = None, None
+    if queued.count() >= getattr(settings, 'SCHEDULER_MAX_QUEUE_DEPTH', 200):
+        reason, retry_after = 'queue_full', ahead / workers
+    elif queued.filter(user=user).count() >= getattr(settings, 'SCHEDULER_MAX_USER_QUEUE_DEPTH', 20):
+        reason, retry_after = 'user_queue_full', wait
+    elif defer > getattr(settings, 'SCHEDULER_MAX_DEFER', 60):
+        reason, retry_after = 'rate_limited', defer - getattr(settings, 'SCHEDULER_MAX_DEFER', 60)
+    elif wait > getattr(settings, 'SCHEDULER_MAX_WAIT', 300):
+        reason, retry_after = 'overloaded', wait - getattr(settings, 'SCHEDULER_MAX_WAIT', 300)
+    if reason is not None:
+        job.status, job.error, job.finished_at = InferenceJob.STATUS_REJECTED, reason, timezone.now()
+        job.save()
+        return job, retry_after
+
+    job.tat, job.finish_tag = tat, finish_tag
+    if defer:
+        job.not_before = datetime.fromtimestamp(now + defer, tz=dt_timezone.utc)
+    job.save()
+    return job, wait
+
+
+def submit(user, image_feed, kind):
+    """
+    Ставит задание обработки изображения в очередь и передаёт его воркерам.
+
+    :param user: Пользователь, отправляющий задание.
+    :param image_feed: Обрабатываемое изображение.
+    :param kind: Вид обработки (InferenceJob.KIND_*).
+    :type kind: str
+    :return: Кортеж (задание, оценка ожидания начала обработки в секундах). Если брокер Celery недоступен,
+        задание к моменту возврата уже выполнено.
+    :rtype: tuple
+    :raises AdmissionRejected: Если задание не принято в очередь.
+    """
+    cost, weight = estimate_cost(kind), user_weight(user)
+    job, wait = detection_writer.run(lambda: _admit(user, image_feed, kind, cost, weight))
+    if job.status == InferenceJob.STATUS_REJECTED:
+        logger.warning(f"Inference job for feed {image_feed.pk} ({kind}) of user {user.pk} rejected: {job.error}")
+        raise AdmissionRejected(job.error, wait)
+    logger.info(f"Inference job {job.pk} queued: feed {image_feed.pk} ({kind}), user {user.pk}, "
+                f"estimated wait {wait:.1f}s")
+    _enqueue_dispatch(job)
+    job.refresh_from_db()
+    return job, wait
+
+
+def _enqueue_dispatch(job):
+    """
+    Передаёт выдачу задания Celery-воркеру, а при SCHEDULER_DISPATCH = 'inline' или недоступности брокера
+    выполняет задание сразу в вызывающем процессе.
+    """
+    from .tasks import dispatch_inference_task
+
+    countdown = max(0.0, (job.not_before - timezone.now()).total_seconds()) if job.not_before else 0.0
+    if getattr(settings, 'SCHEDULER_DISPATCH', 'celery') == 'inline':
+        _run_inline(job, countdown)
+        return
+    try:
+        # Без повторных попыток подключения: при недоступном брокере задание сразу выполняется в процессе
+        dispatch_inference_task.apply_async(countdown=countdown, retry=False)
+    except Exception as e:
+        logger.warning(f"Celery is unavailable, running inference job {job.pk} synchronously: {e}")
+        _run_inline(job, countdown)
+
+
+def _run_inline(job, countdown):
+    """Выполняет задание в вызывающем процессе; отложить задание без очереди некому - оно отклоняется."""
+    if countdown:
+        detection_writer.run(lambda: InferenceJob.objects.filter(pk=job.pk).update(
+            status=InferenceJob.STATUS_REJECTED, error='rate_limited', finished_at=timezone.now()))
+        raise AdmissionRejected('rate_limited', countdown)
+    run_job(job.pk)
+
+
+def _claim(job_id):
+    """Переводит задание из очереди в выполнение. Возвращает False, если его уже взял другой воркер."""
+    return detection_writer.run(lambda: InferenceJob.objects.filter(
+        pk=job_id, status=InferenceJob.STATUS_QUEUED).update(
+        status=InferenceJob.STATUS_RUNNING, started_at=timezone.now())) == 1
+
+
+def _fail_stale_jobs():
+    """Помечает ошибочными задания, выполняющиеся дольше PROCESSING_LEASE_TIMEOUT (воркер завершился аварийно)."""
+    deadline = timezone.now() - timedelta(seconds=getattr(settings, 'PROCESSING_LEASE_TIMEOUT', 600))
+    stale = InferenceJob.objects.filter(status=InferenceJob.STATUS_RUNNING, started_at__lt=deadline)
+    if stale.exists():
+        detection_writer.run(lambda: stale.update(status=InferenceJob.STATUS_FAILED, error='stale',
+                                                  finished_at=timezone.now()))
+
+
+def dispatch_next():
+    """
+    Выполняет задание с наименьшим виртуальным временем завершения среди готовых к выдаче.
+
+    :return: Выполненное задание или None, если готовых заданий нет.
+    :rtype: InferenceJob
+    """
+    _fail_stale_jobs()
+    while True:
+        now = timezone.now()
+        job_id = (InferenceJob.objects.filter(status=InferenceJob.STATUS_QUEUED)
+                  .exclude(not_before__gt=now).order_by('finish_tag', 'pk').values_list('pk', flat=True).first())
+        if job_id is None:
+            return None
+        if _claim(job_id):
+            return _execute(job_id)
+
+
+def run_job(job_id):
+    """
+    Выполняет конкретное задание, если его ещё не взял воркер.
+
+    :return: Выполненное задание или None.
+    :rtype: InferenceJob
+    """
+    if _claim(job_id):
+        return _execute(job_id)
+    return None
+
+
+def _execute(job_id):
+    """Выполняет взятое задание и записывает его результат."""
+    job = InferenceJob.objects.get(pk=job_id)
+    logger.info(f"Inference job {job.pk} started after {(job.started_at - job.created_at).total_seconds():.1f}s "
+                f"in queue (user {job.user_id})")
+    status, error = InferenceJob.STATUS_DONE, ''
+    feed = ImageFeed.objects.filter(pk=job.image_feed_id)
+    try:
+        # Изображение, удалённое до или во время обработки: обработчик DETR в этом случае возвращает []
+        if not feed.exists():
+            status, error = InferenceJob.STATUS_FAILED, 'image feed not found'
+        elif PROCESSORS[job.kind](job.image_feed_id) in (False, None):
+            status, error = InferenceJob.STATUS_FAILED, 'processing failed'
+        elif not feed.exists():
+            status, error = InferenceJob.STATUS_FAILED, 'image feed not found'
+    except Exception as e:
+        logger.exception(f"Inference job {job.pk} failed")
+        status, error = InferenceJob.STATUS_FAILED, str(e)
+    job.status, job.error, job.finished_at = status, error, timezone.now()
+    detection_writer.run(lambda: InferenceJob.objects.filter(pk=job.pk).update(
+        status=status, error=error, finished_at=job.finished_at))
+    return job
+
+
+def purge_finished_jobs(retention=None):
+    """
+    Удаляет завершённые и отклонённые задания старше SCHEDULER_JOB_RETENTION секунд.
+
+    Последнее задание пользователя хранит состояние его корзины токенов, но к моменту удаления
+    корзина давно заполнена, поэтому удаление на лимит скорости не влияет.
+
+    :return: Количество удалённых заданий.
+    :rtype: int
+    """
+    retention = retention if retention is not None else getattr(settings, 'SCHEDULER_JOB_RETENTION', 7 * 24 * 3600)
+    old = InferenceJob.objects.filter(status__in=FINISHED_STATUSES,
+                                      created_at__lt=timezone.now() - timedelta(seconds=retention))
+    return detection_writer.run(lambda: old.delete()[0])
+
+
+def _percentile(values, p):
+    return values[min(int(len(values) * p), len(values) - 1)] if values else None
+
+
+def scheduler_metrics(window=None):
+    """
+    Метрики очереди по пользователям за последние `window` секунд (по умолчанию SCHEDULER_METRICS_WINDOW).
+
+    :return: Словарь: общая длина очереди и оценка её выполнения, а для каждого пользователя - задания в очереди
+        и в работе, возраст старейшего задания в очереди, среднее, p95 и максимальное ожидание начала обработки,
+        количество выполненных, ошибочных и отклонённых заданий за окно.
+    :rtype: dict
+    """
+    window = window or getattr(settings, 'SCHEDULER_METRICS_WINDOW', 3600)
+    now = timezone.now()
+    since = now - timedelta(seconds=window)
+    users = {}
+
+    def entry(username):
+        return users.setdefault(username, {
+            'queued': 0, 'running': 0, 'oldest_queued_seconds': None, 'wait_mean_seconds': None,
+            'wait_p95_seconds': None, 'wait_max_seconds': None, 'done': 0, 'failed': 0, 'rejected': 0})
+
+    for row in (InferenceJob.objects.filter(status__in=(InferenceJob.STATUS_QUEUED, InferenceJob.STATUS_RUNNING))
+                .values('user__username', 'status').annotate(count=Count('pk'), oldest=Min('created_at'))
+                .order_by()):
+        metrics = entry(row['user__username'])
+        metrics[row['status']] = row['count']
+        if row['status'] == InferenceJob.STATUS_QUEUED:
+            metrics['oldest_queued_seconds'] = round((now - row['oldest']).total_seconds(), 1)
+
+    for row in (InferenceJob.objects.filter(created_at__gte=since, status__in=FINISHED_STATUSES)
+                .values('user__username', 'status').annotate(count=Count('pk')).order_by()):
+        entry(row['user__username'])[row['status']] = row['count']
+
+    waits = {}
+    for username, created_at, started_at in (InferenceJob.objects.filter(started_at__gte=since)
+                                             .values_list('user__username', 'created_at', 'started_at')):
+        waits.setdefault(username, []).append((started_at - created_at).total_seconds())
+    for username, values in waits.items():
+        values.sort()
+        metrics = entry(username)
+        metrics['wait_mean_seconds'] = round(sum(values) / len(values), 2)
+        metrics['wait_p95_seconds'] = round(_percentile(values, 0.95), 2)
+        metrics['wait_max_seconds'] = round(values[-1], 2)
+
+    queued = InferenceJob.objects.filter(status=InferenceJob.STATUS_QUEUED).aggregate(
+        depth=Count('pk'), cost=Sum('cost'))
+    workers = max(1, getattr(settings, 'SCHEDULER_WORKERS', 1))
+    return {
+        'window_seconds': window,
+        'queue_depth': queued['depth'],
+        'estimated_drain_seconds': round((queued['cost'] or 0.0) / workers, 1),
+        'users': users,
+    }
@@ -0,0 +1,137 @@
+"""
+Однократное выполнение одинаковых заданий обработки (single-flight).
+
+Описание работы модуля:
+    1. SingleFlight.do(key, func):
+        - Первый вызов с ключом выполняет func, а вызовы с тем же ключом, пришедшие во время выполнения,
+        не запускают обработку повторно: они ждут завершения и получают тот же результат (или то же исключение).
+        Ключ - изображение, модель и параметры обработки, поэтому двойное нажатие «Process Image» или
+        одновременная обработка из веб-запроса и задачи Celery выполняют инференс один раз.
+    2. Между процессами:
+        - Выполняющий процесс держит в кэше Django аренду ключа (cache.add) на PROCESSING_LEASE_TIMEOUT секунд
+        и по завершении кладёт в кэш результат. Остальные процессы ждут снятия аренды и берут результат из кэша;
+        если результата нет (процесс-исполнитель завершился аварийно), обработку выполняет ожидающий.
+        Работает при общем для процессов кэше (Redis, Memcached); с LocMemCache - в пределах процесса.
+    3. single_flight(key_func):
+        - Декоратор функций обработки: ключ вычисляется из аргументов функцией key_func.
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'singleflight'
+
+
+class _Call:
+    """Выполняемое задание: результат для ожидающих потоков того же процесса."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Реестр выполняемых заданий процесса с арендой ключей в кэше для других процессов.
+
+    Attributes:
+        lease_timeout (float): Время аренды ключа в секундах (верхняя граница длительности обработки).
+        poll_interval (float): Интервал проверки аренды другим процессом в секундах.
+    """
+
+    def __init__(self, lease_timeout=None, poll_interval=None):
+        self.lease_timeout = lease_timeout or getattr(settings, 'PROCESSING_LEASE_TIMEOUT', 600)
+        self.poll_interval = poll_interval or getattr(settings, 'PROCESSING_LEASE_POLL_INTERVAL', 0.2)
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """
+        Выполняет func один раз для всех одновременных вызовов с ключом key.
+
+        :param key: Ключ задания (строка или кортеж простых значений).
+        :param func: Функция без аргументов.
+        :type func: callable
+        :return: Кортеж (результат, shared): shared - True, если результат получен от уже выполнявшегося задания.
+        :rtype: tuple
+        :raises Exception: Исключение, возникшее при выполнении func.
+        """
+        key = hashlib.sha1(repr(key).encode()).hexdigest()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._run_leased(key, func)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_leased(self, key, func):
+        """Выполняет func под арендой ключа или ждёт результат процесса, который держит аренду."""
+        lease_key, token = f'{KEY_PREFIX}:lease:{key}', uuid.uuid4().hex
+        while True:
+            if cache.add(lease_key, token, timeout=self.lease_timeout):
+                break
+            holder = cache.get(lease_key)
+            logger.info(f"Waiting for job {key} running in another process")
+            while holder is not None and cache.get(lease_key) == holder:
+                time.sleep(self.poll_interval)
+            marker = cache.get(f'{KEY_PREFIX}:result:{key}:{holder}')
+            if marker is not None:
+                return marker[0], True
+            # Результата нет: исполнитель завершился без него, аренду берёт этот процесс
+
+        try:
+            result = func()
+            # Результат нужен только процессам, которые ждут снятия аренды
+            cache.set(f'{KEY_PREFIX}:result:{key}:{token}', (result,), timeout=60)
+            return result, False
+        finally:
+            if cache.get(lease_key) == token:
+                cache.delete(lease_key)
+
+
+# Общий реестр заданий обработки изображений
+processing_flights = SingleFlight()
+
+
+def single_flight(key_func):
+    """
+    Декоратор: одновременные вызовы функции с одинаковым ключом выполняются один раз.
+
+    :param key_func: Функция, вычисляющая ключ задания из аргументов декорируемой функции.
+    :type key_func: callable
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            result, shared = processing_flights.do(key_func(*args, **kwargs), lambda: func(*args, **kwargs))
+            if shared:
+                logger.info(f"{func.__name__}{args}: attached to the job already in flight")
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,207 @@
+"""
+Пространственный индекс обнаруженных объектов для запросов по области кадра.
+
+Описание работы модуля:
+    1. normalize_boxes(objects) / index_detections(objects):
+        - При записи объектов (см. stats.save_detections) рамка из `location` переводится в доли ширины и высоты
+        рабочей копии (поля x_min, y_min, x_max, y_max), а для каждой ячейки сетки SPATIAL_GRID_SIZE x
+        SPATIAL_GRID_SIZE, которую пересекает рамка, создаётся строка DetectionCell. Удаление объектов
+        удаляет их ячейки каскадно.
+    2. region_detections(label, region, min_overlap, ...):
+        - Объекты с меткой label, у которых внутри области region находится не меньше доли min_overlap площади
+        рамки (например, «человек в левой трети кадра»: region=(0, 0, 1/3, 1), min_overlap=0.5).
+        Кандидаты выбираются по индексу (метка, ячейка) только из ячеек, пересекающих область, и лишь для них
+        точное перекрытие вычисляется в базе данных: время запроса зависит от количества объектов метки рядом
+        с областью, а не от размера таблицы.
+    3. region_feeds(...):
+        - Изображения, на которых есть такие объекты.
+    4. rebuild_spatial_index():
+        - Заполняет нормализованные рамки и ячейки для всех объектов (объекты, записанные до появления индекса,
+        или после изменения SPATIAL_GRID_SIZE; management-команда rebuild_spatial_index).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Least, NullIf
+
+from .models import DetectedObject, DetectionCell, ImageFeed
+from .uploads import stored_image_size
+
+BOX_FIELDS = ('x_min', 'y_min', 'x_max', 'y_max')
+
+
+def grid_size():
+    """Количество ячеек сетки по каждой стороне кадра."""
+    return getattr(settings, 'SPATIAL_GRID_SIZE', 8)
+
+
+def parse_region(value):
+    """
+    Разбирает область кадра из строки `x1,y1,x2,y2` в долях ширины и высоты.
+
+    :param value: Строка с четырьмя числами от 0 до 1.
+    :type value: str
+    :return: Кортеж (x1, y1, x2, y2).
+    :rtype: tuple
+    :raises ValueError: Если область задана неверно или пуста.
+    """
+    x1, y1, x2, y2 = (float(v) for v in value.split(','))
+    if not (0.0 <= x1 < x2 <= 1.0 and 0.0 <= y1 < y2 <= 1.0):
+        raise ValueError(f'Invalid region: {value}')
+    return x1, y1, x2, y2
+
+
+def box_cells(box, size=None):
+    """
+    Номера ячеек сетки, которые пересекает нормализованная рамка.
+
+    :param box: Рамка (x1, y1, x2, y2) в долях кадра.
+    :type box: tuple
+    :param size: Размер сетки; по умолчанию SPATIAL_GRID_SIZE.
+    :type size: int
+    :rtype: list
+    """
+    size = size or grid_size()
+    x1, y1, x2, y2 = box
+
+    def span(start, end):
+        return range(min(int(start * size), size - 1), min(int(end * size), size - 1) + 1)
+
+    return [row * size + col for row in span(y1, y2) for col in span(x1, x2)]
+
+
+def _normalized(location, width, height):
+    """Рамка из `location` ('x1,y1,x2,y2' в пикселях) в долях кадра; None, если её нельзя разобрать."""
+    try:
+        x1, y1, x2, y2 = (float(v) for v in location.split(','))
+    except (AttributeError, ValueError):
+        return None
+
+    def clamp(value, limit):
+        return min(max(value / limit, 0.0), 1.0)
+
+    x1, x2 = sorted((clamp(x1, width), clamp(x2, width)))
+    y1, y2 = sorted((clamp(y1, height), clamp(y2, height)))
+    return x1, y1, x2, y2
+
+
+def normalize_boxes(objects, sizes=None):
+    """
+    Заполняет нормализованные рамки объектов, у которых они пусты, по размеру рабочей копии изображения.
+
+    :param objects: Объекты DetectedObject (сохранённые или нет).
+    :type objects: list
+    :param sizes: Кэш размеров изображений {image_feed_id: (ширина, высота)} между вызовами.
+    :type sizes: dict
+    """
+    sizes = {} if sizes is None else sizes
+    for obj in objects:
+        if obj.x_min is not None:
+            continue
+        if obj.image_feed_id not in sizes:
+            feed = obj.image_feed
+            sizes[obj.image_feed_id] = stored_image_size(feed.working_image.name if feed.working_image else None,
+                                                         feed.image.name)
+        width, height = sizes[obj.image_feed_id]
+        box = _normalized(obj.location, width, height) if width and height else None
+        if box is not None:
+            obj.x_min, obj.y_min, obj.x_max, obj.y_max = box
+
+
+def index_detections(objects):
+    """
+    Создаёт строки пространственного индекса для сохранённых объектов с нормализованными рамками.
+
+    :param objects: Сохранённые объекты DetectedObject.
+    :type objects: list
+    :return: Количество созданных строк DetectionCell.
+    :rtype: int
+    """
+    size = grid_size()
+    cells = [
+        DetectionCell(detected_object_id=obj.pk, object_type=obj.object_type, cell=cell)
+        for obj in objects if obj.pk is not None and obj.x_min is not None
+        for cell in box_cells((obj.x_min, obj.y_min, obj.x_max, obj.y_max), size)
+    ]
+    DetectionCell.objects.bulk_create(cells, batch_size=1000)
+    return len(cells)
+
+
+def region_detections(label, region, min_overlap=0.0, model_name=None, user=None):
+    """
+    Объекты с меткой label, рамка которых находится внутри области не меньше чем на долю min_overlap.
+
+    :param label: Тип объекта.
+    :type label: str
+    :param region: Область (x1, y1, x2, y2) в долях кадра.
+    :type region: tuple
+    :param min_overlap: Минимальная доля площади рамки внутри области (0 - любое пересечение, 1 - целиком внутри).
+    :type min_overlap: float
+    :param model_name: Фильтр по модели.
+    :type model_name: str
+    :param user: Только объекты изображений этого пользователя.
+    :return: QuerySet объектов DetectedObject с аннотацией overlap (доля площади рамки внутри области).
+    :rtype: QuerySet
+    """
+    x1, y1, x2, y2 = region
+    candidates = (DetectionCell.objects.filter(object_type=label, cell__in=box_cells(region))
+                  .values('detected_object_id'))
+    detections = DetectedObject.objects.filter(pk__in=candidates)
+    if model_name is not None:
+        detections = detections.filter(model_name=model_name)
+    if user is not None:
+        detections = detections.filter(image_feed__user=user)
+
+    def bound(value):
+        return Value(value, output_field=FloatField())
+
+    width = Least(F('x_max'), bound(x2)) - Greatest(F('x_min'), bound(x1))
+    height = Least(F('y_max'), bound(y2)) - Greatest(F('y_min'), bound(y1))
+    area = NullIf((F('x_max') - F('x_min')) * (F('y_max') - F('y_min')), bound(0.0))
+    return (detections
+            .annotate(overlap_width=width, overlap_height=height)
+            .filter(overlap_width__gt=0, overlap_height__gt=0)
+            .annotate(overlap=F('overlap_width') * F('overlap_height') / area)
+            .filter(overlap__gte=min_overlap))
+
+
+def region_feeds(label, region, min_overlap=0.0, model_name=None, user=None):
+    """
+    Изображения, на которых есть объекты, найденные region_detections с теми же параметрами.
+
+    :rtype: QuerySet
+    """
+    detections = region_detections(label, region, min_overlap, model_name, user)
+    return ImageFeed.objects.filter(pk__in=detections.values('image_feed_id'))
+
+
+def rebuild_spatial_index(batch_size=1000):
+    """
+    Пересчитывает нормализованные рамки и ячейки индекса для всех объектов.
+
+    :param batch_size: Количество объектов, обрабатываемых за один проход.
+    :type batch_size: int
+    :return: Кортеж (количество объектов с рамкой, количество строк DetectionCell).
+    :rtype: tuple
+    """
+    sizes, indexed, cells = {}, 0, 0
+    detections = (DetectedObject.objects.select_related('image_feed').order_by('pk')
+                  .only('pk', 'object_type', 'location', 'image_feed__image', 'image_feed__working_image'))
+    with transaction.atomic():
+        DetectionCell.objects.all().delete()
+        batch = []
+        for obj in detections.iterator(chunk_size=batch_size):
+            obj.x_min = obj.y_min = obj.x_max = obj.y_max = None
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                indexed, cells = _rebuild_batch(batch, sizes, indexed, cells)
+                batch = []
+        if batch:
+            indexed, cells = _rebuild_batch(batch, sizes, indexed, cells)
+    return indexed, cells
+
+
+def _rebuild_batch(batch, sizes, indexed, cells):
+    normalize_boxes(batch, sizes)
+    DetectedObject.objects.bulk_update(batch, BOX_FIELDS)
+    return indexed + sum(obj.x_min is not None for obj in batch), cells + index_detections(batch)
@@ -0,0 +1,170 @@
+"""
+Инкрементальное ведение сводной статистики обнаружений (модель DetectionStat).
+
+Описание работы модуля:
+    1. save_detections(objects):
+        - Сохраняет DetectedObject одним bulk_create и прибавляет их к DetectionStat в той же транзакции;
+        в ней же записываются ячейки пространственного индекса объектов (см. spatial.py).
+    2. subtract_detection_stats(detections):
+        - Вычитает объекты из DetectionStat перед их удалением (удаление изображения, DetectedObjectQuerySet.delete(),
+        повторная обработка).
+    3. replace_detections(image_feed, model_name, objects):
+        - Заменяет результаты модели для изображения новыми в одной транзакции (повторная обработка).
+    4. rebuild_detection_stats():
+        - Пересчитывает DetectionStat с нуля по таблице DetectedObject (management-команда rebuild_detection_stats).
+    5. user_detection_stats(user, ...):
+        - Читает статистику пользователя только из DetectionStat, без обращения к DetectedObject.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DetectedObject, DetectionStat
+from .spatial import index_detections, normalize_boxes
+
+
+def _apply_deltas(deltas):
+    """
+    Прибавляет приращения к строкам DetectionStat, создавая отсутствующие строки.
+
+    :param deltas: Словарь {(user_id, object_type, model_name, day): [количество, сумма уверенностей]}.
+    :type deltas: dict
+    """
+    for (user_id, object_type, model_name, day), (count, confidence_sum) in deltas.items():
+        if not count:
+            continue
+        lookup = {'user_id': user_id, 'object_type': object_type, 'model_name': model_name, 'day': day}
+        updated = DetectionStat.objects.filter(**lookup).update(
+            count=F('count') + count, confidence_sum=F('confidence_sum') + confidence_sum)
+        if updated or count < 0:
+            continue
+        try:
+            with transaction.atomic():
+                DetectionStat.objects.create(count=count, confidence_sum=confidence_sum, **lookup)
+        except IntegrityError:
+            # Строку одновременно создал другой процесс: повторяем инкремент
+            DetectionStat.objects.filter(**lookup).update(
+                count=F('count') + count, confidence_sum=F('confidence_sum') + confidence_sum)
+
+
+def save_detections(objects):
+    """
+    Сохраняет обнаруженные объекты и обновляет сводную статистику в одной транзакции.
+
+    :param objects: Несохранённые объекты DetectedObject.
+    :type objects: list
+    :return: Сохранённые объекты.
+    :rtype: list
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for obj in objects:
+        key = (obj.image_feed.user_id, obj.object_type, obj.model_name, timezone.localdate(obj.created_at))
+        deltas[key][0] += 1
+        deltas[key][1] += obj.confidence
+    # Нормализованные рамки и ячейки пространственного индекса записываются вместе с объектами (см. spatial.py)
+    normalize_boxes(objects)
+    with transaction.atomic():
+        created = DetectedObject.objects.bulk_create(objects)
+        index_detections(created)
+        _apply_deltas(deltas)
+    return created
+
+
+def subtract_detection_stats(detections):
+    """
+    Вычитает объекты из сводной статистики. Вызывается в транзакции удаления объектов.
+
+    :param detections: QuerySet объектов DetectedObject, которые будут удалены.
+    :type detections: QuerySet
+    """
+    rows = (detections
+            .annotate(day=TruncDate('created_at'))
+            .values('image_feed__user_id', 'object_type', 'model_name', 'day')
+            .annotate(count=Count('id'), confidence_sum=Sum('confidence'))
+            .order_by())
+    deltas = {
+        (row['image_feed__user_id'], row['object_type'], row['model_name'], row['day']):
+            [-row['count'], -row['confidence_sum']]
+        for row in rows
+    }
+    _apply_deltas(deltas)
+    # Строки, в которых не осталось объектов, не нужны; проверяются только уменьшенные строки (по уникальному ключу)
+    for user_id, object_type, model_name, day in deltas:
+        DetectionStat.objects.filter(user_id=user_id, object_type=object_type, model_name=model_name, day=day,
+                                     count__lte=0).delete()
+
+
+def replace_detections(image_feed, model_name, objects):
+    """
+    Заменяет результаты модели для изображения новыми в одной транзакции.
+
+    Предыдущие объекты этой модели вычитаются из статистики и удаляются, новые сохраняются:
+    читатели видят либо старый, либо новый набор, но не их объединение. Результаты других моделей не меняются.
+
+    :param image_feed: Запись ImageFeed.
+    :param model_name: Модель (DetectedObject.MODEL_*), результаты которой заменяются.
+    :type model_name: str
+    :param objects: Несохранённые объекты DetectedObject новой обработки.
+    :type objects: list
+    :return: Сохранённые объекты.
+    :rtype: list
+    """
+    with transaction.atomic():
+        # DetectedObjectQuerySet.delete() вычитает удаляемые объекты из статистики
+        DetectedObject.objects.filter(image_feed=image_feed, model_name=model_name).delete()
+        return save_detections(objects)
+
+
+def rebuild_detection_stats():
+    """
+    Пересчитывает сводную статистику с нуля по таблице DetectedObject.
+
+    :return: Количество созданных строк DetectionStat.
+    :rtype: int
+    """
+    rows = (DetectedObject.objects
+            .annotate(day=TruncDate('created_at'))
+            .values('image_feed__user_id', 'object_type', 'model_name', 'day')
+            .annotate(count=Count('id'), confidence_sum=Sum('confidence'))
+            .order_by())
+    stats = [
+        DetectionStat(user_id=row['image_feed__user_id'], object_type=row['object_type'],
+                      model_name=row['model_name'], day=row['day'],
+                      count=row['count'], confidence_sum=row['confidence_sum'])
+        for row in rows.iterator()
+    ]
+    with transaction.atomic():
+        DetectionStat.objects.all().delete()
+        DetectionStat.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
+
+def user_detection_stats(user, object_type=None, model_name=None, date_from=None, date_to=None):
+    """
+    Возвращает статистику обнаружений пользователя по дням.
+
+    :param user: Пользователь.
+    :param object_type: Фильтр по типу объекта.
+    :type object_type: str
+    :param model_name: Фильтр по модели.
+    :type model_name: str
+    :param date_from: Начальная дата (включительно).
+    :type date_from: date
+    :param date_to: Конечная дата (включительно).
+    :type date_to: date
+    :return: QuerySet строк DetectionStat, отсортированных по дню (от новых к старым) и типу объекта.
+    :rtype: QuerySet
+    """
+    stats = DetectionStat.objects.filter(user=user)
+    if object_type:
+        stats = stats.filter(object_type=object_type)
+    if model_name is not None:
+        stats = stats.filter(model_name=model_name)
+    if date_from:
+        stats = stats.filter(day__gte=date_from)
+    if date_to:
+        stats = stats.filter(day__lte=date_to)
+    return stats.order_by('-day', 'object_type', 'model_name')
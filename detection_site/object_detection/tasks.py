@@ -6,28 +6,63 @@ import logging
 from celery import shared_task
 # Декоратор, который регистрирует функцию как задачу Celery. Это позволяет вызывать её асинхронно
 
-from .utils import process_image
-# Функция, которая выполняет обработку изображения. Она определена в модуле utils.
+from .media_cleanup import delete_media_files, sweep_orphaned_media
+# Функции фонового удаления медиафайлов. Определены в модуле media_cleanup.
+
+from .scheduling import dispatch_next, purge_finished_jobs
+# Выдача заданий обработки из справедливой очереди. Определены в модуле scheduling.
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def process_image_task(feed_id: int) -> None:
+def delete_media_files_task(names: list) -> int:
     """
-    Функциональность:
-        - Функция process_image_task объявляется как асинхронная задача с помощью декоратора @shared_task. Э
-        то означает, что её можно вызывать асинхронно через Celery.
-        - Внутри функции вызывается `process_image(feed_id)`, которая выполняет реальную работу по обработке
-        изображения, используя идентификатор записи в модели ImageFeed.
-    Когда задача `process_image_task` ставится в очередь на выполнение через Celery, она будет выполняться
-    фоновым воркером, что позволяет основному приложению продолжать работать без ожидания завершения задачи.
+    Удаляет файлы изображений удалённых записей ImageFeed в фоновом режиме.
 
     Args:
-        feed_id (int): Идентификатор записи в модели `ImageFeed`,
-        для которой необходимо выполнить обработку изображения.
-    """
-    try:
-        process_image(feed_id)
-        logger.info(f"Successfully processed image for feed_id: {feed_id}")
-    except Exception as e:
-        logger.error(f"Error processing image for feed_id: {feed_id}: {e}")
+        names (list): Имена файлов относительно MEDIA_ROOT.
+
+    Returns:
+        int: Количество удалённых файлов.
+    """
+    removed = delete_media_files(names)
+    logger.info(f"Deleted {removed} of {len(names)} media files")
+    return removed
+
+
+@shared_task
+def sweep_orphaned_media_task() -> int:
+    """
+    Периодическая задача (см. CELERY_BEAT_SCHEDULE), удаляющая файлы в MEDIA_ROOT,
+    на которые не ссылается ни одна запись ImageFeed.
+
+    Returns:
+        int: Количество удалённых файлов-сирот.
+    """
+    return len(sweep_orphaned_media())
+
+
+@shared_task
+def dispatch_inference_task() -> None:
+    """
+    Выполняет следующее задание обработки из очереди планировщика (см. scheduling.py).
+
+    Задача ставится в очередь Celery по одной на каждое принятое задание (для отложенных по лимиту скорости -
+    с задержкой), а выполняет задание с наименьшим виртуальным временем завершения, а не обязательно то,
+    для которого была поставлена. Периодический запуск (CELERY_BEAT_SCHEDULE) подбирает задания,
+    оставшиеся в очереди после сбоев брокера.
+    """
+    job = dispatch_next()
+    if job is not None:
+        logger.info(f"Inference job {job.pk} finished: {job.status}")
+
+
+@shared_task
+def purge_inference_jobs_task() -> int:
+    """
+    Периодическая задача (см. CELERY_BEAT_SCHEDULE), удаляющая старые завершённые задания обработки.
+
+    Returns:
+        int: Количество удалённых заданий.
+    """
+    return purge_finished_jobs()
@@ -1,3 +1,458 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .db import BatchedWriter
+from .evaluation import evaluate, precision_recall_at
+from .exports import (RawSelection, detections_for_export, fallback_detections_for_export, iter_export,
+                      raw_detections_for_export)
+from .media_serving import _parse_range
+from .models import DetectedObject, DetectionStat, ImageFeed, InferenceJob, RawDetections
+from .near_duplicates import NearDuplicateIndex, to_signed
+from .raw_detections import pack, select, unpack
+from .scheduling import PROCESSORS, _admit, _execute
+from .singleflight import KEY_PREFIX, SingleFlight
+from .spatial import box_cells, region_detections, region_feeds
+from .stats import replace_detections, save_detections
+
+
+def _detection(image_feed, object_type='cat', confidence=0.9, box=None, model_name=DetectedObject.MODEL_DETR):
+    """Несохранённый объект DetectedObject; box - нормализованная рамка (x1, y1, x2, y2) или None."""
+    obj = DetectedObject(image_feed=image_feed, object_type=object_type, confidence=confidence,
+                         location='10,20,30,40', model_name=model_name)
+    if box is not None:
+        obj.x_min, obj.y_min, obj.x_max, obj.y_max = box
+    return obj
+
+
+class BatchedWriterTests(TransactionTestCase):
+    """Параллельная запись через BatchedWriter: все строки записаны, ошибок блокировки нет."""
+
+    THREADS = 8
+    WRITES = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer')
+        self.feed = ImageFeed.objects.create(user=self.user, image='images/writer.jpg')
+
+    def test_concurrent_writes(self):
+        writer = BatchedWriter(max_batch=16)
+        errors = []
+
+        def work():
+            try:
+                for _ in range(self.WRITES):
+                    writer.run(lambda: save_detections([_detection(self.feed)]), timeout=30)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # В том числе нет OperationalError 'database is locked'
+        self.assertEqual(errors, [])
+        total = self.THREADS * self.WRITES
+        self.assertEqual(DetectedObject.objects.count(), total)
+        self.assertEqual(DetectionStat.objects.get(user=self.user).count, total)
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(_parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(_parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(_parse_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(_parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(_parse_range('bytes=-500', 100), (0, 99))
+
+    def test_unsupported_ranges_serve_whole_file(self):
+        self.assertIsNone(_parse_range('bytes=0-9,20-29', 100))
+        self.assertIsNone(_parse_range('items=0-9', 100))
+        self.assertIsNone(_parse_range('bytes=-', 100))
+        self.assertIsNone(_parse_range('bytes=9-0', 100))
+
+    def test_unsatisfiable_ranges(self):
+        with self.assertRaises(ValueError):
+            _parse_range('bytes=100-', 100)
+        with self.assertRaises(ValueError):
+            _parse_range('bytes=-0', 100)
+
+
+class ServeMediaRangeTests(SimpleTestCase):
+    """Запросы Range и If-Range к маршруту MEDIA_URL."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        with open(os.path.join(self.media_root, 'file.bin'), 'wb') as f:
+            f.write(bytes(range(100)))
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE_BACKEND=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_range(self):
+        response = self.client.get('/media/file.bin', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/media/file.bin', HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_if_range(self):
+        etag = self.client.head('/media/file.bin')['ETag']
+        response = self.client.get('/media/file.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        # Файл изменился с момента получения его начала: отдаётся целиком
+        response = self.client.get('/media/file.bin', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Однократное выполнение заданий с одинаковым ключом: в одном процессе и через аренду в кэше."""
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight(lease_timeout=30, poll_interval=0.01)
+
+    def run_concurrently(self, func):
+        """Два потока вызывают do с одним ключом; второй приходит, пока первый выполняет func."""
+        entered, release = threading.Event(), threading.Event()
+        outcomes = [None, None]
+
+        def blocking():
+            entered.set()
+            release.wait(5)
+            return func()
+
+        def call(index):
+            try:
+                outcomes[index] = self.flight.do(('feed', 1), blocking)
+            except Exception as e:
+                outcomes[index] = e
+
+        leader = threading.Thread(target=call, args=(0,))
+        leader.start()
+        entered.wait(5)
+        follower = threading.Thread(target=call, args=(1,))
+        follower.start()
+        # Второй поток успевает присоединиться к выполняющемуся заданию
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        return outcomes
+
+    def test_same_key_runs_once(self):
+        calls = []
+        outcomes = self.run_concurrently(lambda: calls.append(1) or 'result')
+        self.assertEqual(calls, [1])
+        self.assertEqual(outcomes, [('result', False), ('result', True)])
+
+    def test_leader_error_is_raised_in_follower(self):
+        error = ValueError('inference failed')
+
+        def fail():
+            raise error
+
+        self.assertEqual(self.run_concurrently(fail), [error, error])
+
+    def test_released_lease_without_result_is_taken_over(self):
+        key = hashlib.sha1(repr(('feed', 2)).encode()).hexdigest()
+        lease_key = f'{KEY_PREFIX}:lease:{key}'
+        # Аренду держит другой процесс, который завершится без результата
+        cache.add(lease_key, 'crashed', timeout=30)
+        outcome = []
+        waiter = threading.Thread(target=lambda: outcome.append(self.flight.do(('feed', 2), lambda: 'recomputed')))
+        waiter.start()
+        time.sleep(0.1)
+        self.assertEqual(outcome, [])
+        cache.delete(lease_key)
+        waiter.join(5)
+        self.assertEqual(outcome, [('recomputed', False)])
+        self.assertIsNone(cache.get(lease_key))
+
+
+class ExportTests(TestCase):
+    """Выгрузка CSV, JSONL и COCO из сохранённых объектов и из полного вывода моделей (RawSelection)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('export')
+        self.feed = ImageFeed.objects.create(user=self.user, image='images/a.jpg')
+        self.stored = save_detections([_detection(self.feed, 'cat', 0.9), _detection(self.feed, 'dog', 0.6)])
+        labels, data = pack([('person', 0.8, (1, 2, 11, 22)), ('person', 0.3, (5, 5, 9, 9)),
+                             ('cat', 0.1, (0, 0, 4, 4))])
+        self.raw_feed = ImageFeed.objects.create(user=self.user, image='images/b.jpg')
+        RawDetections.objects.create(image_feed=self.raw_feed, model_name=DetectedObject.MODEL_DETR,
+                                     labels=labels, data=data, count=3, min_score=0.1)
+
+    def export(self, fmt, detections):
+        return ''.join(iter_export(fmt, detections))
+
+    def raw_selection(self, threshold):
+        scope = (self.user, DetectedObject.MODEL_DETR)
+        return RawSelection(raw_detections_for_export(*scope), threshold,
+                            fallback=fallback_detections_for_export(*scope))
+
+    def test_stored_detections(self):
+        detections = detections_for_export(self.user)
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', detections))))
+        self.assertEqual([(row['id'], row['object_type'], row['x2']) for row in rows],
+                         [(str(self.stored[0].pk), 'cat', '30'), (str(self.stored[1].pk), 'dog', '30')])
+        lines = [json.loads(line) for line in self.export('jsonl', detections).splitlines()]
+        self.assertEqual([line['id'] for line in lines], [obj.pk for obj in self.stored])
+
+        coco = json.loads(self.export('coco', detections))
+        self.assertEqual(coco['categories'], [{'id': 1, 'name': 'cat'}, {'id': 2, 'name': 'dog'}])
+        self.assertEqual([image['id'] for image in coco['images']], [self.feed.pk])
+        self.assertEqual(coco['annotations'][0]['bbox'], [10, 20, 20, 20])
+        self.assertEqual([a['id'] for a in coco['annotations']], [obj.pk for obj in self.stored])
+
+    def test_raw_selection(self):
+        # Кандидаты RawDetections выше порога, затем сохранённые объекты изображения без RawDetections
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', self.raw_selection(0.2)))))
+        self.assertEqual([(row['id'], row['image_feed_id'], row['object_type'], row['confidence']) for row in rows],
+                         [('1', str(self.raw_feed.pk), 'person', '0.8'), ('2', str(self.raw_feed.pk), 'person', '0.3'),
+                          ('3', str(self.feed.pk), 'cat', '0.9'), ('4', str(self.feed.pk), 'dog', '0.6')])
+        lines = [json.loads(line) for line in self.export('jsonl', self.raw_selection(0.5)).splitlines()]
+        self.assertEqual([(line['id'], line['object_type']) for line in lines], [(1, 'person'), (2, 'cat'), (3, 'dog')])
+
+        coco = json.loads(self.export('coco', self.raw_selection(0.7)))
+        self.assertEqual([c['name'] for c in coco['categories']], ['cat', 'person'])
+        self.assertEqual({image['id'] for image in coco['images']}, {self.feed.pk, self.raw_feed.pk})
+        self.assertEqual([(a['id'], a['category_id']) for a in coco['annotations']], [(1, 2), (2, 1)])
+
+
+class EvaluationTests(SimpleTestCase):
+    """AP и точность/полнота на наборе, посчитанном вручную."""
+
+    SAMPLES = [
+        {'id': 'a', 'objects': [
+            {'label': 'cat', 'box': (0, 0, 10, 10), 'ignore': False},
+            {'label': 'cat', 'box': (20, 20, 30, 30), 'ignore': False},
+            {'label': 'cat', 'box': (40, 40, 50, 50), 'ignore': True},
+        ]},
+        {'id': 'b', 'objects': [{'label': 'cat', 'box': (0, 0, 10, 10), 'ignore': False}]},
+    ]
+    PREDICTIONS = {
+        'a': [
+            ('cat', 0.9, (0, 0, 10, 10)),
+            # Повторное обнаружение того же объекта - ложное срабатывание
+            ('cat', 0.8, (1, 1, 10, 10)),
+            # Совпадение с объектом difficult не учитывается
+            ('cat', 0.7, (40, 40, 50, 50)),
+            ('cat', 0.6, (20, 20, 30, 30)),
+            ('dog', 0.4, (0, 0, 10, 10)),
+        ],
+        'b': [('cat', 0.5, (100, 100, 110, 110))],
+    }
+
+    def test_average_precision(self):
+        results = evaluate(self.SAMPLES, self.PREDICTIONS)
+        cat = results['cat']
+        self.assertEqual(cat['positives'], 3)
+        self.assertEqual(cat['scores'].tolist(), [0.9, 0.8, 0.6, 0.5])
+        self.assertEqual(cat['tp'].tolist(), [True, False, True, False])
+        # Точность 1, 1/2, 2/3, 1/2 при полноте 1/3, 1/3, 2/3, 2/3: AP = 1/3 * 1 + 1/3 * 2/3
+        self.assertAlmostEqual(cat['ap'], 5 / 9)
+        # Класс без эталонных объектов
+        self.assertEqual(results['dog']['positives'], 0)
+        self.assertIsNone(results['dog']['ap'])
+
+    def test_precision_recall_at(self):
+        cat = evaluate(self.SAMPLES, self.PREDICTIONS)['cat']
+        precision, recall, detected = precision_recall_at(cat, 0.6)
+        self.assertEqual(detected, 3)
+        self.assertAlmostEqual(precision, 2 / 3)
+        self.assertAlmostEqual(recall, 2 / 3)
+        self.assertEqual(precision_recall_at(cat, 0.95), (None, 0.0, 0))
+
+
+class NearDuplicateIndexTests(TestCase):
+    def test_sync_picks_up_hashes_of_older_feeds(self):
+        user = User.objects.create_user('phash')
+        older = ImageFeed.objects.create(user=user, image='images/older.jpg')
+        newer = ImageFeed.objects.create(user=user, image='images/newer.jpg', phash=to_signed(0xFFFF),
+                                         phash_updated_at=timezone.now())
+        index = NearDuplicateIndex()
+        self.assertEqual(index.search(0xFFFF, 0), [(newer.pk, 0)])
+        # Хэш старого изображения записан другим процессом (ensure_phash) после синхронизации индекса
+        ImageFeed.objects.filter(pk=older.pk).update(phash=to_signed(0xFFFE), phash_updated_at=timezone.now())
+        self.assertEqual(index.search(0xFFFF, 1), [(newer.pk, 0), (older.pk, 1)])
+
+
+class RawDetectionsTests(SimpleTestCase):
+    CANDIDATES = [('cat', 0.4, (1, 2, 3, 4)), ('dog', 0.95, (5, 6, 7, 8)), ('cat', 0.7, (9, 10, 11, 12))]
+
+    def test_pack_unpack(self):
+        labels, data = pack(self.CANDIDATES)
+        self.assertEqual(labels, ['cat', 'dog'])
+        self.assertEqual(unpack(labels, data),
+                         [('dog', 0.95, (5, 6, 7, 8)), ('cat', 0.7, (9, 10, 11, 12)), ('cat', 0.4, (1, 2, 3, 4))])
+        self.assertEqual(unpack(*pack([])), [])
+
+    def test_select(self):
+        candidates = unpack(*pack(self.CANDIDATES))
+        self.assertEqual(select(candidates), candidates)
+        # Порог строгий: кандидат с уверенностью ровно 0.7 не выбирается
+        self.assertEqual([c[1] for c in select(candidates, threshold=0.7)], [0.95])
+        self.assertEqual([c[1] for c in select(candidates, threshold=0.3, labels={'cat'})], [0.7, 0.4])
+        self.assertEqual(select(candidates, labels={'bird'}), [])
+
+
+class ThresholdParamTests(TestCase):
+    def test_invalid_threshold(self):
+        user = User.objects.create_user('threshold')
+        feed = ImageFeed.objects.create(user=user, image='images/threshold.jpg')
+        self.client.force_login(user)
+        for value in ('nan', 'inf', '-0.1', '1.5', 'abc'):
+            self.assertEqual(self.client.get(f'/object_detection/feed/{feed.pk}/detections/',
+                                             {'threshold': value}).status_code, 400)
+            self.assertEqual(self.client.get('/object_detection/export/csv/', {'threshold': value}).status_code, 400)
+        response = self.client.get(f'/object_detection/feed/{feed.pk}/detections/', {'threshold': '0.5'})
+        self.assertEqual(response.json()['threshold'], 0.5)
+
+
+@override_settings(SCHEDULER_RATE=1.0, SCHEDULER_BURST=2, SCHEDULER_MAX_DEFER=1.5, SCHEDULER_MAX_WAIT=1000,
+                   SCHEDULER_MAX_QUEUE_DEPTH=100, SCHEDULER_MAX_USER_QUEUE_DEPTH=100, SCHEDULER_WORKERS=1)
+class AdmissionTests(TestCase):
+    """Лимит скорости (GCRA), справедливая очередь (WFQ) и контроль допуска в scheduling._admit."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.feed = ImageFeed.objects.create(user=self.alice, image='images/job.jpg')
+
+    def admit(self, user, cost=1.0, weight=1.0):
+        with mock.patch('object_detection.scheduling.time.time', return_value=1000.0):
+            return _admit(user, self.feed, InferenceJob.KIND_DETR, cost, weight)
+
+    def test_rate_limit(self):
+        # Два задания в пределах ёмкости корзины, третье откладывается на секунду, четвёртое отклоняется
+        first, second, third = (self.admit(self.alice)[0] for _ in range(3))
+        self.assertIsNone(first.not_before)
+        self.assertIsNone(second.not_before)
+        self.assertEqual(third.not_before.timestamp(), 1001.0)
+        job, retry_after = self.admit(self.alice)
+        self.assertEqual((job.status, job.error), (InferenceJob.STATUS_REJECTED, 'rate_limited'))
+        self.assertAlmostEqual(retry_after, 0.5)
+        # Лимит у каждого пользователя свой
+        self.assertEqual(self.admit(self.bob)[0].status, InferenceJob.STATUS_QUEUED)
+
+    @override_settings(SCHEDULER_RATE=1000.0, SCHEDULER_BURST=100)
+    def test_fair_queue(self):
+        alice_jobs = [self.admit(self.alice)[0] for _ in range(3)]
+        self.assertEqual([job.finish_tag for job in alice_jobs], [1.0, 2.0, 3.0])
+        # Задание другого пользователя не ждёт всю пачку: оно встаёт в начало очереди
+        bob_job, wait = self.admit(self.bob, weight=2.0)
+        self.assertEqual(bob_job.finish_tag, 0.5)
+        self.assertEqual(wait, 0.0)
+        job, wait = self.admit(self.bob)
+        self.assertEqual(job.finish_tag, 1.5)
+        # Раньше него выдаются первое задание alice и первое задание bob
+        self.assertEqual(wait, 2.0)
+
+    @override_settings(SCHEDULER_RATE=1000.0, SCHEDULER_BURST=100, SCHEDULER_MAX_USER_QUEUE_DEPTH=2)
+    def test_user_queue_depth(self):
+        self.admit(self.alice)
+        self.admit(self.alice)
+        job, _retry_after = self.admit(self.alice)
+        self.assertEqual((job.status, job.error), (InferenceJob.STATUS_REJECTED, 'user_queue_full'))
+        self.assertEqual(self.admit(self.bob)[0].status, InferenceJob.STATUS_QUEUED)
+
+    def test_job_of_deleted_feed_fails(self):
+        job, _wait = self.admit(self.alice)
+        InferenceJob.objects.filter(pk=job.pk).update(status=InferenceJob.STATUS_RUNNING, started_at=timezone.now())
+
+        def process(feed_id):
+            # Изображение удалено во время обработки
+            ImageFeed.objects.filter(pk=feed_id).delete()
+            return []
+
+        with mock.patch.dict(PROCESSORS, {InferenceJob.KIND_DETR: process}):
+            job = _execute(job.pk)
+        self.assertEqual((job.status, job.error), (InferenceJob.STATUS_FAILED, 'image feed not found'))
+
+
+class SpatialTests(TestCase):
+    def test_box_cells(self):
+        self.assertEqual(box_cells((0.0, 0.0, 0.1, 0.1), 8), [0])
+        self.assertEqual(box_cells((0.9, 0.9, 1.0, 1.0), 8), [63])
+        self.assertEqual(box_cells((0.0, 0.0, 0.3, 0.2), 4), [0, 1])
+        self.assertEqual(len(box_cells((0.0, 0.0, 1.0, 1.0), 8)), 64)
+
+    def test_region_detections(self):
+        user = User.objects.create_user('spatial')
+        feed = ImageFeed.objects.create(user=user, image='images/spatial.jpg')
+        left, _right, straddling = save_detections([
+            _detection(feed, 'person', box=(0.05, 0.1, 0.25, 0.9)),
+            _detection(feed, 'person', box=(0.7, 0.1, 0.9, 0.9)),
+            _detection(feed, 'person', box=(0.2, 0.1, 0.6, 0.9)),
+        ])
+        save_detections([_detection(feed, 'dog', box=(0.05, 0.1, 0.25, 0.9))])
+        left_third = (0.0, 0.0, 1 / 3, 1.0)
+
+        found = region_detections('person', left_third, 0.0, user=user)
+        self.assertEqual({obj.pk for obj in found}, {left.pk, straddling.pk})
+        found = region_detections('person', left_third, 0.5, user=user)
+        self.assertEqual([obj.pk for obj in found], [left.pk])
+        self.assertAlmostEqual(found[0].overlap, 1.0)
+        self.assertEqual(list(region_feeds('person', left_third, 0.5, user=user)), [feed])
+        self.assertFalse(region_detections('person', left_third, user=User.objects.create_user('other')).exists())
+
+
+class DetectionStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('stats')
+        self.feed = ImageFeed.objects.create(user=self.user, image='images/stats.jpg')
+
+    def stats(self):
+        return {(row.object_type, row.model_name): (row.count, round(row.confidence_sum, 6))
+                for row in DetectionStat.objects.filter(user=self.user)}
+
+    def test_increment_and_decrement(self):
+        created = save_detections([_detection(self.feed, 'cat', 0.9), _detection(self.feed, 'cat', 0.5),
+                                   _detection(self.feed, 'dog', 0.8)])
+        self.assertEqual(self.stats(), {('cat', 'detr_resnet50'): (2, 1.4), ('dog', 'detr_resnet50'): (1, 0.8)})
+        self.assertEqual(DetectionStat.objects.get(user=self.user, object_type='cat').day, timezone.localdate())
+
+        created[0].delete()
+        self.assertEqual(self.stats(), {('cat', 'detr_resnet50'): (1, 0.5), ('dog', 'detr_resnet50'): (1, 0.8)})
+        # Строки без объектов удаляются
+        DetectedObject.objects.filter(object_type='dog').delete()
+        self.assertEqual(self.stats(), {('cat', 'detr_resnet50'): (1, 0.5)})
+
+    def test_replace_and_feed_delete(self):
+        save_detections([_detection(self.feed, 'cat', 0.9),
+                         _detection(self.feed, 'cat', 0.6, model_name=DetectedObject.MODEL_MOBILENET_SSD)])
+        replace_detections(self.feed, DetectedObject.MODEL_DETR, [_detection(self.feed, 'bird', 0.7)])
+        self.assertEqual(self.stats(), {('bird', 'detr_resnet50'): (1, 0.7), ('cat', 'mobilenet_ssd'): (1, 0.6)})
+        self.feed.delete()
+        self.assertEqual(self.stats(), {})
+
+
+    def test_invalid_date_filter(self):
+        self.client.force_login(self.user)
+        for url in ('/object_detection/stats/', '/object_detection/stats/json/', '/object_detection/export/csv/'):
+            self.assertEqual(self.client.get(url, {'from': '2020-13-45'}).status_code, 400)
+        self.assertEqual(self.client.get('/object_detection/stats/json/', {'from': '2020-01-31'}).status_code, 200)
@@ -0,0 +1,161 @@
+"""
+Приём загружаемых изображений и подготовка рабочих копий для обработки.
+
+Описание работы модуля:
+    1. LimitedTemporaryFileUploadHandler:
+        - Обработчик загрузки Django, который пишет файл на диск блоками и прекращает приём файла,
+        как только его размер превышает IMAGE_UPLOAD_MAX_BYTES. Файл целиком в память не загружается.
+    2. validate_image_limits(uploaded_file):
+        - Проверяет размер файла и количество пикселей по заголовку изображения, до декодирования.
+    3. create_working_image(image_feed) / ensure_working_image(image_feed):
+        - Создаёт рядом с оригиналом нормализованную рабочую копию: применяется ориентация из EXIF,
+        изображение уменьшается до IMAGE_WORKING_MAX_DIMENSION по большей стороне и сохраняется в JPEG.
+        Функции обработки читают рабочую копию вместо оригинала полного разрешения.
+    4. stored_image_size(*names):
+        - Размеры сохранённого изображения по заголовку файла (выгрузка COCO, нормализация рамок объектов).
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.utils import timezone
+
+from .near_duplicates import compute_phash, near_duplicate_index, to_signed
+
+
+def _max_bytes():
+    """Максимальный размер загружаемого изображения в байтах."""
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 20 * 1024 * 1024)
+
+
+def _max_pixels():
+    """Максимальное количество пикселей загружаемого изображения."""
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 40_000_000)
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Обработчик загрузки, сохраняющий файлы во временный файл на диске с ограничением размера.
+
+    Если файл превышает IMAGE_UPLOAD_MAX_BYTES, его приём прекращается, а сообщение об ошибке
+    сохраняется в `request.upload_errors` для отображения в форме.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        """Отклоняет файл заранее, если клиент сообщил размер больше допустимого."""
+        self.received = 0
+        if content_length is not None and content_length > _max_bytes():
+            self._reject(file_name)
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        """Записывает очередной блок на диск и прекращает приём при превышении лимита."""
+        self.received += len(raw_data)
+        if self.received > _max_bytes():
+            if getattr(self, 'file', None) is not None:
+                self.file.close()
+            self._reject(self.file_name)
+        return super().receive_data_chunk(raw_data, start)
+
+    def _reject(self, file_name):
+        """Запоминает ошибку для формы и пропускает файл."""
+        errors = getattr(self.request, 'upload_errors', [])
+        errors.append(f'Файл {file_name} больше допустимых {_max_bytes() // (1024 * 1024)} МБ.')
+        self.request.upload_errors = errors
+        raise SkipFile()
+
+
+def validate_image_limits(uploaded_file):
+    """
+    Проверяет размер файла и количество пикселей изображения без его декодирования.
+
+    Размеры изображения читаются из заголовка файла (Pillow открывает изображение лениво).
+
+    :param uploaded_file: Загруженный файл, прошедший проверку ImageField.
+    :raises ValidationError: Если превышен лимит размера файла или количества пикселей.
+    """
+    from PIL import Image
+
+    if uploaded_file.size > _max_bytes():
+        raise ValidationError(f'Файл больше допустимых {_max_bytes() // (1024 * 1024)} МБ.')
+    image = getattr(uploaded_file, 'image', None)
+    if image is None:
+        uploaded_file.seek(0)
+        image = Image.open(uploaded_file)
+    width, height = image.size
+    if width * height > _max_pixels():
+        raise ValidationError(f'Изображение {width}x{height} больше допустимых {_max_pixels()} пикселей.')
+    uploaded_file.seek(0)
+
+
+def create_working_image(image_feed):
+    """
+    Создаёт нормализованную рабочую копию изображения и сохраняет её в поле `working_image`,
+    а её перцептивный хэш - в поле `phash`.
+
+    :param image_feed: Запись ImageFeed с загруженным изображением.
+    :type image_feed: ImageFeed
+    :return: Путь к рабочей копии.
+    :rtype: str
+    """
+    from PIL import Image, ImageOps
+
+    max_dimension = getattr(settings, 'IMAGE_WORKING_MAX_DIMENSION', 1333)
+    with Image.open(image_feed.image.path) as image:
+        # Для JPEG декодирование сразу в уменьшенном масштабе (draft) значительно дешевле полного
+        image.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=getattr(settings, 'IMAGE_WORKING_JPEG_QUALITY', 90))
+        # Перцептивный хэш вычисляется по уже декодированному изображению, без повторного чтения файла
+        phash = compute_phash(image)
+
+    stem = os.path.splitext(os.path.basename(image_feed.image.name))[0]
+    image_feed.working_image.save(f'{stem}_working.jpg', ContentFile(buffer.getvalue()), save=False)
+    image_feed.phash, image_feed.phash_updated_at = to_signed(phash), timezone.now()
+    type(image_feed).objects.filter(pk=image_feed.pk).update(
+        working_image=image_feed.working_image.name, phash=image_feed.phash,
+        phash_updated_at=image_feed.phash_updated_at)
+    near_duplicate_index.add(image_feed.pk, phash)
+    return image_feed.working_image.path
+
+
+def ensure_working_image(image_feed):
+    """
+    Возвращает путь к рабочей копии изображения, создавая её при необходимости
+    (например, для изображений, загруженных до появления рабочих копий).
+
+    :param image_feed: Запись ImageFeed.
+    :type image_feed: ImageFeed
+    :return: Путь к рабочей копии.
+    :rtype: str
+    """
+    if image_feed.working_image and os.path.exists(image_feed.working_image.path):
+        return image_feed.working_image.path
+    return create_working_image(image_feed)
+
+
+def stored_image_size(*names):
+    """
+    Размеры первого доступного изображения из перечисленных файлов по заголовку, без декодирования.
+
+    :param names: Имена файлов относительно MEDIA_ROOT (например, рабочая копия и оригинал); пустые пропускаются.
+    :return: Кортеж (ширина, высота) или (0, 0), если ни один файл недоступен.
+    :rtype: tuple
+    """
+    from PIL import Image
+
+    for name in names:
+        if not name:
+            continue
+        try:
+            with Image.open(os.path.join(settings.MEDIA_ROOT, str(name))) as opened:
+                return opened.size
+        except OSError:
+            continue
+    return 0, 0
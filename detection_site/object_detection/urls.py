@@ -11,23 +11,32 @@
     - Вход пользователя
     - Выход пользователя
     - Панель управления пользователя
+    - Статистика кэша панели управления
+    - Метрики очереди заданий обработки
+    - Статистика обнаружений (страница и JSON)
+    - Выгрузка обнаруженных объектов (CSV, JSONL, COCO)
+    - Обнаружения изображения при произвольном пороге (JSON и изображение)
+    - Поиск объектов по области кадра
+    - Профили запросов и задач
     - Обработка потока изображений
     - Загрузка потока изображений
     - Удаление изображения
+    - Массовое удаление изображений
     - Альтернативная обработка потока изображений
+    - Обработка потока изображений обеими моделями одновременно
     - Маршруты для сброса пароля
 
-Статические медиафайлы также обслуживаются в режиме разработки.
+Медиафайлы отдаются маршрутом MEDIA_URL проекта (см. detection_site/urls.py и media_serving.py).
 """
 
 from django.urls import path
 from .views import (
-    home, register, user_login, user_logout, dashboard, process_image_feed,
-    upload_image, delete_image, UserForgotPasswordView, UserPasswordResetConfirmView,
-    password_reset_done, password_reset_complete, process_alter_image_feed, about
+    home, register, user_login, user_logout, dashboard, process_image_feed, process_multi_model_image_feed,
+    upload_image, delete_image, bulk_delete_images, UserForgotPasswordView, UserPasswordResetConfirmView,
+    password_reset_done, password_reset_complete, process_alter_image_feed, about, dashboard_cache_stats,
+    scheduler_stats, detection_stats, detection_stats_json, export_detections, feed_detections, render_detections,
+    region_search, profiles, profile_detail
 )
-from django.conf import settings
-from django.conf.urls.static import static
 from typing import List
 
 app_name = 'object_detection'
@@ -46,20 +55,41 @@ urlpatterns: List[path] = [
     path('logout/', user_logout, name='logout'),
     # Панель управления пользователя
     path('dashboard/', dashboard, name='dashboard'),
+    # Статистика кэша панели управления (только для персонала)
+    path('dashboard/cache-stats/', dashboard_cache_stats, name='dashboard_cache_stats'),
+    # Метрики очереди заданий обработки по пользователям (только для персонала)
+    path('scheduler/stats/', scheduler_stats, name='scheduler_stats'),
+    # Статистика обнаружений пользователя
+    path('stats/', detection_stats, name='detection_stats'),
+    path('stats/json/', detection_stats_json, name='detection_stats_json'),
+    # Потоковая выгрузка обнаруженных объектов пользователя (csv, jsonl, coco)
+    path('export/<str:fmt>/', export_detections, name='export_detections'),
+    # Обнаружения изображения при произвольном пороге и наборе классов (без повторной обработки)
+    path('feed/<int:feed_id>/detections/', feed_detections, name='feed_detections'),
+    path('feed/<int:feed_id>/render/', render_detections, name='render_detections'),
+    # Поиск объектов по области кадра (пространственный индекс)
+    path('regions/', region_search, name='region_search'),
+    # Профили медленных и выбранных запросов и задач (только для персонала)
+    path('profiles/', profiles, name='profiles'),
+    path('profiles/<str:name>/', profile_detail, name='profile_detail'),
     # Обработка потока изображений
     path('process/<int:feed_id>/', process_image_feed, name='process_feed'),
     # Загрузка потока изображений
     path('add-image-feed/', upload_image, name='add_image_feed'),
     # Удаление изображения
     path('image/delete/<int:image_id>/', delete_image, name='delete_image'),
+    # Массовое удаление изображений
+    path('image/bulk-delete/', bulk_delete_images, name='bulk_delete_images'),
     # Альтернативная обработка потока изображений
     path('process-alternative/<int:feed_id>/', process_alter_image_feed, name='process_alternative'),
+    # Обработка потока изображений обеими моделями одновременно
+    path('process-multi/<int:feed_id>/', process_multi_model_image_feed, name='process_multi_model'),
     # Маршруты для сброса пароля
     path('password-reset/', UserForgotPasswordView.as_view(), name='password_reset'),
     path('password-reset/done/', password_reset_done, name='password_reset_done'),
     path('reset/<uidb64>/<token>/', UserPasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('reset/done/', password_reset_complete, name='password_reset_complete'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
 
 
 # Описание модуля `urls.py`:
@@ -68,8 +98,6 @@ urlpatterns: List[path] = [
 # 1. Импорт модулей:
 #     - `path` из `django.urls`: Используется для определения маршрутов URL.
 #     - Импорт представлений из `views`: Все представления, которые будут связаны с маршрутами
-#     - `settings` из `django.conf`: Используется для получения настроек проекта
-#     - `static` из `django.conf.urls.static`: Используется для обслуживания медиафайлов в режиме разработки
 #
 # 2. Определение `app_name = 'object_detection'`: Устанавливает пространство имен для этого набора маршрутов,
 # что позволяет ссылаться на URL этого приложения из других частей проекта.
@@ -80,4 +108,4 @@ urlpatterns: List[path] = [
 #     - Каждый path определяет URL и связывает его с представлением;
 #     - Используются как обычные представления (например, home, about, register),
 #     так и классовые представления (например, UserForgotPasswordView).
-# 5. Добавление маршрутов для медиафайлов: в режиме разработки добавляются маршруты для обслуживания медиафайлов.
+# 5. Медиафайлы: маршрут MEDIA_URL определён в URLconf проекта (detection_site/urls.py), а не здесь.
@@ -3,6 +3,9 @@
     1. Импорт необходимых модулей:
         - `cv2`: Библиотека OpenCV для компьютерного зрения.
         - `numpy`: Библиотека для работы с массивами.
+        - `torch`, `transformers`, `PIL`: Библиотеки для модели DETR.
+        Библиотеки машинного обучения импортируются внутри функций обработки при первом вызове, чтобы
+        запуск Django (manage.py, миграции, загрузка URLconf, веб-воркеры) не загружал их без необходимости.
         - `ContentFile`: Класс Django для работы с файлами.
         - `ImageFeed`, `DetectedObject`: Модели Django для работы с изображениями и обнаруженными объектами.
     2. VOC_LABELS:
@@ -12,32 +15,72 @@
     4. Получение записи ImageFeed:
         - Поиск записи ImageFeed по идентификатору image_feed_id. Если запись не найдена, возвращается False.
     5. Загрузка модели и конфигурации:
-        - Загрузка модели MobileNet SSD из файлов Caffe (`.caffemodel` и `.prototxt`).
+        - Загрузка модели MobileNet SSD из файлов Caffe (`.caffemodel` и `.prototxt`) из локального хранилища моделей
+        (см. model_store.py). Загруженные модели кэшируются в процессе.
     6. Чтение изображения:
-        - Чтение изображения с диска по пути, указанному в image_feed.
-    7. Преобразование изображения в формат blob:
+        - Чтение с диска рабочей копии изображения (см. uploads.py): ориентация из EXIF применена,
+        размер ограничен IMAGE_WORKING_MAX_DIMENSION.
+    7. Повторное использование результатов:
+        - Если почти одинаковое изображение (по перцептивному хэшу, см. near_duplicates.py) уже обработано
+        этой моделью, его результаты пересчитываются к размеру изображения, и модель не запускается.
+    8. Преобразование изображения в формат blob:
         - Преобразование изображения в blob для подачи в модель.
-    8. Выполнение прямого прохода через сеть:
+    9. Выполнение прямого прохода через сеть:
         - Установка входных данных для сети и выполнение прямого прохода (inference).
-    9. Обработка каждого обнаруженного объекта:
-        - Для каждого обнаруженного объекта проверяется уверенность (confidence). Если уверенность выше порога (0.6), объект считается обнаруженным;
+    10. Обработка каждого обнаруженного объекта:
+        - Все кандидаты модели сохраняются в RawDetections (см. raw_detections.py): представления и выгрузка
+        выбирают обнаружения при любом пороге без повторного запуска модели;
+        - Для каждого обнаруженного объекта проверяется уверенность (confidence). Если уверенность выше порога
+        (SSD_CONFIDENCE_THRESHOLD = 0.6 для MobileNet SSD, DETR_CONFIDENCE_THRESHOLD = 0.9 для DETR), объект считается обнаруженным;
+        - Инференс выполняют функции detect_mobilenet_ssd и detect_detr, которые используются и при оценке
+        моделей на размеченном наборе данных (management-команда evaluate_models, см. evaluation.py);
         - Получение координат ограничивающего прямоугольника (bounding box);
         - Рисование прямоугольника и метки на изображении;
-        - Создание записи DetectedObject в базе данных.
-    10. Сохранение обработанного изображения:
-        - Кодирование обработанного изображения обратно в формат jpg;
-        - Сохранение обработанного изображения в поле processed_image модели ImageFeed.
+        - Подготовка записи DetectedObject.
+    11. Сохранение результатов (save_results):
+        - Кодирование обработанного изображения обратно в формат jpg и сохранение файла под именем с хэшем
+        содержимого (см. media_serving.py);
+        - Замена предыдущих результатов этой модели в одной транзакции через общий писатель detection_writer
+        (см. db.py): объекты DetectedObject и сводная статистика DetectionStat (см. stats.replace_detections),
+        поле processed_image и версия ImageFeed, по которой кэш панели управления пересчитывает только это изображение.
+        Повторная обработка не добавляет второй набор объектов, а заменяет первый.
+    12. Память:
+        - Инференс выполняется без сохранения активаций для градиентов, тензоры и массивы удаляются сразу после
+        использования, размер входа DETR ограничен в режиме INFERENCE_MEMORY_BUDGET;
+        - Декоратор track_memory записывает пиковый RSS каждой обработки (см. memory.py).
+    13. Однократное выполнение:
+        - Одновременные вызовы обработки одного изображения одной моделью с одинаковыми параметрами выполняются
+        один раз: повторные вызовы ждут результат уже выполняющейся обработки (см. singleflight.py).
+    14. Совместная обработка двумя моделями (process_image_multi_model):
+        - Изображение декодируется один раз, MobileNet SSD и DETR выполняются параллельно в пуле потоков,
+        результаты обеих моделей сохраняются в одной транзакции (save_model_results), а обработанное изображение
+        содержит рамки обеих моделей.
 
 Этот код позволяет загружать изображение, обрабатывать его с использованием модели MobileNet SSD, обнаруживать объекты на изображении и сохранять результаты в базе данных.
 """
-import cv2
-import numpy as np
+import logging
 import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.core.files.base import ContentFile
-from .models import ImageFeed, DetectedObject
-from transformers import DetrImageProcessor, DetrForObjectDetection
-import torch
-from PIL import Image
+from django.db import transaction
+from django.utils import timezone
+from .models import ImageFeed, DetectedObject, RawDetections
+from .db import detection_writer
+from .caching import bump_feed_version
+from .stats import replace_detections
+from .model_store import get_mobilenet_ssd, get_detr
+from .uploads import ensure_working_image
+from .near_duplicates import find_reusable_detections
+from .memory import max_input_size, track_memory
+from .media_serving import content_hashed_name
+from .media_cleanup import schedule_media_deletion
+from .singleflight import single_flight
+from .raw_detections import pack, raw_min_score, select
+
+logger = logging.getLogger(__name__)
 
 # Список меток классов для объектов, распознаваемых моделью (VOC dataset).
 # Эти метки соответствуют классам из набора данных PASCAL VOC
@@ -48,7 +91,185 @@ VOC_LABELS = [
     "sheep", "sofa", "train", "tvmonitor"
 ]
 
+# Пороги уверенности, с которыми результаты сохраняются (выбор порогов: management-команда evaluate_models)
+SSD_CONFIDENCE_THRESHOLD = 0.6
+DETR_CONFIDENCE_THRESHOLD = 0.9
 
+
+def model_threshold(model_name):
+    """
+    Рабочий порог уверенности модели: объекты выше него сохраняются в DetectedObject и рисуются на изображении.
+
+    :param model_name: Модель (DetectedObject.MODEL_*).
+    :type model_name: str
+    :rtype: float
+    """
+    if model_name == DetectedObject.MODEL_DETR:
+        return DETR_CONFIDENCE_THRESHOLD
+    return SSD_CONFIDENCE_THRESHOLD
+
+
+def draw_detections(img, candidates, color=(0, 255, 0)):
+    """
+    Рисует рамки и метки обнаружений на изображении.
+
+    :param img: Изображение в формате BGR (массив OpenCV), изменяется на месте.
+    :type img: numpy.ndarray
+    :param candidates: Список (метка, уверенность, (x1, y1, x2, y2)).
+    :type candidates: list
+    :param color: Цвет рамок (B, G, R).
+    :type color: tuple
+    """
+    import cv2
+
+    for class_label, confidence, (startX, startY, endX, endY) in candidates:
+        cv2.rectangle(img, (startX, startY), (endX, endY), color, 2)
+        label = f"{class_label}: {confidence:.2f}"
+        cv2.putText(img, label, (startX+5, startY + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+
+def detect_mobilenet_ssd(img, threshold=SSD_CONFIDENCE_THRESHOLD):
+    """
+    Обнаруживает объекты на изображении моделью MobileNet SSD.
+
+    :param img: Изображение в формате BGR (массив OpenCV).
+    :type img: numpy.ndarray
+    :param threshold: Минимальная уверенность обнаружения.
+    :type threshold: float
+    :return: Список (метка, уверенность, (x1, y1, x2, y2)) в пикселях изображения.
+    :rtype: list
+    """
+    import cv2
+    import numpy as np
+
+    h, w = img.shape[:2]
+    # Загрузка модели из локального хранилища моделей (файлы Caffe, проверенные по контрольным суммам)
+    net = get_mobilenet_ssd()
+    # Преобразование изображения в формат blob для подачи в модель
+    blob = cv2.dnn.blobFromImage(img, 0.007843, (300, 300), 127.5)
+
+    # Установка входных данных для сети и выполнение прямого прохода (inference)
+    net.setInput(blob)
+    detections = net.forward()
+
+    candidates = []
+    for i in range(detections.shape[2]):
+        confidence = detections[0, 0, i, 2] # Уверенность распознавания
+        if confidence > threshold:    # Игнорирование слабых распознаваний
+            class_id = int(detections[0, 0, i, 1])  # Идентификатор класса
+            # Координаты ограничивающего прямоугольника (bounding box)
+            box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+            candidates.append((VOC_LABELS[class_id], float(confidence), tuple(box.astype("int"))))
+    return candidates
+
+
+def detect_detr(image, threshold=DETR_CONFIDENCE_THRESHOLD):
+    """
+    Обнаруживает объекты на изображении моделью DETR.
+
+    :param image: Изображение RGB.
+    :type image: PIL.Image.Image
+    :param threshold: Минимальная уверенность обнаружения.
+    :type threshold: float
+    :return: Список (метка, уверенность, [x1, y1, x2, y2]) в пикселях изображения.
+    :rtype: list
+    """
+    import torch
+
+    # Загрузка модели Detr из локального хранилища моделей (без обращения к сети, веса отображаются в память)
+    processor, model = get_detr()
+
+    # В режиме ограниченной памяти размер входа модели ограничен (по умолчанию процессор DETR
+    # увеличивает изображение до 800 по меньшей стороне и 1333 по большей)
+    max_size = max_input_size(DetectedObject.MODEL_DETR)
+    resize = {'size': {'shortest_edge': min(800, max_size), 'longest_edge': max_size}} if max_size else {}
+
+    # Обработка изображения без сохранения промежуточных активаций для вычисления градиентов
+    with torch.inference_mode():
+        inputs = processor(images=image, return_tensors="pt", **resize)
+        outputs = model(**inputs)
+
+        # Преобразование результатов в формат COCO API (координаты - в пикселях исходного изображения)
+        target_sizes = torch.tensor([image.size[::-1]])
+        results = processor.post_process_object_detection(outputs, target_sizes=target_sizes,
+                                                          threshold=threshold)[0]
+    return [
+        (model.config.id2label[label.item()], round(score.item(), 3), [round(i) for i in box.tolist()])
+        for score, label, box in zip(results["scores"], results["labels"], results["boxes"])
+    ]
+
+
+def save_results(image_feed, model_name, detected_objects, processed_image, raw_candidates=None, min_score=None):
+    """
+    Заменяет результаты модели для изображения результатами новой обработки.
+
+    Файл обработанного изображения сохраняется под новым именем с хэшем содержимого, затем в одной транзакции
+    (через общий писатель detection_writer) заменяются объекты модели (см. stats.replace_detections),
+    ссылка на обработанное изображение, полный вывод модели (RawDetections) и версия изображения.
+    Предыдущий файл обработанного изображения удаляется после фиксации транзакции.
+
+    :param image_feed: Запись ImageFeed.
+    :param model_name: Модель (DetectedObject.MODEL_*).
+    :type model_name: str
+    :param detected_objects: Несохранённые объекты DetectedObject.
+    :type detected_objects: list
+    :param processed_image: Обработанное изображение в формате JPEG или None, если его не удалось закодировать.
+    :type processed_image: bytes
+    :param raw_candidates: Все кандидаты модели (метка, уверенность, рамка), включая ниже рабочего порога.
+    :type raw_candidates: list
+    :param min_score: Уверенность, ниже которой кандидаты в raw_candidates не попали.
+    :type min_score: float
+    """
+    save_model_results(image_feed, [(model_name, detected_objects, raw_candidates, min_score)], processed_image)
+
+
+def save_model_results(image_feed, results, processed_image):
+    """
+    Заменяет результаты нескольких моделей для изображения в одной транзакции (см. save_results).
+
+    :param image_feed: Запись ImageFeed.
+    :param results: Список (модель, несохранённые объекты DetectedObject, все кандидаты модели или None,
+        минимальная уверенность кандидатов).
+    :type results: list
+    :param processed_image: Обработанное изображение в формате JPEG или None, если его не удалось закодировать.
+    :type processed_image: bytes
+    """
+    previous_image = image_feed.processed_image.name
+    if processed_image is not None:
+        # Имя с хэшем содержимого: файл никогда не перезаписывается и кэшируется браузером без проверки
+        name = content_hashed_name(image_feed.image.name, processed_image, '.jpg')
+        image_feed.processed_image.save(name, ContentFile(processed_image), save=False)
+
+    raw = {}
+    for model_name, _detected_objects, raw_candidates, min_score in results:
+        if raw_candidates is not None:
+            labels, data = pack(raw_candidates)
+            raw[model_name] = {'labels': labels, 'data': data, 'count': len(raw_candidates),
+                               'min_score': min_score, 'created_at': timezone.now()}
+
+    def swap():
+        with transaction.atomic():
+            for model_name, detected_objects, _raw_candidates, _min_score in results:
+                replace_detections(image_feed, model_name, detected_objects)
+                if model_name in raw:
+                    RawDetections.objects.update_or_create(image_feed=image_feed, model_name=model_name,
+                                                           defaults=raw[model_name])
+            ImageFeed.objects.filter(pk=image_feed.pk).update(processed_image=image_feed.processed_image.name)
+            # Новая версия результатов: кэш панели управления для этого изображения устаревает
+            bump_feed_version(image_feed)
+            if previous_image and previous_image != image_feed.processed_image.name:
+                schedule_media_deletion([previous_image])
+
+    detection_writer.run(swap)
+
+
+def _flight_key(model_name, threshold):
+    """Ключ single-flight обработки: изображение, модель и параметры, от которых зависит результат."""
+    return lambda image_feed_id: ('process', image_feed_id, model_name, threshold, max_input_size(model_name))
+
+
+@single_flight(_flight_key(DetectedObject.MODEL_MOBILENET_SSD, SSD_CONFIDENCE_THRESHOLD))
+@track_memory
 def process_image(image_feed_id):
     """
     Функция для обработки изображения и обнаружения объектов с использованием модели MobileNet SSD.
@@ -60,16 +281,14 @@ def process_image(image_feed_id):
 
     :raises ImageFeed.DoesNotExist: Если запись ImageFeed с указанным идентификатором не найдена.
     """
+    # Библиотеки компьютерного зрения загружаются только при обработке изображения
+    import cv2
+
     try:
         # Получение записи ImageFeed по идентификатору
         image_feed = ImageFeed.objects.get(id=image_feed_id)
-        image_path = image_feed.image.path
-
-        # Пути к файлам модели и конфигурации
-        model_path = 'object_detection/mobilenet_iter_73000.caffemodel'
-        config_path = 'object_detection/mobilenet_ssd_deploy.prototxt'
-        # Загрузка модели из файлов Caffe
-        net = cv2.dnn.readNetFromCaffe(config_path, model_path)
+        # Обработка выполняется по нормализованной рабочей копии, а не по оригиналу полного разрешения
+        image_path = ensure_working_image(image_feed)
 
         # Чтение изображения с диска
         img = cv2.imread(image_path)
@@ -79,42 +298,39 @@ def process_image(image_feed_id):
 
         # Получение высоты и ширины изображения
         h, w = img.shape[:2]
-        # Преобразование изображения в формат blob для подачи в модель
-        blob = cv2.dnn.blobFromImage(img, 0.007843, (300, 300), 127.5)
 
-        # Установка входных данных для сети и выполнение прямого прохода (inference)
-        net.setInput(blob)
-        detections = net.forward()
+        # Результаты почти одинакового изображения, уже обработанного этой моделью, используются повторно
+        reused = find_reusable_detections(image_feed, DetectedObject.MODEL_MOBILENET_SSD, (w, h))
+        if reused is None:
+            # Сохраняются все кандидаты сети, а не только выше рабочего порога (см. raw_detections.py).
+            # Вход и выход сети освобождаются при выходе из detect_mobilenet_ssd, до рисования и сохранения
+            min_score = raw_min_score()
+            raw_candidates = detect_mobilenet_ssd(img, threshold=min_score)
+        else:
+            raw_candidates, min_score = reused
+        # Игнорирование слабых распознаваний
+        candidates = select(raw_candidates, SSD_CONFIDENCE_THRESHOLD)
+
+        # Рисование прямоугольников и меток на изображении
+        draw_detections(img, candidates)
 
         # Обработка каждого обнаруженного объекта
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2] # Уверенность распознавания
-            if confidence > 0.6:    # Игнорирование слабых распознаваний
-                class_id = int(detections[0, 0, i, 1])  # Идентификатор класса
-                class_label = VOC_LABELS[class_id]  # Метка класса
-                # Координаты ограничивающего прямоугольника (bounding box)
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-
-                # Рисование прямоугольника и метки на изображении
-                cv2.rectangle(img, (startX, startY), (endX, endY), (0, 255, 0), 2)
-                label = f"{class_label}: {confidence:.2f}"
-                cv2.putText(img, label, (startX+5, startY + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-                # Создание записи DetectedObject в базе данных
-                DetectedObject.objects.create(
-                    image_feed=image_feed,
-                    object_type=class_label,
-                    location=f"{startX},{startY},{endX},{endY}",
-                    confidence=float(confidence)
-                )
+        detected_objects = []
+        for class_label, confidence, (startX, startY, endX, endY) in candidates:
+            # Подготовка записи DetectedObject для базы данных
+            detected_objects.append(DetectedObject(
+                image_feed=image_feed,
+                object_type=class_label,
+                location=f"{startX},{startY},{endX},{endY}",
+                confidence=confidence,
+                model_name=DetectedObject.MODEL_MOBILENET_SSD
+            ))
 
         # Кодирование обработанного изображения обратно в формат jpg
         result, encoded_img = cv2.imencode('.jpg', img)
-        if result:
-            # Сохранение обработанного изображения в поле processed_image
-            content = ContentFile(encoded_img.tobytes(), f'processed_{image_feed.image.name}')
-            image_feed.processed_image.save(content.name, content, save=True)
+        # Замена предыдущих результатов этой модели: объекты, обработанное изображение и версия - в одной транзакции
+        save_results(image_feed, DetectedObject.MODEL_MOBILENET_SSD, detected_objects,
+                     encoded_img.tobytes() if result else None, raw_candidates, min_score)
 
         return True
 
@@ -122,6 +338,8 @@ def process_image(image_feed_id):
         print("ImageFeed not found.")
         return False
 
+@single_flight(_flight_key(DetectedObject.MODEL_DETR, DETR_CONFIDENCE_THRESHOLD))
+@track_memory
 def process_alternative_image(image_feed_id):
     """
     Функция для обработки изображения с использованием модели DETR.
@@ -133,25 +351,15 @@ def process_alternative_image(image_feed_id):
 
     :raises ImageFeed.DoesNotExist: Если запись ImageFeed с указанным идентификатором не найдена.
     """
+    # Библиотеки машинного обучения загружаются только при обработке изображения
+    import cv2
+    from PIL import Image
+
     try:
         # Получение записи ImageFeed по идентификатору
         image_feed = ImageFeed.objects.get(id=image_feed_id)
-        image_path = image_feed.image.path
-
-        # Загрузка изображения
-        image = Image.open(image_path).convert("RGB")
-
-        # Загрузка модели Detr
-        processor = DetrImageProcessor.from_pretrained("facebook/detr-resnet-50", revision="no_timm")
-        model = DetrForObjectDetection.from_pretrained("facebook/detr-resnet-50", revision="no_timm")
-
-        # Обработка изображения
-        inputs = processor(images=image, return_tensors="pt")
-        outputs = model(**inputs)
-
-        # Преобразование результатов в формат COCO API
-        target_sizes = torch.tensor([image.size[::-1]])
-        results = processor.post_process_object_detection(outputs, target_sizes=target_sizes, threshold=0.9)[0]
+        # Обработка выполняется по нормализованной рабочей копии, а не по оригиналу полного разрешения
+        image_path = ensure_working_image(image_feed)
 
         # Загрузка изображения с помощью OpenCV
         img = cv2.imread(image_path)
@@ -162,14 +370,28 @@ def process_alternative_image(image_feed_id):
         # Получение высоты и ширины изображения
         h, w = img.shape[:2]
 
+        # Результаты почти одинакового изображения, уже обработанного этой моделью, используются повторно
+        reused = find_reusable_detections(image_feed, DetectedObject.MODEL_DETR, (w, h))
+        if reused is None:
+            # Загрузка изображения
+            image = Image.open(image_path).convert("RGB")
+            # Сохраняются все кандидаты модели, а не только выше рабочего порога (см. raw_detections.py).
+            # Тензоры освобождаются при выходе из detect_detr, до рисования и сохранения
+            min_score = raw_min_score()
+            raw_candidates = detect_detr(image, threshold=min_score)
+            del image
+        else:
+            raw_candidates, min_score = reused
+        candidates = select(raw_candidates, DETR_CONFIDENCE_THRESHOLD)
+
         # Обработка результатов
         detections = []
-        for score, label, box in zip(results["scores"], results["labels"], results["boxes"]):
-            box = [round(i) for i in box.tolist()]
+        detected_objects = []
+        for object_type, score, box in candidates:
             detection_info = {
-                'label': model.config.id2label[label.item()],
-                'score': round(score.item(), 3),
-                'box': box,
+                'label': object_type,
+                'score': score,
+                'box': list(box),
             }
             detections.append(detection_info)
 
@@ -183,20 +405,20 @@ def process_alternative_image(image_feed_id):
             print(detection_info, detection_info['label'], label_text)
             cv2.putText(img, label_text, (startX + 5, startY + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
 
-            # Создание записи DetectedObject в базе данных
-            DetectedObject.objects.create(
+            # Подготовка записи DetectedObject для базы данных
+            detected_objects.append(DetectedObject(
                 image_feed=image_feed,
                 object_type=detection_info['label'],
                 location=f"{startX},{startY},{endX},{endY}",
-                confidence=detection_info['score']
-            )
+                confidence=detection_info['score'],
+                model_name=DetectedObject.MODEL_DETR
+            ))
 
         # Кодирование обработанного изображения обратно в формат jpg
         result, encoded_img = cv2.imencode('.jpg', img)
-        if result:
-            # Сохранение обработанного изображения в поле processed_image
-            content = ContentFile(encoded_img.tobytes(), f'processed_{image_feed.image.name}')
-            image_feed.processed_image.save(content.name, content, save=True)
+        # Замена предыдущих результатов этой модели: объекты, обработанное изображение и версия - в одной транзакции
+        save_results(image_feed, DetectedObject.MODEL_DETR, detected_objects,
+                     encoded_img.tobytes() if result else None, raw_candidates, min_score)
 
         return detections
 
@@ -204,6 +426,118 @@ def process_alternative_image(image_feed_id):
         print("ImageFeed not found.")
         return []
 
+# Модели совместной обработки: порог, цвет рамок на общем изображении и короткое имя в подписи
+MULTI_MODELS = [
+    (DetectedObject.MODEL_MOBILENET_SSD, SSD_CONFIDENCE_THRESHOLD, (0, 255, 0), 'SSD'),
+    (DetectedObject.MODEL_DETR, DETR_CONFIDENCE_THRESHOLD, (255, 128, 0), 'DETR'),
+]
+
+_inference_executor = None
+_inference_executor_lock = threading.Lock()
+
+
+def _get_inference_executor():
+    """Пул потоков совместной обработки (создаётся в процессе при первом вызове, в том числе после fork)."""
+    global _inference_executor
+    with _inference_executor_lock:
+        if _inference_executor is None:
+            workers = getattr(settings, 'MULTI_MODEL_WORKERS', None) or len(MULTI_MODELS)
+            _inference_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        return _inference_executor
+
+
+def _run_model(model_name, img, rgb_image):
+    """
+    Запускает модель на уже декодированном изображении.
+
+    :return: Кортеж (все кандидаты модели, минимальная уверенность, длительность инференса в секундах).
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    min_score = raw_min_score()
+    if model_name == DetectedObject.MODEL_DETR:
+        candidates = detect_detr(rgb_image, threshold=min_score)
+    else:
+        candidates = detect_mobilenet_ssd(img, threshold=min_score)
+    return candidates, min_score, time.perf_counter() - start
+
+
+@single_flight(lambda image_feed_id: ('process', image_feed_id, 'multi', tuple(
+    (model_name, threshold, max_input_size(model_name)) for model_name, threshold, _color, _short in MULTI_MODELS)))
+@track_memory
+def process_image_multi_model(image_feed_id):
+    """
+    Функция для обработки изображения моделями MobileNet SSD и DETR одновременно.
+
+    Изображение декодируется один раз, модели выполняются параллельно в пуле потоков (OpenCV DNN и PyTorch
+    освобождают GIL во время инференса), поэтому время обработки близко ко времени более медленной модели,
+    а не к их сумме. Результаты обеих моделей сохраняются в одной транзакции, обработанное изображение
+    содержит рамки обеих моделей (цвета и подписи - MULTI_MODELS).
+
+    :param image_feed_id: Идентификатор записи ImageFeed, содержащей изображение для обработки.
+    :type image_feed_id: int
+    :return: Количество обнаруженных объектов по моделям или None, если изображение не удалось обработать.
+    :rtype: dict
+    """
+    # Библиотеки машинного обучения загружаются только при обработке изображения
+    import cv2
+    from PIL import Image
+
+    try:
+        image_feed = ImageFeed.objects.get(id=image_feed_id)
+    except ImageFeed.DoesNotExist:
+        logger.warning(f"ImageFeed {image_feed_id} not found")
+        return None
+    # Обработка выполняется по нормализованной рабочей копии, а не по оригиналу полного разрешения
+    image_path = ensure_working_image(image_feed)
+
+    # Единственное декодирование изображения: массив BGR для MobileNet SSD и его RGB-представление для DETR
+    img = cv2.imread(image_path)
+    if img is None:
+        logger.error(f"Failed to load image {image_path} of feed {image_feed_id}")
+        return None
+    h, w = img.shape[:2]
+    rgb_image = None
+
+    start = time.perf_counter()
+    outputs, futures = {}, {}
+    for model_name, _threshold, _color, _short in MULTI_MODELS:
+        # Результаты почти одинакового изображения, уже обработанного моделью, используются повторно
+        reused = find_reusable_detections(image_feed, model_name, (w, h))
+        if reused is not None:
+            outputs[model_name] = reused
+            continue
+        if model_name == DetectedObject.MODEL_DETR and rgb_image is None:
+            rgb_image = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        futures[model_name] = _get_inference_executor().submit(_run_model, model_name, img, rgb_image)
+    for model_name, future in futures.items():
+        raw_candidates, min_score, seconds = future.result()
+        outputs[model_name] = (raw_candidates, min_score)
+        logger.info(f"process_image_multi_model({image_feed_id}): {model_name} {seconds:.2f}s")
+    logger.info(f"process_image_multi_model({image_feed_id}): {len(futures)} models in "
+                f"{time.perf_counter() - start:.2f}s")
+    del rgb_image
+
+    # Общее обработанное изображение с рамками обеих моделей и результаты для сохранения
+    results, counts = [], {}
+    for model_name, threshold, color, short in MULTI_MODELS:
+        raw_candidates, min_score = outputs[model_name]
+        candidates = select(raw_candidates, threshold)
+        draw_detections(img, [(f"{short} {label}", score, box) for label, score, box in candidates], color)
+        detected_objects = [
+            DetectedObject(image_feed=image_feed, object_type=label, location=','.join(str(v) for v in box),
+                           confidence=score, model_name=model_name)
+            for label, score, box in candidates
+        ]
+        results.append((model_name, detected_objects, raw_candidates, min_score))
+        counts[model_name] = len(detected_objects)
+
+    result, encoded_img = cv2.imencode('.jpg', img)
+    # Замена результатов обеих моделей, обработанного изображения и версии - в одной транзакции
+    save_model_results(image_feed, results, encoded_img.tobytes() if result else None)
+    return counts
+
+
 def generate_random_color():
     """
     Генерирует случайный цвет.
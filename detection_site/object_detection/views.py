@@ -4,16 +4,38 @@ from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_POST
+from django.utils.safestring import mark_safe
+from django.utils.dateparse import parse_date
 from django.contrib.auth.views import PasswordResetView, PasswordResetConfirmView, PasswordResetDoneView, PasswordResetCompleteView
 from django.contrib.messages.views import SuccessMessageMixin
 from django.urls import reverse_lazy
-from .models import ImageFeed, DetectedObject
-from .utils import process_image, process_alternative_image
+from .models import ImageFeed, DetectedObject, InferenceJob
+from .utils import draw_detections, model_threshold
+from .scheduling import AdmissionRejected, scheduler_metrics, submit
 from .forms import ImageFeedForm, UserForgotPasswordForm, UserSetNewPasswordForm
-from .tasks import process_image_task
-
-from django.http import HttpResponseBadRequest
-
+from .caching import render_feed_cards, cache_stats
+from .stats import user_detection_stats
+from .uploads import create_working_image, ensure_working_image
+from .profiling import list_profiles, profiling_enabled, read_profile
+from .exports import (EXPORT_FORMATS, RawSelection, detections_for_export, fallback_detections_for_export, iter_export,
+                      raw_detections_for_export)
+from .raw_detections import load_candidates
+from .spatial import parse_region, region_detections, region_feeds
+
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+import math
+
+# Сообщения пользователю о заданиях, не принятых планировщиком (см. scheduling.AdmissionRejected)
+ADMISSION_MESSAGES = {
+    'queue_full': 'Очередь обработки переполнена.',
+    'user_queue_full': 'Слишком много ваших изображений ожидают обработки.',
+    'rate_limited': 'Слишком частые запросы на обработку.',
+    'overloaded': 'Сервер обработки перегружен.',
+}
+# Максимальное количество результатов поиска по области кадра
+REGION_SEARCH_LIMIT = 1000
 
 def home(request):
     """Отображает главную страницу"""
@@ -115,18 +137,53 @@ def dashboard(request):
     :rtype: HttpResponse
     """
     # image_feeds = ImageFeed.objects.filter(user=request.user)
-    image_feeds = ImageFeed.objects.all()
-    context = {'image_feeds': image_feeds}
+    image_feeds = list(ImageFeed.objects.all())
+    # Тела карточек берутся из кэша, пересчитываются только изображения с новой версией результатов
+    cards = render_feed_cards(image_feeds)
+    feed_cards = [(feed, mark_safe(cards[feed.pk])) for feed in image_feeds]
+    context = {'image_feeds': image_feeds, 'feed_cards': feed_cards}
     return render(request, 'object_detection/dashboard.html', context)
 
 
+def _submit_processing(request, image_feed, kind, success_message, error_message):
+    """
+    Отправляет задание обработки планировщику (см. scheduling.py) и сообщает пользователю результат.
+
+    Если брокер Celery недоступен, задание выполняется сразу и сообщение содержит результат обработки,
+    иначе - оценку ожидания в очереди.
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :param image_feed: Обрабатываемое изображение.
+    :param kind: Вид обработки (InferenceJob.KIND_*).
+    :type kind: str
+    :param success_message: Сообщение об успешной обработке.
+    :type success_message: str
+    :param error_message: Сообщение об ошибке обработки.
+    :type error_message: str
+    """
+    try:
+        job, wait = submit(request.user, image_feed, kind)
+    except AdmissionRejected as e:
+        retry = f' Повторите через {math.ceil(e.retry_after)} с.' if e.retry_after else ''
+        messages.error(request, f'{ADMISSION_MESSAGES.get(e.reason, "Задание не принято.")}{retry}')
+        return
+    if job.status == InferenceJob.STATUS_DONE:
+        messages.success(request, success_message)
+    elif job.status == InferenceJob.STATUS_FAILED:
+        messages.error(request, error_message)
+    else:
+        messages.success(request, f'Изображение отправлено на обработку (ожидание около {math.ceil(wait)} с). '
+                                  f'Пожалуйста, подождите.')
+
+
 @login_required
 def process_image_feed(request, feed_id):
     """
     Функция выполняет следующие действия:
     - проверяет, что пользователь авторизован (с помощью декоратора @login_required);
     - получает объект `ImageFeed` с указанным `feed_id` для текущего пользователя;
-    - вызывает функцию `process_image` для обработки изображения.
+    - отправляет планировщику (см. `scheduling.py`) задание обработки изображения функцией `process_image`;
     - перенаправляет пользователя обратно на страницу `dashboard`
     Функция `process_image` определяется в `utils.py` и выполняет основную работу по обработке изображения.
 
@@ -145,9 +202,8 @@ def process_image_feed(request, feed_id):
     :rtype: HttpResponse
     """
     image_feed = get_object_or_404(ImageFeed, id=feed_id, user=request.user)
-    process_image(feed_id)
-    # process_image_task.delay(feed_id)
-    messages.success(request, 'Изображение отправлено на обработку. Пожалуйста, подождите.')
+    _submit_processing(request, image_feed, InferenceJob.KIND_SSD, 'Изображение успешно обработано.',
+                       'Ошибка обработки изображения.')
     return redirect('object_detection:dashboard')
 
 
@@ -164,10 +220,27 @@ def process_alter_image_feed(request, feed_id):
     :rtype: HttpResponse
     """
     image_feed = get_object_or_404(ImageFeed, id=feed_id, user=request.user)
-    if process_alternative_image(feed_id):
-        messages.success(request, 'Изображение успешно обработано альтернативной моделью.')
-    else:
-        messages.error(request, 'Ошибка обработки изображения альтернативной моделью.')
+    _submit_processing(request, image_feed, InferenceJob.KIND_DETR,
+                       'Изображение успешно обработано альтернативной моделью.',
+                       'Ошибка обработки изображения альтернативной моделью.')
+    return redirect('object_detection:dashboard')
+
+
+@login_required
+def process_multi_model_image_feed(request, feed_id):
+    """
+    Обрабатывает изображение обеими моделями одновременно (см. utils.process_image_multi_model).
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :param feed_id: Идентификатор записи ImageFeed, содержащей изображение для обработки.
+    :type feed_id: int
+    :return: HTTP ответ с перенаправлением на панель управления.
+    :rtype: HttpResponse
+    """
+    image_feed = get_object_or_404(ImageFeed, id=feed_id, user=request.user)
+    _submit_processing(request, image_feed, InferenceJob.KIND_MULTI, 'Изображение обработано обеими моделями.',
+                       'Ошибка обработки изображения.')
     return redirect('object_detection:dashboard')
 
 
@@ -183,33 +256,24 @@ def upload_image(request): # бывшая add_image_feed()
     """
     if request.method == 'POST':
         form = ImageFeedForm(request.POST, request.FILES)
+        # Ошибки обработчика загрузки (файл больше допустимого размера) показываются в форме
+        for error in getattr(request, 'upload_errors', []):
+            form.add_error('image', error)
         if form.is_valid():
             image_feed = form.save(commit=False)
             image_feed.user = request.user
             image_feed.save()
+            # Нормализованная рабочая копия для функций обработки
+            create_working_image(image_feed)
 
             if 'process_image' in request.POST:
-                # if 'process_image' in request.POST:
-                #     process_image(image_feed.id)
-                #     messages.success(request, 'Изображение успешно обработано.')
-                if process_image(image_feed.id):
-                    messages.success(request, 'Изображение успешно обработано.')
-                else:
-                    messages.error(request, 'Ошибка обработки изображения.')
+                _submit_processing(request, image_feed, InferenceJob.KIND_SSD, 'Изображение успешно обработано.',
+                                   'Ошибка обработки изображения.')
             elif 'process_alternative_image' in request.POST:
-                detections = process_alternative_image(image_feed.id)
-                if detections:
-                    # Сохранение результатов в базу данных (если нужно)
-                    for detection in detections:
-                        DetectedObject.objects.create(
-                            image_feed=image_feed,
-                            object_type=detection['label'],
-                            location=f"{detection['box'][0]},{detection['box'][1]},{detection['box'][2]},{detection['box'][3]}",
-                            confidence=float(detection['score'])
-                        )
-                    messages.success(request, 'Изображение успешно обработано альтернативной моделью.')
-                else:
-                    messages.error(request, 'Ошибка обработки изображения альтернативной моделью.')
+                # Результаты сохраняет сама функция обработки (см. utils.save_results)
+                _submit_processing(request, image_feed, InferenceJob.KIND_DETR,
+                                   'Изображение успешно обработано альтернативной моделью.',
+                                   'Ошибка обработки изображения альтернативной моделью.')
 
             return redirect('object_detection:dashboard')
     else:
@@ -237,6 +301,365 @@ def delete_image(request, image_id):
     return redirect('object_detection:dashboard')
 
 
+@login_required
+@require_POST
+def bulk_delete_images(request):
+    """
+    Удаляет несколько изображений пользователя за один запрос.
+
+    Записи удаляются пакетами через `ImageFeedQuerySet.delete()`, файлы изображений удаляются фоновой задачей.
+
+    :param request: HTTP запрос со списком идентификаторов изображений в параметре `image_ids`.
+    :type request: HttpRequest
+    :return: HTTP ответ с перенаправлением на панель управления.
+    :rtype: HttpResponse
+    """
+    image_ids = [value for value in request.POST.getlist('image_ids') if value.isdigit()]
+    if not image_ids:
+        messages.error(request, 'Не выбрано ни одного изображения.')
+        return redirect('object_detection:dashboard')
+
+    # Удаляются только изображения текущего пользователя
+    _deleted, per_model = ImageFeed.objects.filter(id__in=image_ids, user=request.user).delete()
+    count = per_model.get(ImageFeed._meta.label, 0)
+    messages.success(request, f'Удалено изображений: {count}.')
+    return redirect('object_detection:dashboard')
+
+
+@staff_member_required
+def scheduler_stats(request):
+    """
+    Возвращает метрики очереди заданий обработки по пользователям в формате JSON (см. scheduling.scheduler_metrics).
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :return: JSON с длиной очереди, ожиданием и количеством отклонённых заданий по пользователям.
+    :rtype: JsonResponse
+    """
+    return JsonResponse(scheduler_metrics())
+
+
+@staff_member_required
+def dashboard_cache_stats(request):
+    """
+    Возвращает счётчики попаданий и промахов кэша панели управления в формате JSON.
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :return: JSON со статистикой кэша по видам записей.
+    :rtype: JsonResponse
+    """
+    return JsonResponse(cache_stats())
+
+
+def _stats_filters(request):
+    """
+    Извлекает фильтры статистики обнаружений из параметров GET-запроса.
+
+    :raises ValueError: Если дата from или to в формате ГГГГ-ММ-ДД не существует (например, 2020-13-45).
+    """
+    model_name = request.GET.get('model')
+    return {
+        'object_type': request.GET.get('label') or None,
+        'model_name': model_name if model_name in dict(DetectedObject.MODEL_CHOICES) else None,
+        'date_from': parse_date(request.GET.get('from') or ''),
+        'date_to': parse_date(request.GET.get('to') or ''),
+    }
+
+
+@login_required
+def detection_stats(request):
+    """
+    Отображает статистику обнаружений текущего пользователя по дням, типам объектов и моделям.
+
+    Данные читаются из сводной таблицы DetectionStat, поэтому время ответа не зависит от количества
+    обнаруженных объектов. Поддерживаются фильтры label, model, from и to в параметрах запроса.
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :return: HTTP ответ со страницей статистики.
+    :rtype: HttpResponse
+    """
+    try:
+        filters = _stats_filters(request)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
+    context = {
+        'stats': user_detection_stats(request.user, **filters),
+        'filters': filters,
+        'model_choices': DetectedObject.MODEL_CHOICES,
+        'export_formats': list(EXPORT_FORMATS),
+    }
+    return render(request, 'object_detection/detection_stats.html', context)
+
+
+@login_required
+def detection_stats_json(request):
+    """
+    Возвращает статистику обнаружений текущего пользователя в формате JSON.
+
+    :param request: HTTP запрос с необязательными параметрами label, model, from и to.
+    :type request: HttpRequest
+    :return: JSON со списком строк статистики.
+    :rtype: JsonResponse
+    """
+    try:
+        filters = _stats_filters(request)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
+    stats = user_detection_stats(request.user, **filters)
+    data = [
+        {
+            'day': stat.day.isoformat(),
+            'label': stat.object_type,
+            'model': stat.model_name,
+            'count': stat.count,
+            'confidence_sum': stat.confidence_sum,
+            'average_confidence': stat.average_confidence,
+        }
+        for stat in stats
+    ]
+    return JsonResponse({'stats': data})
+
+
+@login_required
+def export_detections(request, fmt):
+    """
+    Выгружает все обнаруженные объекты текущего пользователя в формате CSV, JSONL или COCO.
+
+    Ответ формируется потоково (StreamingHttpResponse), а строки читаются из базы данных блоками,
+    поэтому потребление памяти не зависит от объёма выгрузки. Поддерживаются те же фильтры label, model,
+    from и to, что и у статистики обнаружений, а также threshold (порог уверенности) и labels (классы через
+    запятую): с ними обнаружения выбираются из полного вывода моделей (RawDetections) без повторной обработки.
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :param fmt: Формат выгрузки: 'csv', 'jsonl' или 'coco'.
+    :type fmt: str
+    :return: Потоковый HTTP ответ с файлом выгрузки.
+    :rtype: StreamingHttpResponse
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise Http404('Unknown export format')
+    try:
+        filters = _stats_filters(request)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
+    if request.GET.get('threshold') or request.GET.get('labels'):
+        # Произвольный порог или набор классов: обнаружения выбираются из полного вывода моделей
+        try:
+            threshold = _threshold_value(request.GET['threshold']) if request.GET.get('threshold') else None
+        except ValueError:
+            return HttpResponseBadRequest('Invalid threshold')
+        labels = _labels_param(request)
+        if filters['object_type']:
+            labels.add(filters['object_type'])
+        scope = (request.user, filters['model_name'], filters['date_from'], filters['date_to'])
+        detections = RawSelection(raw_detections_for_export(*scope), threshold, labels,
+                                  fallback=fallback_detections_for_export(*scope))
+    else:
+        detections = detections_for_export(request.user, **filters)
+    response = StreamingHttpResponse(iter_export(fmt, detections), content_type=EXPORT_FORMATS[fmt])
+    extension = 'json' if fmt == 'coco' else fmt
+    response['Content-Disposition'] = f'attachment; filename="detections_{request.user.username}.{extension}"'
+    return response
+
+
+def _labels_param(request):
+    """Набор классов из параметра labels (через запятую)."""
+    return {label.strip() for label in request.GET.get('labels', '').split(',') if label.strip()}
+
+
+def _threshold_value(value):
+    """
+    Разбирает порог уверенности из параметра запроса.
+
+    :raises ValueError: Если порог не число от 0 до 1 (float() принимает и 'nan', и 'inf').
+    """
+    threshold = float(value)
+    if not (math.isfinite(threshold) and 0.0 <= threshold <= 1.0):
+        raise ValueError(f'Invalid threshold: {value}')
+    return threshold
+
+
+def _threshold_params(request):
+    """
+    Извлекает модель, порог уверенности и набор классов из параметров GET-запроса.
+
+    :return: Кортеж (модель, порог, набор классов) или None, если параметры неверны.
+    :rtype: tuple
+    """
+    model_name = request.GET.get('model') or DetectedObject.MODEL_MOBILENET_SSD
+    if model_name not in dict(DetectedObject.MODEL_CHOICES):
+        return None
+    try:
+        threshold = (_threshold_value(request.GET['threshold']) if request.GET.get('threshold')
+                     else model_threshold(model_name))
+    except ValueError:
+        return None
+    return model_name, threshold, _labels_param(request)
+
+
+@login_required
+def feed_detections(request, feed_id):
+    """
+    Возвращает обнаружения изображения при заданном пороге уверенности и наборе классов в формате JSON.
+
+    Обнаружения выбираются из полного вывода модели (RawDetections) без повторного запуска модели.
+
+    :param request: HTTP запрос с необязательными параметрами model, threshold (по умолчанию - рабочий порог
+        модели) и labels (классы через запятую).
+    :type request: HttpRequest
+    :param feed_id: Идентификатор записи ImageFeed.
+    :type feed_id: int
+    :return: JSON со списком обнаружений; complete - False, если порог ниже уверенности сохранённых кандидатов.
+    :rtype: JsonResponse
+    """
+    image_feed = get_object_or_404(ImageFeed, id=feed_id, user=request.user)
+    params = _threshold_params(request)
+    if params is None:
+        return HttpResponseBadRequest('Invalid model or threshold')
+    model_name, threshold, labels = params
+    candidates, min_score = load_candidates(image_feed, model_name, threshold, labels)
+    return JsonResponse({
+        'feed': image_feed.pk,
+        'model': model_name,
+        'threshold': threshold,
+        'labels': sorted(labels),
+        'complete': min_score is not None and threshold >= min_score,
+        'detections': [{'label': label, 'score': score, 'box': list(box)} for label, score, box in candidates],
+    })
+
+
+@login_required
+def render_detections(request, feed_id):
+    """
+    Возвращает рабочую копию изображения с обнаружениями при заданном пороге уверенности и наборе классов.
+
+    Рамки рисуются по полному выводу модели (RawDetections), модель повторно не запускается.
+
+    :param request: HTTP запрос с теми же параметрами, что и у feed_detections.
+    :type request: HttpRequest
+    :param feed_id: Идентификатор записи ImageFeed.
+    :type feed_id: int
+    :return: HTTP ответ с изображением JPEG.
+    :rtype: HttpResponse
+    """
+    import cv2
+
+    image_feed = get_object_or_404(ImageFeed, id=feed_id, user=request.user)
+    params = _threshold_params(request)
+    if params is None:
+        return HttpResponseBadRequest('Invalid model or threshold')
+    model_name, threshold, labels = params
+    candidates, _min_score = load_candidates(image_feed, model_name, threshold, labels)
+    img = cv2.imread(ensure_working_image(image_feed))
+    if img is None:
+        raise Http404('Image not found')
+    draw_detections(img, candidates)
+    result, encoded_img = cv2.imencode('.jpg', img)
+    if not result:
+        raise Http404('Image not found')
+    return HttpResponse(encoded_img.tobytes(), content_type='image/jpeg')
+
+
+@login_required
+def region_search(request):
+    """
+    Ищет объекты пользователя с заданной меткой в области кадра по пространственному индексу (см. spatial.py).
+
+    Пример: `?label=person&region=0,0,0.333,1&overlap=0.5&group=feeds` - изображения, на которых не меньше
+    половины рамки человека находится в левой трети кадра.
+
+    :param request: HTTP запрос с параметрами label, region (x1,y1,x2,y2 в долях кадра, по умолчанию весь кадр),
+        overlap (доля площади рамки внутри области, по умолчанию 0 - любое пересечение), model, group
+        (`feeds` - изображения вместо объектов) и limit.
+    :type request: HttpRequest
+    :return: JSON со списком объектов (рамки в долях кадра) или изображений.
+    :rtype: JsonResponse
+    """
+    label = request.GET.get('label', '').strip()
+    model_name = request.GET.get('model') or None
+    if not label or (model_name is not None and model_name not in dict(DetectedObject.MODEL_CHOICES)):
+        return HttpResponseBadRequest('Missing label or unknown model')
+    try:
+        region = parse_region(request.GET.get('region') or '0,0,1,1')
+        overlap = float(request.GET.get('overlap') or 0.0)
+        limit = min(int(request.GET.get('limit') or REGION_SEARCH_LIMIT), REGION_SEARCH_LIMIT)
+        # float() принимает 'nan' и 'inf', а отрицательный срез QuerySet недопустим
+        if not (math.isfinite(overlap) and 0.0 <= overlap <= 1.0) or limit < 1:
+            raise ValueError('Invalid overlap or limit')
+    except ValueError:
+        return HttpResponseBadRequest('Invalid region, overlap or limit')
+
+    result = {'label': label, 'region': list(region), 'overlap': overlap, 'model': model_name}
+    if request.GET.get('group') == 'feeds':
+        feeds = region_feeds(label, region, overlap, model_name, request.user).order_by('-pk')[:limit]
+        result['feeds'] = [
+            {'id': feed.pk, 'image': feed.image.url,
+             'processed_image': feed.processed_image.url if feed.processed_image else None}
+            for feed in feeds
+        ]
+    else:
+        detections = (region_detections(label, region, overlap, model_name, request.user)
+                      .order_by('-pk')[:limit])
+        result['detections'] = [
+            {'id': obj.pk, 'feed': obj.image_feed_id, 'model': obj.model_name, 'score': obj.confidence,
+             'box': [obj.x_min, obj.y_min, obj.x_max, obj.y_max], 'overlap': round(obj.overlap, 4)}
+            for obj in detections
+        ]
+    return JsonResponse(result)
+
+
+@staff_member_required
+def profiles(request):
+    """
+    Отображает сохранённые профили запросов и задач, отсортированные по длительности или количеству SQL-запросов.
+
+    :param request: HTTP запрос с необязательными параметрами kind ('request' или 'task') и order
+        ('seconds', 'queries' или 'started').
+    :type request: HttpRequest
+    :return: HTTP ответ со списком профилей.
+    :rtype: HttpResponse
+    """
+    kind = request.GET.get('kind') or None
+    order = request.GET.get('order', 'seconds')
+    if kind not in (None, 'request', 'task') or order not in ('seconds', 'queries', 'started'):
+        return HttpResponseBadRequest('Invalid filter')
+    context = {
+        'profiles': list_profiles(kind=kind, order_by=order),
+        'kind': kind,
+        'order': order,
+        'profiling_enabled': profiling_enabled(),
+    }
+    return render(request, 'object_detection/profiles.html', context)
+
+
+@staff_member_required
+def profile_detail(request, name):
+    """
+    Отображает один профиль: самые затратные функции и стеки.
+
+    :param request: HTTP запрос.
+    :type request: HttpRequest
+    :param name: Имя файла профиля.
+    :type name: str
+    :return: HTTP ответ с профилем.
+    :rtype: HttpResponse
+    """
+    profile = read_profile(name)
+    if profile is None:
+        raise Http404('Profile not found')
+    samples = profile['samples'] or 1
+    context = {
+        'profile': profile,
+        'functions': [(function, own, inclusive, 100 * inclusive / samples)
+                      for function, own, inclusive in profile['functions'][:50]],
+        'stacks': [(stack.split(';'), count, 100 * count / samples) for stack, count in profile['stacks'][:20]],
+    }
+    return render(request, 'object_detection/profile_detail.html', context)
+
+
 def about(request):
     """
     Отображает страницу с информацией о сайте.